@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 import os
 from streamlit_option_menu import option_menu
-from common.cache import get_data, prepare_player_data, get_metrics_list
+from common.cache import get_dataset, get_database, get_render_service, prepare_player_data, get_metrics_list, relative_group_columns, get_group_stats
 import base64
 
 # Configuración de la página con 'translate=no' para evitar traducción automática
@@ -196,11 +196,16 @@ else:
     
     # Carga de datos
     with st.spinner("Cargando datos..."):
-        # Cargar y preparar datos
-        df_raw = get_data()
-        if df_raw is not None:
-            df = prepare_player_data(df_raw)
-            metrics = get_metrics_list(df)
+        # Cargar y preparar datos (las cachés se indexan por la huella de la versión)
+        dataset = get_dataset()
+        if dataset is not None:
+            dataset = prepare_player_data(dataset)
+            metrics = get_metrics_list(dataset)
+            
+            # Precalcular los grupos de la normalización relativa a la posición y a la liga
+            # (los estadísticos de cada métrica se calculan al usarla por primera vez)
+            for group_column in relative_group_columns(dataset).values():
+                get_group_stats(dataset, group_column)
         else:
             st.error("No se pudieron cargar los datos. Verifica que el archivo de datos esté disponible.")
             st.stop()
@@ -209,12 +214,40 @@ else:
     if selected == "Comparación de Jugadores":
         # Importar y mostrar la página de comparación
         from pages.comparación_de_jugadores import show_player_comparison
-        show_player_comparison(df, metrics)
+        show_player_comparison(dataset, metrics)
         
     elif selected == "Jugadores Similares":
         # Importar y mostrar la página de jugadores similares
         from pages.jugadores_similares import show_similar_players
-        show_similar_players(df, metrics)
+        show_similar_players(dataset, metrics)
+    
+    # Columnas del dataset leídas del Parquet hasta ahora (las métricas se cargan al usarlas)
+    memory = dataset.memory_stats()
+    st.sidebar.caption(f"Columnas cargadas: {memory['columns_loaded']}/{memory['columns_total']} "
+                       f"({memory['bytes_loaded'] / 1024 ** 2:.1f} MB)")
+    
+    # Consultas a SQLite de esta versión (resultados en caché y latencia más alta reciente)
+    database = get_database(dataset.version)
+    if database is not None:
+        cache_stats = database.cache.stats()
+        latency = database.latency.summary()
+        if len(latency):
+            st.sidebar.caption(f"Consultas SQLite: {cache_stats['hits'] + cache_stats['misses']} "
+                               f"({cache_stats['hits']} desde caché, "
+                               f"{cache_stats['bytes'] / 1024 ** 2:.1f} MB; "
+                               f"p95 máx. {latency['p95 ms'].max():.1f} ms)")
+    
+    # Imágenes de las exportaciones a PDF (en cola y tiempo de renderizado reciente); los
+    # procesos de renderizado se arrancan con la primera exportación
+    render_stats = get_render_service().stats()
+    if render_stats['warmup_error']:
+        st.sidebar.warning(f"Imágenes PDF no disponibles: {render_stats['warmup_error']}")
+    render_latency = render_stats['latency']
+    if len(render_latency):
+        render_p95 = render_latency.set_index('consulta').loc['render', 'p95 ms']
+        st.sidebar.caption(f"Imágenes PDF: {render_stats['completed']} generadas, "
+                           f"{render_stats['queued']} en cola "
+                           f"(p95 {render_p95 / 1000:.1f} s)")
 
 # Pie de página versión autenticada
 if st.session_state.authenticated:
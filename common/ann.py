@@ -0,0 +1,195 @@
+import os
+import shutil
+import numpy as np
+
+# Configuración de la búsqueda aproximada (se puede ajustar con variables de entorno)
+# - ANN_MIN_ROWS: a partir de cuántos jugadores se usa el índice aproximado
+# - ANN_TABLES: número de tablas hash
+# - ANN_BUCKET_SIZE: jugadores por bucket que se buscan al elegir los bits de cada tabla
+# - ANN_PROBES: buckets vecinos que se consultan por tabla por defecto (más = más recall y
+#   más latencia; cada búsqueda puede indicar los suyos, ver SimilarityIndex.top_k)
+# - ANN_EXACT_LIMIT: si los filtros dejan menos candidatos que esto, se puntúan todos
+ANN_MIN_ROWS = int(os.getenv('SCOUTING_ANN_MIN_ROWS', 100000))
+ANN_TABLES = int(os.getenv('SCOUTING_ANN_TABLES', 12))
+ANN_BUCKET_SIZE = int(os.getenv('SCOUTING_ANN_BUCKET_SIZE', 16))
+ANN_PROBES = int(os.getenv('SCOUTING_ANN_PROBES', 6))
+ANN_EXACT_LIMIT = int(os.getenv('SCOUTING_ANN_EXACT_LIMIT', 20000))
+
+
+class LSHIndex:
+    """
+    Índice aproximado de vecinos (LSH de proyecciones aleatorias, "SimHash") para la
+    matriz normalizada de un SimilarityIndex
+
+    Cada tabla asigna a cada jugador un código de n_bits según el lado de n_bits
+    hiperplanos aleatorios (sobre los datos centrados) en el que queda. Una consulta
+    recoge los jugadores del bucket del jugador base y de los `probes` buckets vecinos
+    (los que resultan de invertir los bits menos seguros) en todas las tablas; esos
+    candidatos se puntúan después de forma exacta
+    """
+
+    def __init__(self, planes, center, orders, offsets, metrics=None):
+        self.planes = planes      # (tablas, bits, métricas) float32
+        self.center = center      # (métricas,) float32
+        self.orders = orders      # (tablas, jugadores) int32: filas ordenadas por código
+        self.offsets = offsets    # (tablas, 2**bits + 1) int32: inicio de cada bucket en orders
+        self.metrics = None if metrics is None else list(metrics)  # orden de las columnas
+        self._weights = (1 << np.arange(planes.shape[1])).astype(np.int64)
+
+    @classmethod
+    def build(cls, matrix, n_tables=ANN_TABLES, n_bits=None, seed=0, metrics=None):
+        """
+        Construye el índice para una matriz (jugadores x métricas) de filas normalizadas
+
+        Sin n_bits se eligen los bits para que cada bucket tenga del orden de
+        ANN_BUCKET_SIZE jugadores. metrics (opcional) son los nombres de las columnas
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if n_bits is None:
+            n_bits = default_bits(len(matrix))
+        rng = np.random.default_rng(seed)
+        planes = rng.standard_normal((n_tables, n_bits, matrix.shape[1])).astype(np.float32)
+        center = matrix.mean(axis=0).astype(np.float32)
+
+        index = cls(planes, center, None, None, metrics)
+        codes = index._hash(matrix - center).T                # (tablas, jugadores)
+        orders = np.argsort(codes, axis=1, kind='stable').astype(np.int32)
+        sorted_codes = np.take_along_axis(codes, orders, axis=1)
+        buckets = np.arange((1 << n_bits) + 1)
+        index.orders = orders
+        index.offsets = np.stack([np.searchsorted(table_codes, buckets) for table_codes in sorted_codes]).astype(np.int32)
+        return index
+
+    def _hash(self, centered):
+        n_tables, n_bits, n_metrics = self.planes.shape
+        projections = centered @ self.planes.reshape(-1, n_metrics).T
+        bits = projections.reshape(len(centered), n_tables, n_bits) > 0
+        return bits @ self._weights
+
+    def __len__(self):
+        return self.orders.shape[1]
+
+    def candidates(self, vector, probes=ANN_PROBES):
+        """
+        Devuelve las posiciones candidatas (ordenadas, sin repetir) para un vector consulta
+        """
+        projections = self.planes @ (np.asarray(vector, dtype=np.float32) - self.center)
+        base = (projections > 0) @ self._weights                           # (tablas,)
+
+        # Buckets a consultar: el propio y los de invertir los `probes` bits menos seguros
+        probes = min(probes, self.planes.shape[1])
+        flips = np.argsort(np.abs(projections), axis=1)[:, :probes]
+        probe_codes = np.concatenate([base[:, None], base[:, None] ^ (1 << flips)], axis=1)
+
+        # Marcar los jugadores de cada bucket consultado (más barato que unir y ordenar)
+        found = np.zeros(len(self), dtype=bool)
+        tables = np.arange(len(probe_codes))[:, None]
+        starts = self.offsets[tables, probe_codes]
+        ends = self.offsets[tables, probe_codes + 1]
+        for table, start, end in zip(np.broadcast_to(tables, starts.shape).ravel(), starts.ravel(), ends.ravel()):
+            if end > start:
+                found[self.orders[table, start:end]] = True
+
+        return np.flatnonzero(found)
+
+    def aligned(self, metrics):
+        """
+        Devuelve el índice para consultas con las columnas en el orden de `metrics` (las
+        mismas métricas en otro orden), o None si las métricas no coinciden
+        """
+        if self.metrics is None or sorted(metrics) != sorted(self.metrics):
+            return None
+        if list(metrics) == self.metrics:
+            return self
+        # Reordenar las columnas de los hiperplanos no cambia el código de ningún jugador
+        order = [self.metrics.index(metric) for metric in metrics]
+        return LSHIndex(self.planes[:, :, order], self.center[order], self.orders, self.offsets, metrics)
+
+    def save(self, path):
+        """
+        Guarda el índice en un archivo .npz (escritura atómica)
+        """
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, planes=self.planes, center=self.center, orders=self.orders, offsets=self.offsets,
+                 metrics=np.array(self.metrics or [], dtype=str))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            metrics = data['metrics'].tolist() if 'metrics' in data else None
+            return cls(data['planes'], data['center'], data['orders'], data['offsets'], metrics or None)
+
+
+def default_bits(n_rows):
+    """
+    Bits por tabla para unos ANN_BUCKET_SIZE jugadores por bucket (entre 8 y 20)
+    """
+    return int(np.clip(np.round(np.log2(max(n_rows, 1) / ANN_BUCKET_SIZE)), 8, 20))
+
+
+def ann_index_name(preset_name, scaling, distance='cosine'):
+    """
+    Nombre del archivo del índice de un conjunto de métricas con nombre, escalado y distancia
+    """
+    return f"{preset_name}-{scaling}-{distance}.npz"
+
+
+def load_ann_index(ann_dir, preset_name, scaling, distance, n_rows):
+    """
+    Carga el índice aproximado generado en la ingesta para un conjunto de métricas con
+    nombre, escalado y distancia
+
+    Devuelve None si la versión no lo tiene o no corresponde a sus datos; en ese caso la
+    búsqueda es exacta. Nunca se construye ni se escribe nada (la carpeta de la versión no
+    se modifica una vez publicada)
+    """
+    path = os.path.join(ann_dir, ann_index_name(preset_name, scaling, distance))
+    if not os.path.exists(path):
+        return None
+    try:
+        index = LSHIndex.load(path)
+    except Exception as e:
+        print(f"No se puede leer el índice aproximado {path}: {e}")
+        return None
+    return index if len(index) == n_rows else None
+
+
+def build_ann_index(parquet_path, ann_dir, presets=None):
+    """
+    Construye en la ingesta los índices aproximados de los conjuntos de métricas con nombre,
+    uno por conjunto y escalado (solo coseno, la única distancia que usa LSH)
+
+    Solo se construyen si el dataset tiene al menos ANN_MIN_ROWS jugadores. La carpeta se
+    genera aparte y se sustituye entera, así no quedan índices de conjuntos que ya no existen.
+    Devuelve el número de índices construidos o None
+    """
+    import pyarrow.parquet as pq
+    from common.presets import METRIC_PRESETS
+    from common.similarity import SimilarityIndex, SCALINGS
+
+    if pq.read_metadata(parquet_path).num_rows < ANN_MIN_ROWS:
+        return None
+
+    presets = METRIC_PRESETS if presets is None else presets
+    available = set(pq.read_schema(parquet_path).names)
+    metric_names = sorted({metric for preset in presets for metric in preset.metrics if metric in available})
+    table = pq.read_table(parquet_path, columns=metric_names).to_pandas()
+
+    tmp_dir = f"{ann_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    built = 0
+    for preset in presets:
+        metrics = list(preset.metrics)
+        if not available.issuperset(metrics):
+            continue
+        for scaling in SCALINGS:
+            index = SimilarityIndex(table[metrics], metrics, scaling=scaling)
+            lsh = LSHIndex.build(index.matrix, metrics=metrics)
+            lsh.save(os.path.join(tmp_dir, ann_index_name(preset.name, scaling)))
+            built += 1
+
+    shutil.rmtree(ann_dir, ignore_errors=True)
+    os.replace(tmp_dir, ann_dir)
+    return built
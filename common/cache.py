@@ -1,116 +1,333 @@
 import streamlit as st
 import pandas as pd
 import os
-import sqlite3
-from sqlalchemy import create_engine
+import pyarrow.parquet as pq
 from dotenv import load_dotenv
+from common.dataset import DatasetHandle, HASH_FUNCS
+from common.schema import apply_schema, has_schema, metric_columns, find_column, get_column_spec, PLAYER_ID_COLUMN
+from common.derived import compute_derived_metrics, derived_sources, missing_derived_metrics
+from common.players import add_player_ids
+from common.storage import EXCEL_PATH, LEGACY_VERSION_PREFIX, current_version, dataset_paths
 
 # Cargar variables de entorno
 load_dotenv(os.path.join('models', '.env'))
 
-# Función cacheada para cargar datos desde Parquet
-@st.cache_data(ttl=3600)
-def get_data():
+# Función para obtener el dataset de la versión publicada
+def get_dataset():
     """
-    Carga los datos del archivo Parquet o crea el archivo si no existe
+    Devuelve el handle del dataset de la versión publicada o lo crea desde el Excel si no existe
+    
+    La versión se consulta en cada llamada (solo lee el puntero data/CURRENT), de modo que
+    tras una regeneración se cargan los datos nuevos sin esperar a que caduque la caché
     """
-    excel_path = os.path.join('data', 'jugadores_formateados.xlsx')
-    parquet_path = os.path.join('data', 'fbref_data.parquet')
-    db_path = os.path.join('data', 'fbref_data.db')
+    version = current_version()
     
-    # Verificar si existe el archivo parquet
-    if not os.path.exists(parquet_path):
-        # Si no existe el parquet pero sí el Excel, convertirlo
-        if os.path.exists(excel_path):
-            from common.functions import convert_excel_to_parquet
-            success = convert_excel_to_parquet(excel_path, parquet_path)
-            if not success:
-                st.error("No se pudo convertir el archivo Excel a Parquet.")
+    # Si no hay ninguna versión pero sí el Excel, generarla
+    if version is None:
+        if os.path.exists(EXCEL_PATH):
+            from common.ingest import ingest_new_version
+            try:
+                version = ingest_new_version(EXCEL_PATH, full=True)
+            except Exception as e:
+                st.error(f"No se pudo convertir el archivo Excel a Parquet: {e}")
                 return None
         else:
             st.error("No se encontró el archivo de datos. Por favor, sube un archivo Excel.")
             return None
     
-    # Cargar desde parquet
+    return load_dataset(version)
+
+# Función para cargar los datos de la versión publicada como DataFrame
+def get_data():
+    """
+    Carga los datos de la versión publicada del dataset (copia que se puede modificar)
+    """
+    dataset = get_dataset()
+    if dataset is None:
+        return None
+    return dataset.df.copy()
+
+# Función para leer columnas concretas del Parquet o de la instantánea de una versión
+def read_columns(read_table, stored, columns, typed=True):
+    """
+    Lee solo las columnas indicadas (proyección de columnas) como DataFrame
+    
+    - read_table: Función que recibe una lista de columnas y devuelve una tabla de Arrow
+    - stored: Columnas disponibles en el origen
+    - typed: Si el origen ya tiene los tipos del registro (ver has_schema); si no, se
+      aplican a las columnas leídas
+    Las métricas derivadas que no están en el origen (datos anteriores a su materialización
+    en la ingesta) se calculan a partir de sus columnas de origen. Las columnas numéricas
+    sin nulos no se copian (split_blocks): con una instantánea proyectada en memoria
+    siguen apuntando al archivo
+    """
+    columns = list(columns)
+    derived = [col for col in columns if col not in stored]
+    sources = [col for col in derived_sources(derived) if col not in columns]
+    df = read_table([col for col in columns if col in stored] + sources).to_pandas(split_blocks=True)
+    if not typed:
+        df = apply_schema(df)
+    if derived:
+        df = pd.concat([df, compute_derived_metrics(df)[derived]], axis=1)
+    return df[columns]
+
+# Función cacheada para cargar una versión concreta del dataset
+@st.cache_resource(max_entries=2)
+def load_dataset(version):
+    """
+    Carga los datos de una versión del dataset (cacheado por versión)
+    
+    Si la versión tiene instantánea Arrow IPC se proyecta en memoria (mmap): no se
+    decodifica nada y los procesos del servidor comparten las mismas páginas. Si no, se
+    lee del Parquet. Solo se leen de forma anticipada las columnas que no son métricas
+    (identificadores, equipo, liga, año de nacimiento...); cada métrica se lee la primera
+    vez que se usa (ver DatasetHandle). Devuelve un DatasetHandle compartido entre
+    sesiones: el DataFrame no debe modificarse
+    """
+    from common.snapshot import open_arrow_snapshot
+    paths = dataset_paths(version)
+    
     try:
-        df = pd.read_parquet(parquet_path)
+        if os.path.exists(paths['snapshot']):
+            table = open_arrow_snapshot(paths['snapshot'])
+            schema, read_table = table.schema, table.select
+        else:
+            schema = pq.read_schema(paths['parquet'])
+            
+            def read_table(names):
+                return pq.read_table(paths['parquet'], columns=names)
         
-        # Asegurarse de que Nacionalidad y Posición sean tratados como texto
-        text_columns = ['Nacionalidad', 'Posición', 'Posicion']
-        for col in text_columns:
-            if col in df.columns:
-                df[col] = df[col].astype(str)
-                # Reemplazar valores numéricos o vacíos con cadena vacía
-                df[col] = df[col].replace(['0', '0.0', 'nan', 'None'], '')
+        # Los tipos se aplican en la ingesta; solo los Parquet generados con versiones
+        # anteriores (sin el esquema en los metadatos) necesitan convertirse al leerlos.
+        # Igualmente, las métricas derivadas que faltan se calculan al leerlas
+        typed = has_schema(schema)
+        stored = set(schema.names)
+        columns = schema.names + missing_derived_metrics(schema.names)
         
-        return df
+        def loader(names):
+            return read_columns(read_table, stored, names, typed)
+        
+        eager = [col for col in columns if col not in metric_columns(columns)]
+        df = loader(eager)
+        
+        # Los datos anteriores a los IDs de jugador los calculan al cargarse
+        if PLAYER_ID_COLUMN not in stored:
+            df = add_player_ids(df)
+            columns = [col for col in df.columns if col not in eager] + columns
+        return DatasetHandle(df, version, loader=loader, columns=columns)
     except Exception as e:
-        st.error(f"Error al cargar datos desde Parquet: {e}")
+        st.error(f"Error al cargar los datos: {e}")
         return None
 
-# Función cacheada para obtener conexión a base de datos
+# Función cacheada para obtener el servicio de renderizado de gráficos
 @st.cache_resource
-def get_db_connection():
+def get_render_service():
     """
-    Obtiene una conexión a la base de datos SQLite, creándola si no existe
+    Devuelve los procesos de renderizado (RenderService) que convierten los gráficos en
+    imágenes para las exportaciones a PDF; se comparten entre todas las sesiones y se
+    arrancan con la primera exportación
     """
-    db_path = os.path.join('data', 'wyscout_data.db')
-    excel_path = os.path.join('data', 'DATOS_WYSCOUT.xlsx')
+    from common.render import RenderService
+    return RenderService()
+
+# Función cacheada para obtener el acceso a la base de datos
+@st.cache_resource(max_entries=4)
+def get_database(version=None):
+    """
+    Devuelve el acceso de solo lectura (PlayerDatabase: conexiones reutilizables, caché
+    de resultados y latencias) a la base de datos SQLite de una versión del dataset
+    (por defecto la publicada)
+    """
+    from common.database import PlayerDatabase
+    if version is None:
+        version = current_version()
+    db_path = dataset_paths(version)['db']
     
     # Verificar si existe la base de datos
     if not os.path.exists(db_path):
-        # Si no existe la DB pero sí el Excel, crearla
-        if os.path.exists(excel_path):
-            from common.functions import create_sqlite_database
-            success = create_sqlite_database(excel_path, db_path)
-            if not success:
-                st.error("No se pudo crear la base de datos SQLite.")
-                return None
-        else:
-            st.error("No se encontró el archivo de datos. Por favor, sube un archivo Excel.")
-            return None
+        st.error("No se encontró la base de datos. Ejecuta 'python regenerate_data.py' para generarla.")
+        return None
     
-    # Conectar a la base de datos
+    # Las versiones publicadas no se modifican: se abren como inmutables (sin bloqueos).
+    # Los datos directamente en data/ se pueden regenerar en el sitio
     try:
-        engine = create_engine(f'sqlite:///{db_path}')
-        return engine
+        return PlayerDatabase(db_path, immutable=not version.startswith(LEGACY_VERSION_PREFIX))
     except Exception as e:
         st.error(f"Error al conectar a la base de datos: {e}")
         return None
 
-# Función cacheada para consultar datos específicos de la base de datos
-@st.cache_data(ttl=3600)
-def query_database(sql_query):
+# Función para consultar datos específicos de la base de datos
+def query_database(sql_query, params=None, version=None, name='sql'):
     """
-    Ejecuta una consulta SQL en la base de datos y devuelve los resultados
+    Ejecuta una consulta SQL parametrizada en la base de datos y devuelve los resultados
+    
+    - params: Tupla con los valores de los parámetros '?' de la consulta
+    - version: Versión del dataset (por defecto la publicada); cada versión tiene su
+      propia caché de resultados, así que nunca se devuelven datos de otra versión
+    - name: Nombre con el que se agrupan sus latencias
     """
-    engine = get_db_connection()
-    if engine is None:
+    database = get_database(version or current_version())
+    if database is None:
         return None
     
     try:
-        df = pd.read_sql(sql_query, engine)
-        return df
+        return database.query(sql_query, params or (), name)
     except Exception as e:
         st.error(f"Error al ejecutar consulta: {e}")
         return None
 
+# Función para leer filas concretas de la base de datos
+def query_players(filters, columns=None, limit=None, version=None):
+    """
+    Devuelve de SQLite las filas de players_data que cumplen los filtros (ver
+    PlayerDatabase.select), sin pasar por los datos cargados en memoria
+    """
+    database = get_database(version or current_version())
+    if database is None:
+        return None
+    
+    try:
+        return database.select(filters, columns, limit, name='+'.join(filters) or 'todas')
+    except Exception as e:
+        st.error(f"Error al consultar la base de datos: {e}")
+        return None
+
+# Función cacheada para saber si una versión tiene los vecinos precalculados
+@st.cache_data(max_entries=4)
+def has_neighbors_table(version):
+    """
+    Indica si la base de datos de la versión tiene la tabla player_neighbors
+    """
+    from common.neighbors import NEIGHBORS_TABLE
+    db_path = dataset_paths(version)['db']
+    if not os.path.exists(db_path):
+        return False
+    database = get_database(version)
+    if database is None or not database.has_table(NEIGHBORS_TABLE):
+        return False
+    # Las versiones anteriores guardaban los vecinos por nombre: se buscan en vivo
+    columns = database.query(f"SELECT name FROM pragma_table_info('{NEIGHBORS_TABLE}')", name='esquema')
+    return 'jugador_id' in set(columns['name'])
+
+# Función para leer los vecinos precalculados de un jugador
+def get_player_neighbors(dataset, preset_name, player_id):
+    """
+    Devuelve los vecinos precalculados (tabla player_neighbors) de un jugador (por su ID)
+    para un conjunto de métricas con nombre, o None si la versión no los tiene
+    """
+    from common.neighbors import NEIGHBORS_TABLE
+    if not has_neighbors_table(dataset.version):
+        return None
+    query = f"""
+        SELECT rango, vecino_id, similitud
+        FROM {NEIGHBORS_TABLE}
+        WHERE preset = ? AND jugador_id = ?
+        ORDER BY rango
+    """
+    return query_database(query, (preset_name, int(player_id)), dataset.version, name='vecinos')
+
+# Función cacheada para leer el tamaño de las listas de vecinos de un conjunto de métricas
+@st.cache_data(max_entries=16)
+def get_neighbors_size(version, preset_name):
+    """
+    Devuelve (k, jugadores) de los vecinos precalculados de un conjunto de métricas con
+    nombre: la longitud de las listas guardadas (el k con el que se calcularon) y el número
+    de jugadores con lista, o None si la versión no los tiene
+    """
+    from common.neighbors import NEIGHBORS_TABLE
+    if not has_neighbors_table(version):
+        return None
+    query = f"""
+        SELECT MAX(rango) AS k, COUNT(DISTINCT jugador_id) AS jugadores
+        FROM {NEIGHBORS_TABLE}
+        WHERE preset = ?
+    """
+    result = query_database(query, (preset_name,), version, name='vecinos')
+    if result is None or result.empty or pd.isna(result['k'].iloc[0]):
+        return None
+    return int(result['k'].iloc[0]), int(result['jugadores'].iloc[0])
+
+# Función cacheada para obtener el índice de búsqueda de nombres
+@st.cache_resource(max_entries=2, hash_funcs=HASH_FUNCS)
+def get_name_index(dataset):
+    """
+    Devuelve (una sola vez por versión del dataset) el índice en memoria de los nombres
+    de los jugadores para la búsqueda mientras se escribe
+    """
+    from common.search import NameIndex
+    return NameIndex(dataset.column('player_name'))
+
+# Función cacheada para obtener las tablas de consulta de los jugadores
+@st.cache_resource(max_entries=2, hash_funcs=HASH_FUNCS)
+def get_player_directory(dataset):
+    """
+    Devuelve (una sola vez por versión del dataset) el PlayerDirectory de los datos
+    preparados: ID ↔ posición de fila y texto con el que se muestra cada jugador
+    """
+    from common.players import PlayerDirectory
+    return PlayerDirectory(dataset.frame())
+
+# Función para obtener las opciones del selector de jugador
+def get_player_options(dataset, selection=None, query='', limit=None):
+    """
+    Devuelve las posiciones de fila de los jugadores que se ofrecen en el selector (como
+    mucho `limit`)
+    
+    - selection: Filtros de la cascada ({columna: valor}, ver FilterIndex)
+    - query: Texto buscado; sin búsqueda se devuelven los primeros jugadores en orden
+      alfabético. Con búsqueda, primero las coincidencias del nombre (índice en memoria)
+      y después los jugadores cuyo equipo o nacionalidad coincide (índice FTS5 de SQLite)
+    """
+    from common.search import MAX_PLAYER_OPTIONS
+    limit = limit or MAX_PLAYER_OPTIONS
+    directory = get_player_directory(dataset)
+    rows = get_filter_index(dataset).rows(selection)
+    if not query or not query.strip():
+        return directory.sort(rows)[:limit].tolist()
+    
+    positions = get_name_index(dataset).search(query, limit, rows).tolist()
+    
+    if len(positions) < limit:
+        database = get_database(dataset.version)
+        if database is not None:
+            allowed = set(rows.tolist()) if len(rows) < len(dataset) else None
+            found = set(positions)
+            try:
+                # Las filas de SQLite se localizan por ID (o por nombre en bases de datos
+                # anteriores a los IDs)
+                by_id = PLAYER_ID_COLUMN in database.columns
+                matches = database.search(query, [PLAYER_ID_COLUMN if by_id else 'Jugador'], limit * 2)
+                for value in matches.iloc[:, 0]:
+                    if by_id:
+                        position = directory.position(value)
+                        candidates = [] if position is None else [position]
+                    else:
+                        candidates = directory.positions_by_name(value).tolist()
+                    for position in candidates:
+                        if position not in found and (allowed is None or position in allowed):
+                            found.add(position)
+                            positions.append(position)
+            except Exception as e:
+                st.error(f"Error en la búsqueda: {e}")
+    return positions[:limit]
+
 # Función para limpiar y preparar datos
-@st.cache_data
-def prepare_player_data(df):
+@st.cache_resource(max_entries=2, hash_funcs=HASH_FUNCS)
+def prepare_player_data(dataset):
     """
     Limpia y prepara los datos de jugadores
+    
+    Recibe y devuelve un DatasetHandle; la caché se indexa por su huella de versión en
+    lugar de hashear el contenido del DataFrame en cada ejecución
     """
     # Asegurarse de que tenemos los datos correctos
-    if df is None or df.empty:
+    if dataset is None or len(dataset) == 0:
         return None
     
-    # Limpiar nombres de columnas
-    df.columns = df.columns.str.strip().str.lower()
-    
     # Mapear nombres de columnas comunes
     column_mapping = {
         'jugador': 'player_name',
+        'id jugador': 'player_id',
         'equipo': 'equipo',
         'nombre_de_equipo': 'equipo',
         'team': 'equipo',
@@ -125,53 +342,232 @@ def prepare_player_data(df):
         'position': 'posicion'
     }
     
-    # Renombrar columnas según el mapeo
-    for original, new_name in column_mapping.items():
-        if original in df.columns:
-            df = df.rename(columns={original: new_name})
+    # Limpiar nombres de columnas y renombrarlas según el mapeo (solo nombres: las métricas
+    # aún no se han leído)
+    renamed = {}
+    for col in dataset.columns:
+        name = str(col).strip().lower()
+        renamed[col] = column_mapping.get(name, name)
+    columns = list(renamed.values())
+    sources = {new_name: original for original, new_name in renamed.items()}
+    
+    # Columnas cargadas (dataset.frame() es una copia superficial: no altera los datos compartidos)
+    df = dataset.frame().rename(columns=renamed)
     
     # Si no existe player_name, crear una alternativa
     if 'player_name' not in df.columns:
         # Crear una columna con nombres genéricos
         df['player_name'] = [f'Jugador {i}' for i in range(len(df))]
+        columns.append('player_name')
     
-    # Eliminar duplicados
-    df = df.drop_duplicates(subset=['player_name'])
+    # No se eliminan filas con nombres repetidos: son jugadores distintos (homónimos) o el
+    # mismo jugador en dos equipos, y se distinguen por su posición e ID (ver PlayerDirectory)
     
-    # Tratar columnas de texto específicas
-    text_columns = ['nacionalidad', 'posicion']
-    for col in text_columns:
-        if col in df.columns:
-            df[col] = df[col].astype(str)
-            # Reemplazar valores numéricos o vacíos con cadena vacía
-            df[col] = df[col].replace(['0', '0.0', 'nan', 'None'], '')
+    # Reemplazar valores nulos por 0 en columnas numéricas (solo se tocan las que tienen
+    # nulos, para no copiar las demás)
+    def fill_numeric(frame):
+        numeric_cols = frame.select_dtypes(include=['float64', 'int64']).columns
+        null_cols = numeric_cols[frame[numeric_cols].isna().any().to_numpy()]
+        if len(null_cols):
+            frame[null_cols] = frame[null_cols].fillna(0)
+        return frame
     
-    # Reemplazar valores nulos por 0 en columnas numéricas
-    numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-    df[numeric_cols] = df[numeric_cols].fillna(0)
+    # Las demás columnas se leen del dataset original al pedirlas, con la misma preparación
+    # (las columnas se comparten con el original sin copiarlas)
+    def loader(names):
+        frame = dataset.read([sources[name] for name in names])
+        frame.columns = names
+        return fill_numeric(frame)
     
-    return df
+    return dataset.derive(fill_numeric(df), 'prepared', loader, columns)
 
 # Función para obtener lista de métricas disponibles
-@st.cache_data
-def get_metrics_list(df):
+@st.cache_data(hash_funcs=HASH_FUNCS)
+def get_metrics_list(dataset):
     """
-    Devuelve la lista de métricas numéricas disponibles en el DataFrame
+    Devuelve la lista de métricas numéricas disponibles en el dataset
+    """
+    # Columnas que el registro de columnas clasifica como métricas (siempre numéricas; se
+    # excluyen identificadores y atributos como año de nacimiento o minutos). Solo se
+    # consultan los nombres, sin leer las métricas del Parquet
+    return metric_columns(dataset.columns)
+
+# Función para leer métricas como matriz
+def metric_values(dataset, metrics):
+    """
+    Devuelve los valores de las métricas (n_jugadores x métricas, float64) leyendo del
+    Parquet solo las que aún no están en memoria
+    """
+    metrics = list(metrics)
+    return dataset.frame(metrics)[metrics].to_numpy(dtype='float64')
+
+# Función cacheada para calcular los estadísticos de las métricas
+@st.cache_resource(max_entries=2, hash_funcs=HASH_FUNCS)
+def get_feature_stats(dataset):
+    """
+    Devuelve (una sola vez por versión del dataset) los estadísticos de las métricas
+    compartidos por los índices de similitud; los de cada métrica se calculan la primera
+    vez que se usa
+    """
+    from common.similarity import FeatureStats
+    return FeatureStats(None, get_metrics_list(dataset), loader=lambda metrics: metric_values(dataset, metrics))
+
+# Función para obtener las columnas de grupo de la normalización relativa
+def relative_group_columns(dataset):
+    """
+    Devuelve {'Posición': columna, 'Liga': columna} con las columnas de grupo disponibles
+    """
+    groups = {name: find_column(dataset.columns, name) for name in ('Posición', 'Liga')}
+    return {name: column for name, column in groups.items() if column is not None}
+
+# Función cacheada para calcular la normalización relativa a un grupo
+@st.cache_resource(max_entries=4, hash_funcs=HASH_FUNCS)
+def get_group_stats(dataset, group_column):
     """
-    # Obtener columnas numéricas
-    numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns.tolist()
+    Agrupa (una sola vez por versión del dataset y columna de grupo) los jugadores por
+    posición o liga; los estadísticos de cada grupo y las métricas escaladas dentro de él
+    se calculan la primera vez que se usa cada métrica
+    """
+    from common.similarity import GroupStats
+    return GroupStats(None, get_metrics_list(dataset), dataset.column(group_column),
+                      loader=lambda metrics: metric_values(dataset, metrics))
+
+# Función cacheada para construir el índice de similitud
+@st.cache_resource(max_entries=32, hash_funcs=HASH_FUNCS)
+def get_similarity_index(dataset, metrics, weights=None, scaling='minmax', distance='cosine', relative_to=None):
+    """
+    Construye (una sola vez por dataset, conjunto de métricas y opciones) el índice de similitud
     
-    # Excluir columnas que no son métricas (como ID, etc.)
-    exclude_patterns = [
-        'id', 'player_id', 'team_id', 'pais', 'liga', 'equipo', 'player_name',
-        'jugador', 'posicion', 'posición', 'año nacimiento', 'minutos jugados',
-        'año', 'nacimiento', 'minutos', 'jugados', 'nacionalidad'
-    ]
+    - weights: Tupla con el peso de cada métrica (opcional)
+    - scaling, distance: Ver common.similarity.SimilarityIndex
+    - relative_to: Columna de grupo (posición o liga) para escalar cada jugador respecto a
+      su grupo (opcional, ver get_group_stats)
+    A partir de ANN_MIN_ROWS jugadores, las búsquedas de coseno sin pesos ni normalización
+    relativa con un conjunto de métricas con nombre usan además el índice aproximado (LSH)
+    generado en la ingesta, con reordenación exacta. Si la versión no lo tiene, la búsqueda
+    es exacta: el índice nunca se construye en la aplicación
+    """
+    from common.similarity import SimilarityIndex
+    from common.ann import ANN_MIN_ROWS, load_ann_index
+    from common.presets import preset_for_metrics
+    metrics = list(metrics)
+    index = SimilarityIndex(metric_values(dataset, metrics), metrics, weights=weights, scaling=scaling,
+                            distance=distance, stats=get_feature_stats(dataset),
+                            relative=get_group_stats(dataset, relative_to) if relative_to else None)
     
-    metrics = []
-    for col in numeric_cols:
-        # Verificar que la columna no incluye ninguno de los patrones a excluir
-        if not any(pattern in col.lower() for pattern in exclude_patterns):
-            metrics.append(col)
+    # Con muchos jugadores, añadir el índice aproximado guardado en la versión
+    if distance == 'cosine' and weights is None and relative_to is None and len(index) >= ANN_MIN_ROWS:
+        preset = preset_for_metrics(metrics)
+        if preset is not None:
+            backend = load_ann_index(dataset_paths(dataset.version)['ann'], preset.name, scaling, distance, len(index))
+            if backend is not None:
+                index.backend = backend.aligned([get_column_spec(metric).name for metric in metrics])
+    return index
+
+# Función cacheada para obtener los percentiles por posición y liga
+@st.cache_resource(max_entries=2, hash_funcs=HASH_FUNCS)
+def get_percentiles(dataset):
+    """
+    Devuelve (una sola vez por versión del dataset) la tabla de percentiles de cada métrica
+    por posición y liga, alineada con las filas del dataset
     
-    return metrics
+    Se lee del archivo generado en la ingesta junto al Parquet (solo las métricas que se
+    usan); con datos anteriores (sin ese archivo) se calcula en memoria a partir de los
+    datos originales de la versión (sin los nulos rellenados con 0 de los datos preparados)
+    """
+    from common.percentiles import PercentileTable, compute_percentiles, PERCENTILE_GROUPS
+    paths = dataset_paths(dataset.version)
+    metrics = get_metrics_list(dataset)
+    raw = load_dataset(dataset.version)
+    originals = {get_column_spec(col).app_name: col for col in raw.columns}
+    group_columns = [find_column(raw.columns, name) for name in PERCENTILE_GROUPS]
+    group_columns = [col for col in group_columns if col is not None]
+    
+    def compute(names):
+        sources = [originals.get(name, name) for name in names]
+        percentiles = compute_percentiles(raw.frame(group_columns + sources), sources, group_columns)
+        percentiles.columns = names
+        return percentiles
+    
+    try:
+        if os.path.exists(paths['percentiles']) and \
+                pq.read_metadata(paths['percentiles']).num_rows == pq.read_metadata(paths['parquet']).num_rows:
+            return PercentileTable.for_dataset(paths['percentiles'], dataset.frame().index, metrics, compute)
+    except Exception:
+        pass
+    
+    return PercentileTable(metrics, compute, len(dataset))
+
+# Gráficos radar que se guardan como máximo (cada uno es una combinación de jugadores,
+# métricas y escala)
+RADAR_CACHE_ENTRIES = 64
+
+# Función cacheada para construir el gráfico radar
+@st.cache_data(max_entries=RADAR_CACHE_ENTRIES, hash_funcs=HASH_FUNCS)
+def get_radar_chart(dataset, player_ids, metrics, relative_to=None, percentiles=False):
+    """
+    Devuelve el gráfico radar de los jugadores (ver create_radar_chart_unified), guardado
+    por versión del dataset, jugadores, métricas y escala: las ejecuciones en las que solo
+    cambia otro control de la página no lo vuelven a construir
+    
+    - player_ids: Tupla con los IDs de los jugadores en el orden del radar (ver PlayerDirectory)
+    - metrics: Tupla con las métricas
+    - relative_to: Columna de grupo (posición o liga) para escalar cada métrica dentro del
+      grupo del jugador (opcional, ver get_group_stats)
+    - percentiles: Usar los percentiles por posición y liga (tiene prioridad sobre relative_to)
+    Cada llamada devuelve una copia del gráfico, que se puede modificar (p. ej. para el PDF)
+    """
+    from common.functions import create_radar_chart_unified
+    directory = get_player_directory(dataset)
+    players = [directory.position(player_id) for player_id in player_ids]
+    metrics = list(metrics)
+    return create_radar_chart_unified(
+        dataset.frame(metrics),
+        [player for player in players if player is not None],
+        metrics,
+        group_stats=get_group_stats(dataset, relative_to) if relative_to else None,
+        percentiles=get_percentiles(dataset) if percentiles else None
+    )
+
+# Función cacheada para leer solo las filas de una liga (o temporada)
+@st.cache_data(max_entries=32, hash_funcs=HASH_FUNCS)
+def get_filtered_data(dataset, filters, columns):
+    """
+    Devuelve las filas del dataset que cumplen los filtros, solo con las columnas indicadas
+    
+    - filters: Diccionario {columna: valor} con nombres de la aplicación (p. ej. {'liga': ...})
+    - columns: Columnas que se devuelven (nombres de la aplicación)
+    Se leen del dataset particionado de la versión: solo las carpetas de liga/temporada y
+    los row groups que pueden cumplir los filtros. Sin él (datos anteriores) se filtran
+    las filas en memoria. El índice es el mismo que el del dataset
+    """
+    from common.filters import build_filter_mask
+    from common.partitions import read_partitioned
+    partitioned_dir = dataset_paths(dataset.version)['partitioned']
+    columns = list(columns)
+    
+    if os.path.isdir(partitioned_dir):
+        originals = {get_column_spec(col).app_name: col
+                     for col in pq.read_schema(dataset_paths(dataset.version)['parquet']).names}
+        if all(col in originals for col in list(filters) + columns):
+            df = read_partitioned(partitioned_dir, {originals[col]: value for col, value in filters.items()},
+                                  [originals[col] for col in columns])
+            df.columns = columns
+            numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
+            df[numeric_cols] = df[numeric_cols].fillna(0)
+            return df
+    
+    df = dataset.frame(columns)
+    return df[build_filter_mask(df, filters)][columns]
+
+# Función cacheada para construir el índice de filtros en cascada
+@st.cache_resource(max_entries=2, hash_funcs=HASH_FUNCS)
+def get_filter_index(dataset):
+    """
+    Construye (una sola vez por versión del dataset) el índice de los filtros
+    Liga → Equipo → Posición que usan las páginas (los jugadores se ofrecen por posición
+    de fila, ver get_player_options)
+    """
+    from common.filters import FilterIndex
+    levels = ['liga', 'equipo', find_column(dataset.columns, 'Posición')]
+    return FilterIndex(dataset, [col for col in levels if col])
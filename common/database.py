@@ -0,0 +1,322 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from urllib.request import pathname2url
+import numpy as np
+import pandas as pd
+from common.schema import find_column
+from common.search import SEARCH_TABLE, match_expression
+
+# Conexiones de solo lectura abiertas como máximo por base de datos
+DEFAULT_POOL_SIZE = 4
+
+# Límites de la caché de resultados de cada base de datos (memoria de los DataFrames)
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_CACHE_ENTRIES = 1024
+
+# Últimas latencias que se guardan por consulta para calcular los percentiles
+LATENCY_WINDOW = 1024
+
+
+def _quote(name):
+    """
+    Entrecomilla un identificador de SQLite
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class ConnectionPool:
+    """
+    Conjunto de conexiones de solo lectura a una base de datos SQLite
+
+    Las conexiones se abren la primera vez que hacen falta (como mucho `size`) y se
+    reutilizan entre consultas y sesiones, de modo que cada una conserva su caché de
+    páginas y de sentencias preparadas. Cada conexión la usa un solo hilo a la vez
+    """
+
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE, immutable=False):
+        """
+        - immutable: La base de datos no cambia mientras está abierta (versiones publicadas):
+          SQLite no bloquea el archivo ni comprueba si otro proceso lo ha modificado
+        """
+        self._uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+        if immutable:
+            self._uri += "&immutable=1"
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        # check_same_thread=False: Streamlit atiende cada sesión en un hilo distinto
+        return sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+
+    @contextmanager
+    def connection(self):
+        """
+        Presta una conexión del conjunto (espera a que quede una libre si están todas en uso)
+        """
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                opened = self._opened < self.size
+                if opened:
+                    self._opened += 1
+            if opened:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """
+        Cierra las conexiones libres
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class ResultCache:
+    """
+    Caché LRU de resultados de consultas acotada por número de entradas y por memoria
+
+    El tamaño de cada entrada es la memoria de su DataFrame; al superar cualquiera de los
+    dos límites se descartan los resultados usados hace más tiempo. Los resultados mayores
+    que el límite de memoria no se guardan
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Devuelve el resultado guardado para `key` (o None) y lo marca como el más reciente
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        size = int(df.memory_usage(deep=True, index=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (df, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Devuelve {'entries', 'bytes', 'hits', 'misses', 'evictions'}
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+class LatencyStats:
+    """
+    Latencias de las consultas agrupadas por nombre (incluidas las servidas desde la caché)
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, cached):
+        with self._lock:
+            calls = self._calls.get(name)
+            if calls is None:
+                calls = self._calls[name] = {'calls': 0, 'cached': 0, 'total': 0.0,
+                                             'recent': deque(maxlen=self.window)}
+            calls['calls'] += 1
+            calls['cached'] += int(cached)
+            calls['total'] += seconds
+            calls['recent'].append(seconds)
+
+    def summary(self):
+        """
+        Devuelve un DataFrame con llamadas, aciertos de caché y latencias (ms) por consulta;
+        la mediana, el p95 y el máximo se calculan sobre las últimas llamadas
+        """
+        with self._lock:
+            rows = []
+            for name, calls in sorted(self._calls.items()):
+                recent = np.array(calls['recent']) * 1000
+                rows.append({
+                    'consulta': name,
+                    'llamadas': calls['calls'],
+                    'desde caché': calls['cached'],
+                    'media ms': calls['total'] * 1000 / calls['calls'],
+                    'p50 ms': float(np.percentile(recent, 50)),
+                    'p95 ms': float(np.percentile(recent, 95)),
+                    'máx ms': float(recent.max()),
+                })
+        return pd.DataFrame(rows, columns=['consulta', 'llamadas', 'desde caché', 'media ms',
+                                           'p50 ms', 'p95 ms', 'máx ms'])
+
+
+class PlayerDatabase:
+    """
+    Acceso de solo lectura a la tabla players_data de una versión del dataset
+
+    Las consultas son sentencias parametrizadas (el texto SQL solo depende de las columnas
+    y del número de valores, así que SQLite reutiliza la sentencia preparada) que se
+    ejecutan con las conexiones de un ConnectionPool. Los resultados se guardan en una
+    ResultCache y se mide la latencia de cada llamada. Los DataFrames devueltos se
+    comparten con la caché: no deben modificarse (copy-on-write)
+    """
+
+    def __init__(self, db_path, table_name='players_data', pool_size=DEFAULT_POOL_SIZE,
+                 cache_bytes=DEFAULT_CACHE_BYTES, cache_entries=DEFAULT_CACHE_ENTRIES, immutable=False):
+        self.db_path = db_path
+        self.table_name = table_name
+        self.pool = ConnectionPool(db_path, pool_size, immutable)
+        self.cache = ResultCache(cache_bytes, cache_entries)
+        self.latency = LatencyStats()
+
+        with self.pool.connection() as conn:
+            self.tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            self.columns = [row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table_name)})")]
+
+    def has_table(self, name):
+        return name in self.tables
+
+    def query(self, sql, params=(), name='sql'):
+        """
+        Ejecuta una consulta parametrizada ('?') y devuelve el resultado como DataFrame
+
+        - name: Nombre con el que se agrupan sus latencias (ver stats)
+        """
+        start = time.perf_counter()
+        key = (sql, tuple(params))
+        df = self.cache.get(key)
+        cached = df is not None
+        if not cached:
+            with self.pool.connection() as conn:
+                cursor = conn.execute(sql, key[1])
+                rows = cursor.fetchall()
+                columns = [description[0] for description in cursor.description]
+            df = pd.DataFrame.from_records(rows, columns=columns)
+            self.cache.put(key, df)
+        self.latency.record(name, time.perf_counter() - start, cached)
+        return df
+
+    def select(self, filters=None, columns=None, limit=None, name='select'):
+        """
+        Devuelve las filas de players_data que cumplen los filtros, en el orden de la tabla
+
+        - filters: {columna: valor o lista de valores} (columnas del registro, con
+          cualquiera de sus nombres); los valores de cada columna se combinan con OR y
+          las columnas con AND
+        - columns: Columnas que se devuelven (por defecto, todas)
+        - limit: Número máximo de filas
+        """
+        conditions = []
+        params = []
+        for col, value in (filters or {}).items():
+            column = self._column(col)
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            if not values:
+                return pd.DataFrame(columns=self._columns(columns))
+            if len(values) == 1:
+                conditions.append(f"{_quote(column)} = ?")
+            else:
+                conditions.append(f"{_quote(column)} IN ({', '.join('?' for _ in values)})")
+            params.extend(value.item() if hasattr(value, 'item') else value for value in values)
+
+        sql = f"SELECT {', '.join(_quote(col) for col in self._columns(columns))} FROM {_quote(self.table_name)}"
+        if conditions:
+            sql += f" WHERE {' AND '.join(conditions)}"
+        sql += " ORDER BY rowid"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return self.query(sql, params, name)
+
+    def players_by_name(self, names, columns=None):
+        return self.select({'Jugador': names}, columns, name='jugador')
+
+    def players_by_team(self, team, columns=None, limit=None):
+        return self.select({'Equipo': team}, columns, limit, name='equipo')
+
+    def players_by_league(self, league, columns=None, limit=None):
+        return self.select({'Liga': league}, columns, limit, name='liga')
+
+    def players_by_position(self, position, columns=None, limit=None):
+        return self.select({'Posición': position}, columns, limit, name='posición')
+
+    def search(self, query, columns=None, limit=20):
+        """
+        Busca jugadores por nombre, equipo o nacionalidad con el índice FTS5 de la versión
+        (sin distinguir mayúsculas ni acentos; cada palabra de la búsqueda es un prefijo)
+
+        Devuelve las filas de players_data ordenadas por relevancia (vacío si la versión no
+        tiene índice de búsqueda)
+        """
+        expression = match_expression(query)
+        if expression is None or not self.has_table(SEARCH_TABLE):
+            return pd.DataFrame(columns=self._columns(columns))
+        selected = ', '.join(f"p.{_quote(col)}" for col in self._columns(columns))
+        sql = (f"SELECT {selected} FROM {SEARCH_TABLE} s JOIN {_quote(self.table_name)} p ON p.rowid = s.rowid "
+               f"WHERE {SEARCH_TABLE} MATCH ? ORDER BY s.rank LIMIT ?")
+        return self.query(sql, (expression, int(limit)), 'búsqueda')
+
+    def _column(self, name):
+        column = name if name in self.columns else find_column(self.columns, name)
+        if column is None:
+            raise KeyError(f"La tabla {self.table_name} no tiene la columna '{name}'")
+        return column
+
+    def _columns(self, columns):
+        return list(self.columns) if columns is None else [self._column(col) for col in columns]
+
+    def stats(self):
+        """
+        Devuelve {'pool_size', 'cache': ResultCache.stats(), 'latency': LatencyStats.summary()}
+        """
+        return {'pool_size': self.pool.size, 'cache': self.cache.stats(), 'latency': self.latency.summary()}
+
+    def close(self):
+        self.pool.close()
+        self.cache.clear()
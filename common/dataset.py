@@ -0,0 +1,205 @@
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+
+class DatasetHandle:
+    """
+    Referencia ligera y de solo lectura a un DataFrame cargado, identificada por una huella de versión
+
+    La huella se calcula una sola vez al cargar los datos (a partir de la versión del
+    dataset y de su estructura), de modo que las funciones cacheadas que reciben el
+    handle no necesitan hashear el contenido del DataFrame en cada ejecución
+
+    El handle se comparte entre sesiones: `df` devuelve una copia superficial (copy-on-write),
+    así que modificarla nunca altera los datos compartidos, y las selecciones de filas se
+    hacen con vistas de posiciones (DatasetView) en lugar de copiar el DataFrame
+
+    Con un `loader`, el DataFrame inicial solo contiene las columnas que se cargan de forma
+    anticipada (identificadores); el resto se leen la primera vez que se piden (frame,
+    column) y se quedan en memoria, así que la memoria ocupada depende de las columnas usadas
+    """
+
+    def __init__(self, df, version, stage='raw', loader=None, columns=None):
+        """
+        - df: DataFrame con las columnas ya cargadas
+        - loader: Función opcional que recibe una lista de columnas y devuelve un DataFrame
+          con esas columnas (mismo índice que df)
+        - columns: Todas las columnas del dataset, en orden (por defecto las de df)
+        """
+        self._df = df
+        self._columns = {}
+        self._loader = loader
+        self._all_columns = pd.Index(df.columns if columns is None else columns)
+        self._lock = threading.Lock()
+        self.version = version
+        self.stage = stage
+        shape = (len(df), len(self._all_columns))
+        signature = f"{version}|{stage}|{shape}|{'|'.join(map(str, self._all_columns))}"
+        self.fingerprint = hashlib.sha1(signature.encode('utf-8')).hexdigest()
+
+    def _load(self, columns):
+        """
+        Carga (una sola vez) las columnas indicadas que aún no están en memoria
+        """
+        missing = [col for col in dict.fromkeys(columns) if col not in self._df.columns]
+        if not missing:
+            return
+        with self._lock:
+            missing = [col for col in missing if col not in self._df.columns]
+            if missing:
+                if self._loader is None:
+                    raise KeyError(missing)
+                loaded = self._loader(missing)
+                # concat no copia los datos (copy-on-write); los DataFrames ya entregados no cambian
+                self._df = pd.concat([self._df, loaded[missing]], axis=1)
+
+    @property
+    def df(self):
+        """
+        DataFrame del dataset con todas las columnas (copia superficial: no duplica los datos)
+
+        Carga las columnas pendientes; si solo se necesitan algunas, mejor usar frame()
+        """
+        self._load(self._all_columns)
+        return self._df[self._all_columns]
+
+    def frame(self, columns=()):
+        """
+        DataFrame con las columnas ya cargadas (identificadores incluidos) más `columns`,
+        que se leen solo si aún no están en memoria (copia superficial)
+        """
+        self._load(columns)
+        return self._df.copy(deep=False)
+
+    def read(self, columns):
+        """
+        Devuelve un DataFrame con las columnas indicadas sin guardarlas en este handle
+        (las que ya están en memoria no se vuelven a leer)
+
+        Lo usan los handles derivados, que guardan su propia versión de las columnas
+        """
+        columns = list(dict.fromkeys(columns))
+        missing = [col for col in columns if col not in self._df.columns]
+        if not missing:
+            return self._df[columns]
+        if self._loader is None:
+            raise KeyError(missing)
+        loaded = [col for col in columns if col in self._df.columns]
+        return pd.concat([self._df[loaded], self._loader(missing)[missing]], axis=1)[columns]
+
+    @property
+    def columns(self):
+        return self._all_columns
+
+    @property
+    def loaded_columns(self):
+        return list(self._df.columns)
+
+    def memory_stats(self):
+        """
+        Devuelve {'columns_loaded', 'columns_total', 'bytes_loaded'} de las columnas en memoria
+        """
+        return {
+            'columns_loaded': len(self._df.columns),
+            'columns_total': len(self._all_columns),
+            'bytes_loaded': int(self._df.memory_usage(deep=True, index=False).sum()),
+        }
+
+    def __len__(self):
+        return len(self._df)
+
+    def column(self, name):
+        """
+        Devuelve los valores de una columna como array de NumPy de solo lectura
+        """
+        values = self._columns.get(name)
+        if values is None:
+            self._load([name])
+            values = self._df[name].to_numpy(copy=True)
+            values.setflags(write=False)
+            self._columns[name] = values
+        return values
+
+    def view(self, positions=None):
+        """
+        Devuelve una vista de las filas indicadas (todas si no se indican)
+        """
+        return DatasetView(self, positions)
+
+    def derive(self, df, stage, loader=None, columns=None):
+        """
+        Crea el handle de un DataFrame derivado de este (p. ej. los datos preparados)
+
+        - loader, columns: Ver DatasetHandle (las columnas perezosas del derivado suelen
+          leerse de este handle con read())
+        """
+        return DatasetHandle(df, self.version, f"{self.stage}>{stage}", loader, columns)
+
+    def __repr__(self):
+        return (f"DatasetHandle(version={self.version!r}, stage={self.stage!r}, "
+                f"shape={(len(self), len(self._all_columns))}, loaded={len(self._df.columns)})")
+
+
+class DatasetView:
+    """
+    Selección de filas de un dataset expresada como posiciones
+
+    Filtrar una vista solo crea un nuevo array de posiciones; los datos se materializan
+    (con las columnas necesarias) únicamente al llamar a frame()
+    """
+
+    def __init__(self, dataset, positions=None):
+        self.dataset = dataset
+        if positions is None:
+            positions = np.arange(len(dataset), dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+        positions.setflags(write=False)
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def column(self, name):
+        """
+        Valores de una columna para las filas de la vista
+        """
+        return self.dataset.column(name)[self.positions]
+
+    def filter(self, column, value):
+        """
+        Devuelve una vista con las filas cuyo valor en `column` es `value`
+
+        Si la columna no existe en el dataset, la vista se devuelve sin cambios
+        """
+        if column not in self.dataset.columns:
+            return self
+        return DatasetView(self.dataset, self.positions[self.column(column) == value])
+
+    def unique(self, column):
+        """
+        Devuelve los valores distintos (no nulos) de una columna, ordenados
+        """
+        if column not in self.dataset.columns:
+            return []
+        values = pd.unique(self.column(column))
+        return sorted(value for value in values if not pd.isna(value))
+
+    def frame(self, columns=None):
+        """
+        Materializa las filas de la vista (solo con las columnas indicadas, si se indican)
+        """
+        df = self.dataset.df if columns is None else self.dataset.frame(columns)[list(columns)]
+        return df.iloc[self.positions]
+
+
+def dataset_fingerprint(handle):
+    """
+    Función de hash para Streamlit: usa la huella en lugar del contenido del DataFrame
+    """
+    return handle.fingerprint
+
+
+# hash_funcs para @st.cache_data / @st.cache_resource
+HASH_FUNCS = {DatasetHandle: dataset_fingerprint}
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+from common.schema import (MINUTES_COLUMN, PER90_SOURCES, RATIO_METRICS, SHARE_METRICS,
+                           DERIVED_SCHEMA, to_number)
+
+# Nombres de todas las métricas derivadas, en el orden del registro
+DERIVED_METRICS = [spec.name for spec in DERIVED_SCHEMA]
+
+
+def _safe_divide(numerator, denominator):
+    """
+    Divide matrices de float64 elemento a elemento; con denominador <= 0 o nulo el resultado es 0
+    """
+    valid = np.nan_to_num(denominator) > 0
+    out = np.zeros(np.broadcast_shapes(numerator.shape, denominator.shape))
+    np.divide(np.nan_to_num(numerator), denominator, out=out, where=valid)
+    return out
+
+
+def compute_derived_metrics(df):
+    """
+    Calcula las métricas derivadas (por 90 minutos, cocientes y proporciones) de las filas de df
+
+    Solo depende de los valores de cada fila, así que puede aplicarse bloque a bloque en la
+    ingesta. Los minutos se convierten a número (admite '1,952'). Devuelve un DataFrame
+    float64 con el mismo índice que df y solo las métricas cuyas columnas de origen existen
+    """
+    derived = {}
+
+    # Por 90 minutos: una única división de todos los conteos entre los minutos
+    sources = [col for col in PER90_SOURCES if col in df.columns]
+    if MINUTES_COLUMN in df.columns and sources:
+        minutes = to_number(df[MINUTES_COLUMN]).to_numpy()
+        counts = np.column_stack([to_number(df[col]).to_numpy() for col in sources])
+        per90 = _safe_divide(counts * 90, minutes[:, None])
+        derived.update({f"{col}/90": per90[:, i] for i, col in enumerate(sources)})
+
+    # Cocientes y proporciones de columnas del propio jugador
+    for name, numerator, denominator, factor in RATIO_METRICS + SHARE_METRICS:
+        if numerator in df.columns and denominator in df.columns:
+            values = _safe_divide(to_number(df[numerator]).to_numpy(), to_number(df[denominator]).to_numpy())
+            derived[name] = values * factor
+
+    return pd.DataFrame(derived, index=df.index, columns=[col for col in DERIVED_METRICS if col in derived])
+
+
+def add_derived_metrics(df):
+    """
+    Añade a df las métricas derivadas como columnas propias (detrás de las exportadas)
+
+    Si df ya las tenía se recalculan, de modo que siempre son coherentes con los conteos
+    """
+    derived = compute_derived_metrics(df)
+    if not len(derived.columns):
+        return df
+    base = df.drop(columns=[col for col in derived.columns if col in df.columns])
+    return pd.concat([base, derived], axis=1)
+
+
+def missing_derived_metrics(columns):
+    """
+    Devuelve las métricas derivadas que faltan en un conjunto de columnas (nombres originales)
+    y que se pueden calcular a partir de ellas
+    """
+    columns = set(columns)
+    return [name for name in DERIVED_METRICS
+            if name not in columns and columns.issuperset(derived_sources([name]))]
+
+
+def derived_sources(names):
+    """
+    Devuelve las columnas de origen (sin repetir) necesarias para calcular las métricas
+    derivadas indicadas
+    """
+    formulas = {name: [numerator, denominator] for name, numerator, denominator, _ in RATIO_METRICS + SHARE_METRICS}
+    formulas.update({f"{col}/90": [MINUTES_COLUMN, col] for col in PER90_SOURCES})
+    return list(dict.fromkeys(source for name in names for source in formulas.get(name, [])))
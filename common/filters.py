@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+from common.schema import find_column
+
+# Número máximo de combinaciones de filtros memorizadas por índice
+MAX_CACHED_SELECTIONS = 4096
+
+# Clave del filtro por rango de años de nacimiento: (año_mínimo, año_máximo)
+BIRTH_YEAR_FILTER = 'birth_year_range'
+
+
+def build_filter_mask(df, filters):
+    """
+    Compila los filtros de una búsqueda en una única máscara booleana por filas
+
+    - filters: Diccionario {columna: valor} (liga, equipo, posición...) y opcionalmente
+      'birth_year_range': (año_mínimo, año_máximo)
+    Cada filtro es una comparación vectorizada sobre la columna; los filtros sobre
+    columnas que no existen en df se ignoran
+    """
+    mask = np.ones(len(df), dtype=bool)
+
+    for col, value in (filters or {}).items():
+        if col == BIRTH_YEAR_FILTER:
+            # La columna de año de nacimiento se resuelve con el registro de columnas
+            birth_column = find_column(df.columns, 'Año nacimiento')
+            if birth_column is not None:
+                birth_min, birth_max = value
+                years = df[birth_column].to_numpy()
+                mask &= (years >= birth_min) & (years <= birth_max)
+        elif col in df.columns:
+            mask &= (df[col] == value).to_numpy(dtype=bool, na_value=False)
+
+    return mask
+
+
+class FilterIndex:
+    """
+    Índice precalculado para los filtros en cascada (Liga → Equipo → Posición → Jugador)
+
+    Se construye una sola vez por versión del dataset. Para cada columna guarda los códigos
+    de sus valores (en orden alfabético) y las posiciones ordenadas de las filas de cada valor,
+    de modo que las filas de una combinación de filtros son la intersección de unos pocos
+    arrays y las opciones de un nivel son los códigos distintos dentro de esas filas.
+    Los resultados se memorizan por combinación, así que las ejecuciones repetidas son
+    búsquedas en un diccionario
+    """
+
+    def __init__(self, dataset, levels):
+        """
+        Parámetros:
+        - dataset: DatasetHandle con los datos
+        - levels: Columnas de los filtros en el orden de la cascada (se ignoran las que no existan)
+        """
+        self.levels = [col for col in levels if col in dataset.columns]
+        self.size = len(dataset)
+        self._codes = {}
+        self._values = {}
+        self._positions = {}
+
+        for col in self.levels:
+            codes, values = pd.factorize(pd.Series(dataset.column(col)), sort=True)
+            codes = codes.astype(np.int32)
+            codes.setflags(write=False)
+            self._codes[col] = codes
+            self._values[col] = [value.item() if hasattr(value, 'item') else value for value in values]
+
+            # Posiciones de las filas de cada valor (ordenadas, porque argsort es estable)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+            self._positions[col] = {
+                value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(self._values[col])
+            }
+
+        self._all_rows = np.arange(self.size, dtype=np.int64)
+        self._memo = {}
+
+    def _key(self, selection):
+        return tuple(selection.get(col) for col in self.levels)
+
+    def _remember(self, key, value):
+        if len(self._memo) >= MAX_CACHED_SELECTIONS:
+            self._memo.clear()
+        self._memo[key] = value
+        return value
+
+    def rows(self, selection=None):
+        """
+        Devuelve las posiciones (ordenadas) de las filas que cumplen todos los filtros
+
+        - selection: Diccionario {columna: valor}; las columnas ausentes o con None no filtran
+        """
+        selection = {col: value for col, value in (selection or {}).items()
+                     if value is not None and col in self._positions}
+        key = ('rows',) + self._key(selection)
+        cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+
+        rows = self._all_rows
+        # Empezar por el filtro más selectivo para que las intersecciones sean pequeñas
+        for col, value in sorted(selection.items(),
+                                 key=lambda item: len(self._positions[item[0]].get(item[1], ()))):
+            positions = self._positions[col].get(value)
+            if positions is None:
+                rows = np.empty(0, dtype=np.int64)
+                break
+            rows = positions if rows is self._all_rows else np.intersect1d(rows, positions, assume_unique=True)
+            if len(rows) == 0:
+                break
+
+        rows = np.asarray(rows, dtype=np.int64)
+        rows.setflags(write=False)
+        return self._remember(key, rows)
+
+    def options(self, column, selection=None):
+        """
+        Devuelve los valores disponibles (ordenados, sin nulos) de `column` para las filas
+        que cumplen los filtros de los niveles anteriores de la cascada
+        """
+        if column not in self._codes:
+            return []
+        previous = self.levels[:self.levels.index(column)]
+        selection = {col: value for col, value in (selection or {}).items() if col in previous}
+        key = ('options', column) + self._key(selection)
+        cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+
+        codes = self._codes[column]
+        rows = self.rows(selection)
+        if len(rows) < self.size:
+            codes = codes[rows]
+        present = np.unique(codes)
+        present = present[present >= 0]
+        values = self._values[column]
+        return self._remember(key, [values[code] for code in present])
@@ -7,10 +7,16 @@ import plotly.express as px
 import plotly.graph_objects as go
 from fpdf import FPDF
 import io
+import unicodedata
 from sklearn.preprocessing import MinMaxScaler
-from sklearn.metrics.pairwise import cosine_similarity
 import base64
-from common.cache import get_data, get_db_connection
+from common.cache import get_data
+from common.similarity import SimilarityIndex
+from common.filters import build_filter_mask
+from common.ann import ANN_PROBES
+from common.schema import find_column
+from common.players import PlayerDirectory, player_labels, same_player
+from common.ingest import DEFAULT_CHUNK_SIZE, stream_excel_to_parquet, iter_excel_chunks, bulk_load_sqlite
 try:
     # Imports para PDF mejorado
     from reportlab.lib.pagesizes import A4
@@ -34,142 +40,82 @@ def truncate_text(text, max_length=15):
         return text
     return text[:max_length-3] + "..."
 
+def to_latin1(text):
+    """
+    Sustituye los caracteres que no existen en latin-1 por su letra base (o '?')
+    """
+    if text.isascii():
+        return text
+    chars = []
+    for char in text:
+        if ord(char) >= 256:
+            char = unicodedata.normalize('NFKD', char)[0]
+            if ord(char) >= 256:
+                char = '?'
+        chars.append(char)
+    return ''.join(chars)
+
 # Función para convertir Excel a parquet
-def convert_excel_to_parquet(excel_path, parquet_path):
+def convert_excel_to_parquet(excel_path, parquet_path, chunk_size=DEFAULT_CHUNK_SIZE):
     """
     Convierte un archivo Excel a formato Parquet para reducir tamaño y mejorar rendimiento
+    
+    La lectura se hace en streaming (bloques de chunk_size filas), por lo que la memoria
+    necesaria no depende del tamaño del Excel
     """
     try:
-        # Leer Excel - para archivos grandes usamos chunks
-        print(f"Leyendo archivo Excel desde {excel_path}...")
-        
-        # Primero leemos solo para obtener los nombres de las columnas
-        df_cols = pd.read_excel(excel_path, engine='openpyxl', nrows=0)
-        columns = df_cols.columns.tolist()
-        print(f"Columnas en el archivo: {columns}")
-        
-        # Crear diccionario de tipos para forzar que ciertas columnas sean texto
-        dtype_dict = {}
-        for col in columns:
-            # Si la columna parece contener texto, la forzamos a string
-            if any(keyword in col.lower() for keyword in ['jugador', 'equipo', 'liga', 'país', 'pais', 'player', 'team', 'league', 'country', 'name', 'nombre']):
-                dtype_dict[col] = 'str'
-        
-        # Leer el Excel completo con los tipos especificados
-        df = pd.read_excel(excel_path, engine='openpyxl', dtype=dtype_dict)
-        
-        # Preservar las columnas importantes
-        text_cols = [col for col in df.columns if any(keyword in str(col).lower() for keyword in ['jugador', 'equipo', 'liga', 'país', 'pais', 'player', 'team', 'league', 'country', 'name', 'nombre'])]
-        
-        # Solo convertir columnas numéricas, dejando las de texto intactas
-        for col in df.columns:
-            if col not in text_cols:
-                try:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                except:
-                    pass  # Si no se puede convertir, dejarla como está
-        
-        # Reemplazar NaN con 0 solo en columnas numéricas
-        numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-        df[numeric_cols] = df[numeric_cols].fillna(0)
-        
-        # Guardar como parquet preservando el schema
-        df.to_parquet(parquet_path, index=False)
+        stream_excel_to_parquet(excel_path, parquet_path, chunk_size)
         return True
     except Exception as e:
         st.error(f"Error al convertir Excel a Parquet: {e}")
         return False
 
 # Función para convertir Excel a SQLite
-def create_sqlite_database(excel_path, db_path):
+def create_sqlite_database(excel_path, db_path, chunk_size=DEFAULT_CHUNK_SIZE):
     """
-    Crea una base de datos SQLite a partir de un archivo Excel
+    Crea una base de datos SQLite a partir de un archivo Excel leyéndolo por bloques
     """
     try:
-        import sqlite3
-        from sqlalchemy import create_engine
-        
-        # Leer Excel con tipos específicos
-        print(f"Leyendo archivo Excel desde {excel_path}...")
-        
-        # Primero leemos solo para obtener los nombres de las columnas
-        df_cols = pd.read_excel(excel_path, engine='openpyxl', nrows=0)
-        columns = df_cols.columns.tolist()
-        
-        # Crear diccionario de tipos para forzar que ciertas columnas sean texto
-        dtype_dict = {}
-        for col in columns:
-            # Si la columna parece contener texto, la forzamos a string
-            if any(keyword in col.lower() for keyword in ['jugador', 'equipo', 'liga', 'país', 'pais', 'player', 'team', 'league', 'country', 'name', 'nombre']):
-                dtype_dict[col] = 'str'
-        
-        # Leer el Excel completo con los tipos especificados
-        df = pd.read_excel(excel_path, engine='openpyxl', dtype=dtype_dict)
-        
-        # Preservar las columnas importantes
-        text_cols = [col for col in df.columns if any(keyword in str(col).lower() for keyword in ['jugador', 'equipo', 'liga', 'país', 'pais', 'player', 'team', 'league', 'country', 'name', 'nombre'])]
-        
-        # Solo convertir columnas numéricas, dejando las de texto intactas
-        for col in df.columns:
-            if col not in text_cols:
-                try:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                except:
-                    pass  # Si no se puede convertir, dejarla como está
-        
-        # Reemplazar NaN con 0 solo en columnas numéricas
-        numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-        df[numeric_cols] = df[numeric_cols].fillna(0)
-        
-        # Crear conexión SQLite
-        engine = create_engine(f'sqlite:///{db_path}')
-        
-        # Guardar DataFrame en SQLite
-        df.to_sql('players_data', engine, if_exists='replace', index=False)
-        
+        bulk_load_sqlite(iter_excel_chunks(excel_path, chunk_size), db_path)
         return True
     except Exception as e:
         st.error(f"Error al crear base de datos SQLite: {e}")
         return False
 
 # Función para generar gráfico radar para comparar jugadores
-def create_radar_chart(df, players, metrics):
+def create_radar_chart(df, players, metrics, group_stats=None):
     """
     Crea un gráfico radar para comparar jugadores basado en métricas seleccionadas
-    """
-    # Filtrar datos
-    filtered_df = df[df['player_name'].isin(players)]
     
+    - players: Posiciones (filas) de los jugadores en df
+    - group_stats: GroupStats de df (opcional). Si se proporciona, cada métrica se escala
+      respecto a la posición o liga del jugador en lugar de respecto a todos los jugadores
+    """
     # Preparar datos para el radar
     categories = metrics
     fig = go.Figure()
     
-    # Crear escala para normalizar valores
-    scaler = MinMaxScaler()
-    
-    # Preparar datos para escalar
-    scale_data = df[metrics].copy()
-    scaled_values = scaler.fit_transform(scale_data)
-    scaled_df = pd.DataFrame(scaled_values, columns=metrics)
-    
-    # Añadir información del jugador
-    scaled_df['player_name'] = df['player_name'].values
+    # Valores escalados: bloque precalculado por grupo o escala sobre todos los jugadores
+    if group_stats is not None and group_stats.has(metrics):
+        scaled_values = group_stats.scaled('minmax', metrics)
+    else:
+        scaler = MinMaxScaler()
+        scaled_values = scaler.fit_transform(df[metrics].copy())
+    scaled_values = np.asarray(scaled_values)
     
     # Añadir cada jugador al radar
-    for player in players:
-        player_data = scaled_df[scaled_df['player_name'] == player]
-        if not player_data.empty:
-            values = player_data[metrics].values.flatten().tolist()
-            # Cerrar el polígono repitiendo el primer valor
-            values.append(values[0])
-            categories_with_first = categories + [categories[0]]
-            
-            fig.add_trace(go.Scatterpolar(
-                r=values,
-                theta=categories_with_first,
-                fill='toself',
-                name=player
-            ))
+    for player, label in zip(players, player_labels(df, players)):
+        values = scaled_values[player].tolist()
+        # Cerrar el polígono repitiendo el primer valor
+        values.append(values[0])
+        categories_with_first = categories + [categories[0]]
+        
+        fig.add_trace(go.Scatterpolar(
+            r=values,
+            theta=categories_with_first,
+            fill='toself',
+            name=label
+        ))
     
     fig.update_layout(
         polar=dict(
@@ -187,81 +133,217 @@ def create_radar_chart(df, players, metrics):
     return fig
 
 # Función para encontrar jugadores similares
-def find_similar_players(df, player_name, metrics, top_n=10, filters=None):
+def find_similar_players(df, player, metrics, top_n=10, filters=None, index=None,
+                         weights=None, scaling='minmax', distance='cosine', stats=None, relative=None,
+                         probes=ANN_PROBES):
     """
     Encuentra jugadores similares basados en métricas seleccionadas
     
+    Devuelve un DataFrame con la posición (row), el nombre y la similitud de cada jugador
+    
     Parámetros:
     - df: DataFrame con datos de jugadores
-    - player_name: Nombre del jugador base
+    - player: Posición (fila) del jugador base en df
     - metrics: Lista de métricas para comparar
     - top_n: Número de jugadores similares a devolver
     - filters: Diccionario con filtros adicionales (opcional)
       Soporta: liga, equipo, posición y birth_year_range como tupla (min_year, max_year)
+    - index: SimilarityIndex precalculado para df y metrics (opcional). Si no se
+      proporciona se construye uno para esta llamada
+    - weights: Peso de cada métrica, en el orden de metrics (opcional)
+    - scaling: 'minmax' (por defecto) o 'zscore'
+    - distance: 'cosine' (por defecto), 'euclidean' o 'mahalanobis'
+    - stats: FeatureStats precalculado del dataset (opcional, ver get_feature_stats)
+    - relative: GroupStats del dataset para comparar cada métrica respecto a la posición
+      o la liga de cada jugador (opcional, ver get_group_stats)
+    - probes: Buckets vecinos por tabla que consulta el índice aproximado, si index lo tiene
+      (más = más recall y más latencia)
+    weights, scaling, distance, stats y relative solo se usan si no se proporciona index
     """
-    # Filtrar métricas relevantes
-    features_df = df[metrics].copy()
-    
-    # Normalizar datos
-    scaler = MinMaxScaler()
-    scaled_features = scaler.fit_transform(features_df)
-    
-    # Calcular similitud de coseno
-    similarity_matrix = cosine_similarity(scaled_features)
-    
-    # Obtener índice del jugador
-    player_index = df[df['player_name'] == player_name].index[0]
-    
-    # Obtener similitudes con el jugador seleccionado
-    player_similarities = similarity_matrix[player_index]
-    
-    # Crear DataFrame con similitudes
-    similarity_df = pd.DataFrame({
-        'player_name': df['player_name'],
-        'similarity_score': player_similarities
+    # Usar el índice precalculado o construir uno para esta consulta
+    if index is None:
+        index = SimilarityIndex(df[metrics], metrics, weights=weights, scaling=scaling,
+                                distance=distance, stats=stats, relative=relative)
+    
+    # Compilar los filtros en una máscara por filas: solo se puntúan los candidatos
+    mask = build_filter_mask(df, filters)
+    
+    # Excluir al jugador seleccionado (todas sus filas) y quedarse con los top_n más similares
+    mask &= ~same_player(df, player)
+    positions, scores = index.top_k(player, top_n, mask=mask, probes=probes)
+    
+    similar_players = pd.DataFrame({
+        'row': positions.astype(np.int64),
+        'player_name': df['player_name'].to_numpy()[positions],
+        'similarity_score': scores.astype(np.float64)
     })
     
-    # Aplicar filtros adicionales si se proporcionan
-    filtered_df = similarity_df.copy()
+    return similar_players
+
+# Función para obtener jugadores similares a partir de los vecinos precalculados
+def similar_from_neighbors(df, neighbors, player, top_n=10, filters=None, directory=None, size=None):
+    """
+    Obtiene los jugadores similares a partir de los vecinos precalculados (tabla player_neighbors)
     
-    if filters is not None:
-        for col, value in filters.items():
-            # Filtro para rango de año de nacimiento
-            if col == 'birth_year_range':
-                birth_min, birth_max = value
-                
-                # Buscar la columna de año de nacimiento
-                birth_column = None
-                for potential_col in df.columns:
-                    if 'año nacimiento' in potential_col.lower() or 'nacimiento' in potential_col.lower() or 'birth' in potential_col.lower():
-                        birth_column = potential_col
-                        break
-                
-                if birth_column:
-                    # Obtener jugadores dentro del rango de años de nacimiento
-                    valid_players = df[(df[birth_column] >= birth_min) & 
-                                     (df[birth_column] <= birth_max)]['player_name'].tolist()
-                    # Filtrar el dataframe de similitud
-                    filtered_df = filtered_df[filtered_df['player_name'].isin(valid_players)]
-            
-            # Filtros regulares (liga, equipo, posición, etc.)
-            elif col in df.columns:
-                # Obtener jugadores que cumplen con el filtro
-                valid_players = df[df[col] == value]['player_name'].tolist()
-                # Filtrar el dataframe de similitud
-                filtered_df = filtered_df[filtered_df['player_name'].isin(valid_players)]
-    
-    # Excluir al jugador seleccionado y ordenar por similitud
-    similar_players = filtered_df[filtered_df['player_name'] != player_name].sort_values(
-        'similarity_score', ascending=False
-    ).head(top_n)
+    Parámetros:
+    - df: DataFrame con datos de jugadores
+    - neighbors: Vecinos del jugador leídos de la base de datos (ver get_player_neighbors)
+    - player, top_n, filters: Igual que en find_similar_players
+    - directory: PlayerDirectory de df (opcional, ver get_player_directory). Si no se
+      proporciona se construye para esta llamada
+    - size: (k, jugadores) de las listas guardadas del conjunto (ver get_neighbors_size).
+      Sin él la lista se considera truncada salvo que incluya a todos los jugadores de df
+    
+    Los filtros se aplican sobre la lista ordenada de vecinos guardados. Devuelve None si no
+    hay vecinos del jugador o si tras filtrar quedan menos de top_n y la lista guardada no
+    incluye a todos los jugadores (en ese caso hay que calcular la similitud en vivo)
+    """
+    if neighbors is None or neighbors.empty:
+        return None
+    if directory is None:
+        directory = PlayerDirectory(df)
+    
+    # Los vecinos se guardan por ID; una fila con el ID repetido no es la que los tiene
+    if directory.position(directory.ids[player]) != player:
+        return None
+    scores = neighbors['similitud'].to_numpy(dtype=np.float64)
+    
+    # Posición en df de cada vecino (-1 si ya no está en los datos)
+    positions = directory.positions(neighbors['vecino_id'])
+    
+    # Aplicar los filtros y excluir al jugador seleccionado (todas sus filas)
+    mask = build_filter_mask(df, filters) & ~same_player(df, player)
+    keep = positions >= 0
+    keep[keep] = mask[positions[keep]]
+    selected = np.flatnonzero(keep)[:top_n]
+    
+    # Si la lista guardada está truncada y no hay suficientes, no se puede garantizar el top_n
+    stored_k, n_players = size or (len(positions), len(np.unique(directory.ids)))
+    truncated = len(positions) >= stored_k and stored_k < n_players - 1
+    if len(selected) < top_n and truncated:
+        return None
+    
+    return pd.DataFrame({
+        'row': positions[selected],
+        'player_name': df['player_name'].to_numpy()[positions[selected]],
+        'similarity_score': scores[selected]
+    })
+
+# Función para buscar reemplazos de varios jugadores a la vez
+def find_replacements(df, metrics, players=None, team=None, top_n=5, filters=None, index=None,
+                      same_position=True, exclude_squad=True):
+    """
+    Encuentra los top_n jugadores más parecidos para cada jugador de una lista o de un equipo
+
+    Parámetros:
+    - df: DataFrame con datos de jugadores
+    - metrics: Lista de métricas para comparar
+    - players: Posiciones (filas) de los jugadores base en df
+    - team: Equipo cuyos jugadores son los jugadores base (alternativa a players)
+    - top_n, filters, index: Igual que en find_similar_players (los filtros son comunes a todos)
+    - same_position: Buscar solo reemplazos de la misma posición que cada jugador base
+    - exclude_squad: No proponer como reemplazo a los propios jugadores base (ni, si se
+      indica team, a ningún jugador del equipo)
+
+    Todas las consultas se resuelven con productos de matrices por bloques (una pasada por
+    posición si same_position), en lugar de una búsqueda por jugador. Devuelve un DataFrame
+    con una fila por (jugador base, rango): row, player_name, rank, replacement_row,
+    replacement, similarity_score y las columnas equipo, liga y posición del reemplazo que
+    existan en df
+    """
+    if index is None:
+        index = SimilarityIndex(df[metrics], metrics)
+
+    player_names = df['player_name'].to_numpy()
+
+    # Filas de los jugadores base
+    if team is not None:
+        squad = np.flatnonzero((df['equipo'] == team).to_numpy(dtype=bool, na_value=False))
+        base_rows = squad
+    else:
+        base_rows = np.unique(np.asarray(list(players or []), dtype=np.int64))
+        squad = base_rows
+
+    # Filtros comunes a todas las consultas
+    mask = build_filter_mask(df, filters)
+    if exclude_squad:
+        mask[squad] = False
+
+    # Cada jugador base excluye todas sus filas (como en find_similar_players)
+    exclude = [np.flatnonzero(same_player(df, row)) for row in base_rows]
+
+    # Agrupar las consultas por posición para que cada grupo comparta la máscara de candidatos
+    position_column = find_column(df.columns, 'Posición')
+    if same_position and position_column is not None:
+        position_values = df[position_column].astype(object).to_numpy()
+        groups = pd.Series(np.arange(len(base_rows))).groupby(position_values[base_rows], sort=False, dropna=False).indices
+        groups = [(rows, mask & (position_values == position_values[base_rows[rows[0]]]))
+                  for rows in groups.values()]
+    else:
+        groups = [(np.arange(len(base_rows)), mask)]
+
+    positions = np.full((len(base_rows), top_n), -1, dtype=np.int64)
+    scores = np.full((len(base_rows), top_n), -np.inf, dtype=np.float32)
+    for rows, group_mask in groups:
+        group_positions, group_scores = index.top_k_batch(
+            base_rows[rows], top_n, mask=group_mask, exclude=[exclude[row] for row in rows])
+        positions[rows, :group_positions.shape[1]] = group_positions
+        scores[rows, :group_scores.shape[1]] = group_scores
+
+    # Resultado combinado: una fila por (jugador base, rango) con reemplazo válido
+    source, rank = np.nonzero(positions >= 0)
+    targets = positions[source, rank]
+    replacements = pd.DataFrame({
+        'row': base_rows[source],
+        'player_name': player_names[base_rows[source]],
+        'rank': rank + 1,
+        'replacement_row': targets,
+        'replacement': player_names[targets],
+        'similarity_score': scores[source, rank].astype(np.float64)
+    })
+    for col in ['equipo', 'liga', position_column]:
+        if col is not None and col in df.columns:
+            replacements[col] = df[col].to_numpy()[targets]
+
+    return replacements
+
+# Función para preparar los reemplazos en el formato de export_to_pdf
+def replacements_pdf_data(replacements):
+    """
+    Convierte el resultado de find_replacements en el diccionario player_data de export_to_pdf:
+    un encabezado por jugador base seguido de sus reemplazos con la similitud
+    """
+    player_data = {}
+    for number, (_, group) in enumerate(replacements.groupby('row', sort=False), start=1):
+        player_data[f"Jugador {number}"] = group['player_name'].iloc[0]
+        for row in group.itertuples(index=False):
+            team = f" ({row.equipo})" if 'equipo' in group.columns else ""
+            player_data[f"{number}.{row.rank} - {row.rank}. {row.replacement}{team}"] = f"{row.similarity_score:.2f}"
+    return player_data
+
+# Función para obtener la tabla de percentiles de varios jugadores
+def percentile_frame(df, percentiles, players, metrics):
+    """
+    Devuelve un DataFrame (jugadores x métricas) con el percentil de cada jugador en su
+    posición y liga, leído de la tabla precalculada (NaN si al jugador le falta la métrica)
     
-    return similar_players
+    - players: Posiciones (filas) de los jugadores en df; el índice del resultado es el
+      texto de cada jugador (ver player_labels)
+    """
+    players = list(players)
+    metrics = [metric for metric in metrics if percentiles.has([metric])]
+    return pd.DataFrame(
+        percentiles.lookup(players, metrics),
+        index=pd.Index(player_labels(df, players), name='player_name'),
+        columns=metrics
+    )
 
 # Función para exportar a PDF
 def export_to_pdf(player_data, chart_img=None, title="Informe de Jugador", df=None, selected_players=None, selected_metrics=None):
     """
     Exporta datos de jugadores a un archivo PDF con tema oscuro
+    
+    - selected_players: Posiciones (filas) en df de los jugadores de la tabla comparativa
     """
     # Crear un objeto FPDF para el tema oscuro
     class PDF(FPDF):
@@ -276,6 +358,13 @@ def export_to_pdf(player_data, chart_img=None, title="Informe de Jugador", df=No
             self.set_font('Arial', 'I', 8)
             self.set_text_color(200, 200, 200)  # Texto gris claro
             self.cell(0, 10, '© 2024 Scouting Players | Desarrollado para el Máster en Big Data Deportivo', 0, 0, 'C')
+        
+        def normalize_text(self, txt):
+            # Las fuentes básicas solo admiten latin-1: los caracteres que no lo son
+            # (p. ej. 'ć' o 'Ż' en nombres de jugadores) se sustituyen por su letra base
+            if isinstance(txt, str):
+                txt = to_latin1(txt)
+            return super().normalize_text(txt)
     
     # Inicializar el PDF con tema oscuro
     pdf = PDF()
@@ -286,26 +375,24 @@ def export_to_pdf(player_data, chart_img=None, title="Informe de Jugador", df=No
     pdf.set_font("Arial", 'B', 16)
     pdf.set_text_color(255, 255, 255)  # Texto blanco
     
-    if selected_players and len(selected_players) > 2:
+    selected_players = list(selected_players) if selected_players is not None else []
+    selected_labels = player_labels(df, selected_players) if df is not None and selected_players else []
+    
+    if len(selected_players) > 2 and selected_labels:
         # Primera línea del título
         title_line1 = "Comparación de Jugadores"
         pdf.cell(0, 10, txt=title_line1, ln=True, align="C")
         
         # Segunda línea: nombres de jugadores (hasta 60 caracteres)
-        players_text = ", ".join(selected_players)
+        players_text = ", ".join(selected_labels)
         if len(players_text) > 60:
             players_text = players_text[:57] + "..."
-            
-        # Limpiar el texto para evitar caracteres problemáticos
-        players_text = players_text.replace("ó", "o").replace("á", "a").replace("é", "e").replace("í", "i").replace("ú", "u")
-        players_text = players_text.replace("Ó", "O").replace("Á", "A").replace("É", "E").replace("Í", "I").replace("Ú", "U")
         
+        # Los acentos se conservan: normalize_text solo sustituye lo que no existe en latin-1
         pdf.cell(0, 10, txt=players_text, ln=True, align="C")
     else:
         # Título en una sola línea para pocos jugadores
-        title_safe = title.replace("ó", "o").replace("á", "a").replace("é", "e").replace("í", "i").replace("ú", "u")
-        title_safe = title_safe.replace("Ó", "O").replace("Á", "A").replace("É", "E").replace("Í", "I").replace("Ú", "U")
-        pdf.cell(0, 15, txt=title_safe, ln=True, align="C")
+        pdf.cell(0, 15, txt=title, ln=True, align="C")
     
     # Añadir imagen del gráfico
     if chart_img:
@@ -385,9 +472,6 @@ def export_to_pdf(player_data, chart_img=None, title="Informe de Jugador", df=No
             pdf.cell(0, 10, txt="TABLA COMPARATIVA", ln=True, align="C")
             pdf.ln(5)
             
-            # Filtrar solo los jugadores seleccionados
-            comparison_df = df[df['player_name'].isin(selected_players)]
-            
             # Preparar los datos para la tabla
             table_data = []
             # Encabezados
@@ -396,16 +480,12 @@ def export_to_pdf(player_data, chart_img=None, title="Informe de Jugador", df=No
             table_data.append(display_headers)
             
             # Filas con datos de cada jugador
-            for player in selected_players:
-                player_df = comparison_df[comparison_df['player_name'] == player]
-                if not player_df.empty:
-                    player_name_truncated = truncate_text(player, 20)
-                    row = [player_name_truncated]
-                    for metric in selected_metrics:
-                        if metric in player_df.columns:
-                            value = player_df[metric].values[0]
-                            row.append(f"{value:.2f}")
-                    table_data.append(row)
+            metric_values = {metric: df[metric].to_numpy() for metric in selected_metrics if metric in df.columns}
+            for player, label in zip(selected_players, selected_labels):
+                row = [truncate_text(label, 20)]
+                for values in metric_values.values():
+                    row.append(f"{values[player]:.2f}")
+                table_data.append(row)
             
             # Calcular anchos de columnas
             col_width = 180 / len(headers)
@@ -461,18 +541,43 @@ def get_pdf_download_link(pdf_bytes, filename, text):
     href = f'<a href="data:application/pdf;base64,{b64}" download="{filename}" style="text-decoration:none;color:#3366ff;font-weight:bold;display:flex;align-items:center;justify-content:center;">{text}</a>'
     return href
 
-def create_radar_chart_unified(df, players, metrics, colors=None):
+def create_radar_chart_unified(df, players, metrics, colors=None, group_stats=None, percentiles=None):
     """
     Crea un gráfico radar con estilo unificado para toda la aplicación
     - Tema oscuro con fondo negro y líneas blancas
     - Colores consistentes para jugadores
     - Mayor contraste para mejor visualización
+    
+    - players: Posiciones (filas) de los jugadores en df; cada traza se llama con el texto
+      del jugador (ver player_labels)
+    - group_stats: GroupStats de df (opcional). Si se proporciona, cada valor se escala
+      entre el mínimo y el máximo de la posición o liga del jugador
+    - percentiles: PercentileTable de df (opcional). Si se proporciona, cada valor es el
+      percentil del jugador en su posición y liga (tiene prioridad sobre group_stats)
+    Sin ninguno de los dos, los valores se escalan respecto al máximo de los jugadores
+    seleccionados
     """
-    # Filtrar datos
-    filtered_df = df[df['player_name'].isin(players)]
+    # Valores de cada jugador (una fila por jugador): percentiles (0-1), métricas escaladas
+    # dentro del grupo o métricas divididas por el máximo de los jugadores seleccionados
+    players = list(players)
+    metrics = list(metrics)
+    if percentiles is not None and percentiles.has(metrics):
+        # Sin dato no hay percentil: la métrica se dibuja en el centro del radar (0)
+        values = np.nan_to_num(percentiles.lookup(players, metrics) / 100, nan=0.0)
+    elif group_stats is not None and group_stats.has(metrics):
+        values = group_stats.lookup(players, metrics)
+    else:
+        selected_values = df[metrics].iloc[players].to_numpy(dtype=np.float64)
+        max_values = selected_values.max(axis=0, initial=0)
+        # Las métricas con máximo 0 (o negativo) quedan a 0 para evitar dividir por cero
+        values = np.divide(selected_values, max_values, out=np.zeros_like(selected_values),
+                           where=max_values > 0)
+    
+    # Cerrar cada polígono repitiendo el primer valor
+    values = np.asarray(values, dtype=np.float64)
+    values = np.concatenate([values, values[:, :1]], axis=1).tolist()
+    categories_with_first = metrics + [metrics[0]]
     
-    # Preparar datos para el radar
-    categories = metrics
     fig = go.Figure()
     
     # Definir colores específicos para todos los jugadores en la aplicación
@@ -496,43 +601,23 @@ def create_radar_chart_unified(df, players, metrics, colors=None):
         'rgb(139,0,0)',      # rojo oscuro    
     ]
     
-    # Calcular valores máximos para cada métrica considerando solo los jugadores seleccionados
-    max_values = {}
-    for metric in metrics:
-        max_values[metric] = filtered_df[metric].max()
-    
     # Añadir cada jugador al radar
-    for i, player in enumerate(players):
-        player_data = filtered_df[filtered_df['player_name'] == player]
-        if not player_data.empty:
-            # Normalizar valores en relación al máximo de cada métrica
-            values = []
-            for metric in metrics:
-                player_value = player_data[metric].values[0]
-                max_value = max_values[metric]
-                # Evitar división por cero
-                normalized_value = player_value / max_value if max_value > 0 else 0
-                values.append(normalized_value)
-            
-            # Cerrar el polígono repitiendo el primer valor
-            values.append(values[0])
-            categories_with_first = categories + [categories[0]]
-            
-            # Seleccionar color para este jugador
-            # Intentar asignar colores consistentes por posición en la lista
-            player_color = default_colors[i % len(default_colors)]
-            
-            # Crear versión más transparente para el relleno
-            fill_color = player_color.replace('rgb', 'rgba').replace(')', ',0.15)')
-            
-            fig.add_trace(go.Scatterpolar(
-                r=values,
-                theta=categories_with_first,
-                fill='toself',
-                name=player,
-                line=dict(color=player_color, width=3),  # Línea más gruesa para el contorno
-                fillcolor=fill_color                   # Relleno más transparente
-            ))
+    for i, label in enumerate(player_labels(df, players)):
+        # Seleccionar color para este jugador
+        # Intentar asignar colores consistentes por posición en la lista
+        player_color = default_colors[i % len(default_colors)]
+        
+        # Crear versión más transparente para el relleno
+        fill_color = player_color.replace('rgb', 'rgba').replace(')', ',0.15)')
+        
+        fig.add_trace(go.Scatterpolar(
+            r=values[i],
+            theta=categories_with_first,
+            fill='toself',
+            name=label,
+            line=dict(color=player_color, width=3),  # Línea más gruesa para el contorno
+            fillcolor=fill_color                   # Relleno más transparente
+        ))
     
     # Configurar tema oscuro
     fig.update_layout(
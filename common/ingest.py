@@ -0,0 +1,673 @@
+import os
+import sys
+import time
+import sqlite3
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from common.schema import apply_schema, arrow_schema, get_column_spec, PLAYER_ID_COLUMN, PLAYER_KEY_COLUMNS
+from common.derived import add_derived_metrics
+from common.players import add_player_ids, player_ids
+from common.storage import EXCEL_PATH, dataset_paths, current_version, prepare_version, publish_version, discard_version
+
+# Número de filas por bloque (y por row group de Parquet) en la ingesta en streaming
+DEFAULT_CHUNK_SIZE = 5000
+
+# Columnas de players_data que se indexan en SQLite
+SQLITE_INDEXED_COLUMNS = ['Jugador', 'Liga', 'Equipo', 'Posición', 'Año nacimiento']
+
+
+def peak_rss_mb():
+    """
+    Devuelve el pico de memoria residente (RSS) del proceso en MB, o None si no se puede medir
+    """
+    try:
+        import resource
+    except ImportError:
+        # resource no existe en Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo expresa en KB y macOS en bytes
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def print_ingest_stats(rows, elapsed, label="Ingesta"):
+    """
+    Imprime filas por segundo y pico de memoria al final de una ingesta
+    """
+    rows_per_second = rows / elapsed if elapsed > 0 else float('inf')
+    peak = peak_rss_mb()
+    peak_text = f"{peak:.1f} MB" if peak is not None else "no disponible"
+    print(f"{label} completada: {rows} filas en {elapsed:.2f} s "
+          f"({rows_per_second:,.0f} filas/s) | Pico de memoria RSS: {peak_text}")
+
+
+def _unique_column_names(header):
+    """
+    Genera nombres de columna únicos igual que pandas.read_excel ('Col', 'Col.1', ...)
+    """
+    columns = []
+    seen = {}
+    for i, name in enumerate(header):
+        name = f"Unnamed: {i}" if name is None else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def iter_excel_chunks(excel_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Lee la primera hoja de un Excel en modo solo lectura y devuelve bloques de filas como
+    DataFrames ya tipados según el registro de common.schema, con las métricas derivadas
+    (por 90 minutos, cocientes y proporciones) calculadas y el ID estable de cada jugador
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        columns = _unique_column_names(header)
+
+        buffer = []
+        for row in rows:
+            # Ignorar filas completamente vacías
+            if all(value is None for value in row):
+                continue
+            buffer.append(row[:len(columns)])
+            if len(buffer) >= chunk_size:
+                yield add_player_ids(add_derived_metrics(apply_schema(pd.DataFrame.from_records(buffer, columns=columns))))
+                buffer = []
+
+        if buffer:
+            yield add_player_ids(add_derived_metrics(apply_schema(pd.DataFrame.from_records(buffer, columns=columns))))
+    finally:
+        workbook.close()
+
+
+def stream_excel_to_parquet(excel_path, parquet_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Convierte un Excel a Parquet en streaming: lee bloques de `chunk_size` filas y escribe
+    cada uno como un row group, de modo que el pico de memoria depende del tamaño de
+    bloque y no del tamaño del archivo
+
+    Devuelve el número de filas escritas
+    """
+    print(f"Convirtiendo {excel_path} a Parquet en bloques de {chunk_size} filas...")
+    start_time = time.time()
+
+    # Escribir en un archivo temporal y sustituir al final para no dejar Parquet a medias
+    tmp_path = f"{parquet_path}.tmp"
+    writer = None
+    schema = None
+    total_rows = 0
+
+    try:
+        for chunk in iter_excel_chunks(excel_path, chunk_size):
+            if writer is None:
+                schema = arrow_schema(chunk.columns)
+                writer = pq.ParquetWriter(tmp_path, schema)
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            writer.write_table(table)
+            total_rows += len(chunk)
+    except Exception:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if writer is None:
+        raise ValueError(f"El archivo {excel_path} no contiene datos")
+
+    writer.close()
+    os.replace(tmp_path, parquet_path)
+
+    print_ingest_stats(total_rows, time.time() - start_time, "Conversión a Parquet")
+    return total_rows
+
+
+def iter_parquet_batches(parquet_path, batch_size=DEFAULT_CHUNK_SIZE):
+    """
+    Recorre un archivo Parquet en bloques de `batch_size` filas como DataFrames
+    """
+    parquet_file = pq.ParquetFile(parquet_path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield batch.to_pandas()
+
+
+def _quote(name):
+    """
+    Entrecomilla un identificador de SQLite
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sqlite_type(column):
+    """
+    Tipo de SQLite para una columna según el registro de common.schema
+    """
+    spec = get_column_spec(column)
+    if spec.is_text:
+        return 'TEXT'
+    return 'INTEGER' if spec.dtype == 'int64' else 'REAL'
+
+
+def _sqlite_rows(frame):
+    """
+    Devuelve las filas de un DataFrame como tuplas de valores nativos para executemany
+    """
+    columns = []
+    for col in frame.columns:
+        values = frame[col]
+        if get_column_spec(col).is_text:
+            # Los nulos de pandas (NaN/NA) se guardan como NULL
+            values = values.astype(object).where(values.notna(), None)
+        columns.append(values)
+    return zip(*columns)
+
+
+def _create_key_index(conn, table_name, columns):
+    """
+    Crea (si no existe) el índice único sobre PLAYER_KEY_COLUMNS
+
+    Devuelve False si la tabla no tiene esas columnas o contiene claves duplicadas
+    """
+    if not all(col in columns for col in PLAYER_KEY_COLUMNS):
+        return False
+    key_list = ", ".join(_quote(col) for col in PLAYER_KEY_COLUMNS)
+    try:
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote(f'idx_{table_name}_clave')} "
+                     f"ON {_quote(table_name)} ({key_list})")
+        return True
+    except sqlite3.IntegrityError:
+        print(f"ADVERTENCIA: claves de jugador duplicadas en '{table_name}'; "
+              "la ingesta incremental no estará disponible")
+        return False
+
+
+def bulk_load_sqlite(frames, db_path, table_name='players_data', index_columns=SQLITE_INDEXED_COLUMNS):
+    """
+    Crea (o reemplaza) una tabla SQLite a partir de una secuencia de DataFrames
+
+    - Inserta por lotes con executemany dentro de una única transacción
+    - Usa PRAGMAs ajustados para la carga masiva
+    - Crea índices en las columnas de búsqueda habituales y ejecuta ANALYZE
+    - Deja la base de datos en modo WAL: los lectores siguen viendo la versión anterior
+      hasta que la transacción termina, por lo que una reconstrucción no los bloquea
+
+    Devuelve el número de filas insertadas
+    """
+    print(f"Cargando datos en la tabla '{table_name}' de {db_path}...")
+    start_time = time.time()
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    total_rows = 0
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-65536")  # 64 MB de caché de páginas
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = None
+            for frame in frames:
+                if columns is None:
+                    columns = list(frame.columns)
+                    column_defs = ", ".join(f"{_quote(col)} {_sqlite_type(col)}" for col in columns)
+                    conn.execute(f"DROP TABLE IF EXISTS {_quote(table_name)}")
+                    conn.execute(f"CREATE TABLE {_quote(table_name)} ({column_defs})")
+                    insert_sql = (f"INSERT INTO {_quote(table_name)} VALUES "
+                                  f"({', '.join('?' for _ in columns)})")
+
+                conn.executemany(insert_sql, _sqlite_rows(frame[columns]))
+                total_rows += len(frame)
+
+            if columns is None:
+                raise ValueError("No hay datos para cargar en SQLite")
+
+            # Índices para las búsquedas por jugador, liga, equipo, posición y edad
+            for col in index_columns:
+                if col in columns:
+                    index_name = f"idx_{table_name}_{col}".lower().replace(' ', '_')
+                    conn.execute(f"CREATE INDEX {_quote(index_name)} "
+                                 f"ON {_quote(table_name)} ({_quote(col)})")
+
+            # Índice único por identidad del jugador, necesario para la ingesta incremental
+            _create_key_index(conn, table_name, columns)
+
+            conn.execute("ANALYZE")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+    print_ingest_stats(total_rows, time.time() - start_time, "Carga en SQLite")
+    return total_rows
+
+
+def parquet_to_sqlite(parquet_path, db_path, table_name='players_data', batch_size=DEFAULT_CHUNK_SIZE):
+    """
+    Carga un archivo Parquet en una tabla SQLite sin leerlo entero en memoria
+    """
+    return bulk_load_sqlite(iter_parquet_batches(parquet_path, batch_size), db_path, table_name)
+
+
+def write_parquet(df, parquet_path):
+    """
+    Escribe un DataFrame ya tipado a Parquet de forma atómica (archivo temporal + sustitución)
+    """
+    tmp_path = f"{parquet_path}.tmp"
+    table = pa.Table.from_pandas(df, schema=arrow_schema(df.columns), preserve_index=False)
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, parquet_path)
+
+
+def row_keys(frame):
+    """
+    Devuelve la clave de identidad (PLAYER_KEY_COLUMNS) de cada fila como tupla
+    """
+    return list(zip(*(frame[col] for col in PLAYER_KEY_COLUMNS)))
+
+
+def row_hashes(frame):
+    """
+    Devuelve un hash de contenido (uint64) por fila
+
+    Las columnas de texto se hashean por su valor, de modo que el resultado es el mismo
+    tanto si vienen como categoría (Parquet) como si vienen como texto (Excel)
+    """
+    canonical = frame.astype({col: object for col in frame.columns if get_column_spec(col).is_text})
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+
+
+def build_manifest(frames):
+    """
+    Construye el manifiesto (clave de jugador + hash de la fila) de una secuencia de DataFrames
+    """
+    parts = []
+    for frame in frames:
+        part = frame[PLAYER_KEY_COLUMNS].astype(object).copy()
+        part['row_hash'] = row_hashes(frame)
+        parts.append(part)
+    if not parts:
+        return pd.DataFrame(columns=PLAYER_KEY_COLUMNS + ['row_hash'])
+    return pd.concat(parts, ignore_index=True)
+
+
+def write_manifest(manifest, manifest_path):
+    """
+    Guarda el manifiesto de hashes en Parquet de forma atómica
+    """
+    tmp_path = f"{manifest_path}.tmp"
+    manifest = manifest.astype({'row_hash': 'uint64'})
+    manifest.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def read_manifest(manifest_path):
+    """
+    Lee el manifiesto de hashes, o devuelve None si no existe
+    """
+    if not os.path.exists(manifest_path):
+        return None
+    return pd.read_parquet(manifest_path)
+
+
+def compute_changes(chunks, manifest):
+    """
+    Compara una nueva exportación (en bloques) con el manifiesto de la anterior
+
+    Las filas se emparejan por el ID del jugador (ver common.players), con operaciones por
+    columnas. Solo se mantienen en memoria las filas insertadas o modificadas. Devuelve un
+    diccionario con:
+    - 'changed': DataFrame con las filas insertadas o modificadas
+    - 'inserted', 'updated': número de filas insertadas y modificadas
+    - 'deleted': lista de claves que ya no están en la exportación
+    - 'deleted_ids': IDs de esas claves
+    - 'manifest': manifiesto de la nueva exportación
+    - 'columns': columnas de la nueva exportación
+    """
+    previous_ids = pd.Index(player_ids(manifest))
+    if previous_ids.has_duplicates:
+        raise ValueError("El manifiesto anterior contiene claves de jugador duplicadas")
+    previous_hashes = manifest['row_hash'].to_numpy(dtype=np.uint64)
+    changed_parts = []
+    manifest_parts = []
+    id_parts = []
+    inserted = updated = 0
+    columns = None
+
+    for chunk in chunks:
+        columns = list(chunk.columns)
+        ids = player_ids(chunk)
+        hashes = row_hashes(chunk)
+
+        positions = previous_ids.get_indexer(ids)
+        is_new = positions < 0
+        is_updated = ~is_new & (previous_hashes[positions] != hashes)
+        inserted += int(is_new.sum())
+        updated += int(is_updated.sum())
+
+        changed_parts.append(chunk[is_new | is_updated])
+        part = chunk[PLAYER_KEY_COLUMNS].astype(object).copy()
+        part['row_hash'] = hashes
+        manifest_parts.append(part)
+        id_parts.append(ids)
+
+    if columns is None:
+        raise ValueError("La nueva exportación no contiene datos")
+
+    new_manifest = pd.concat(manifest_parts, ignore_index=True)
+    new_ids = pd.Index(np.concatenate(id_parts))
+    if new_ids.has_duplicates:
+        raise ValueError("La exportación contiene claves de jugador duplicadas")
+
+    deleted = ~previous_ids.isin(new_ids)
+    return {
+        'changed': pd.concat(changed_parts, ignore_index=True),
+        'inserted': inserted,
+        'updated': updated,
+        'deleted': row_keys(manifest[deleted]),
+        'deleted_ids': previous_ids.to_numpy()[deleted],
+        'manifest': new_manifest,
+        'columns': columns,
+    }
+
+
+def apply_changes_to_sqlite(db_path, changes, table_name='players_data'):
+    """
+    Aplica los cambios a SQLite en una única transacción: upsert de las filas insertadas o
+    modificadas y borrado de las eliminadas
+    """
+    changed = changes['changed']
+    columns = changes['columns']
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        table_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table_name)})")]
+        if table_columns != columns:
+            raise ValueError(f"Las columnas de '{table_name}' no coinciden con la exportación")
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not _create_key_index(conn, table_name, columns):
+                raise ValueError(f"La tabla '{table_name}' no tiene una clave de jugador única")
+
+            key_list = ", ".join(_quote(col) for col in PLAYER_KEY_COLUMNS)
+            key_condition = " AND ".join(f"{_quote(col)} = ?" for col in PLAYER_KEY_COLUMNS)
+            conn.executemany(f"DELETE FROM {_quote(table_name)} WHERE {key_condition}",
+                             changes['deleted'])
+
+            updates = ", ".join(f"{_quote(col)} = excluded.{_quote(col)}"
+                                for col in columns if col not in PLAYER_KEY_COLUMNS)
+            conn.executemany(
+                f"INSERT INTO {_quote(table_name)} ({', '.join(_quote(col) for col in columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT ({key_list}) DO UPDATE SET {updates}",
+                _sqlite_rows(changed[columns])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        # Actualizar estadísticas del planificador solo si hace falta
+        conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+
+
+def apply_changes_to_parquet(parquet_path, changes):
+    """
+    Aplica los cambios al archivo Parquet
+
+    Las filas sin cambios se copian del Parquet anterior (sin volver a leer el Excel) y
+    el resultado conserva el orden de la nueva exportación. Se trabaja con tablas Arrow y
+    se empareja por ID de jugador, sin convertir el Parquet a pandas
+    """
+    previous = pq.read_table(parquet_path)
+    if previous.column_names != changes['columns']:
+        raise ValueError("Las columnas del Parquet no coinciden con la exportación")
+    schema = arrow_schema(changes['columns'])
+    changed = pa.Table.from_pandas(changes['changed'], schema=schema, preserve_index=False)
+
+    # Quitar las filas modificadas o eliminadas
+    replaced = pa.array(np.concatenate([_table_ids(changed), changes['deleted_ids']]), type=pa.int64())
+    kept = previous.filter(pc.invert(pc.is_in(pa.array(_table_ids(previous)), value_set=replaced)))
+    merged = pa.concat_tables([kept.cast(schema), changed])
+
+    # Reordenar según la nueva exportación
+    position = pd.Index(player_ids(changes['manifest'])).get_indexer(_table_ids(merged))
+    merged = merged.take(pa.array(np.argsort(position, kind='stable')))
+
+    tmp_path = f"{parquet_path}.tmp"
+    pq.write_table(merged, tmp_path)
+    os.replace(tmp_path, parquet_path)
+
+
+def _table_ids(table):
+    """
+    IDs de jugador de una tabla Arrow (la columna del ID o, si no la tiene, calculados)
+    """
+    if PLAYER_ID_COLUMN in table.column_names:
+        return table[PLAYER_ID_COLUMN].to_numpy()
+    return player_ids(table.select(PLAYER_KEY_COLUMNS).to_pandas())
+
+
+def full_ingest(excel_path, parquet_path, db_path, manifest_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Reconstruye Parquet, SQLite y el manifiesto de hashes desde el Excel
+    """
+    stream_excel_to_parquet(excel_path, parquet_path, chunk_size)
+    parquet_to_sqlite(parquet_path, db_path, batch_size=chunk_size)
+    write_manifest(build_manifest(iter_parquet_batches(parquet_path, chunk_size)), manifest_path)
+
+
+def incremental_ingest(excel_path, parquet_path, db_path, manifest_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Ingesta incremental: detecta las filas insertadas, modificadas y eliminadas respecto a la
+    exportación anterior (usando el manifiesto de hashes por jugador) y aplica solo esos
+    cambios a Parquet y SQLite
+
+    Si no hay manifiesto o datos previos, o la estructura cambió, se hace una
+    reconstrucción completa. Devuelve un diccionario con el número de cambios y las claves
+    de las filas insertadas o modificadas ('changed_keys')
+    """
+    start_time = time.time()
+    manifest = read_manifest(manifest_path)
+
+    if manifest is None or not os.path.exists(parquet_path) or not os.path.exists(db_path):
+        print("No hay una ingesta previa completa: se reconstruyen todos los datos")
+        full_ingest(excel_path, parquet_path, db_path, manifest_path, chunk_size)
+        return {'full_rebuild': True}
+
+    try:
+        changes = compute_changes(iter_excel_chunks(excel_path, chunk_size), manifest)
+        print(f"Cambios detectados: {changes['inserted']} insertados, {changes['updated']} "
+              f"actualizados, {len(changes['deleted'])} eliminados")
+
+        if changes['inserted'] or changes['updated'] or changes['deleted']:
+            apply_changes_to_parquet(parquet_path, changes)
+            apply_changes_to_sqlite(db_path, changes)
+        write_manifest(changes['manifest'], manifest_path)
+    except ValueError as e:
+        print(f"No es posible aplicar la ingesta incremental ({e}): se reconstruyen todos los datos")
+        full_ingest(excel_path, parquet_path, db_path, manifest_path, chunk_size)
+        return {'full_rebuild': True}
+
+    print_ingest_stats(len(changes['manifest']), time.time() - start_time, "Ingesta incremental")
+    return {
+        'full_rebuild': False,
+        'inserted': changes['inserted'],
+        'updated': changes['updated'],
+        'deleted': len(changes['deleted']),
+        'changed_keys': row_keys(changes['changed']),
+    }
+
+
+# Archivos derivados de cada versión, en el orden en que se generan
+VERSION_ARTIFACTS = ('ann', 'neighbors', 'search', 'percentiles', 'partitioned', 'snapshot')
+
+
+def missing_artifacts(paths):
+    """
+    Devuelve los archivos derivados (ver VERSION_ARTIFACTS) que faltan en una versión
+    """
+    from common.ann import ANN_MIN_ROWS
+    from common.neighbors import NEIGHBORS_TABLE
+    from common.search import SEARCH_TABLE
+
+    tables = set()
+    if os.path.exists(paths['db']):
+        conn = sqlite3.connect(paths['db'])
+        try:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        finally:
+            conn.close()
+
+    present = {
+        # El índice aproximado solo se genera para datasets grandes
+        'ann': os.path.isdir(paths['ann']) or pq.read_metadata(paths['parquet']).num_rows < ANN_MIN_ROWS,
+        'neighbors': NEIGHBORS_TABLE in tables,
+        'search': SEARCH_TABLE in tables,
+        'percentiles': os.path.exists(paths['percentiles']),
+        'partitioned': os.path.isdir(paths['partitioned']),
+        'snapshot': os.path.exists(paths['snapshot']),
+    }
+    return [artifact for artifact in VERSION_ARTIFACTS if not present[artifact]]
+
+
+def build_version_artifacts(paths, artifacts=VERSION_ARTIFACTS, k=None, workers=None):
+    """
+    Genera los archivos derivados de una versión (índices precalculados) a partir de su Parquet
+
+    - artifacts: Cuáles se generan (por defecto todos, ver VERSION_ARTIFACTS)
+    - k, workers: Vecinos por jugador e hilos de cálculo de la tabla player_neighbors
+    """
+    from common.ann import build_ann_index
+    from common.neighbors import build_neighbors_table, NEIGHBORS_K
+    from common.percentiles import build_percentile_table
+    from common.partitions import build_partitioned_dataset
+    from common.snapshot import build_arrow_snapshot
+    from common.search import build_search_table
+
+    # Índices aproximados de los conjuntos de métricas con nombre (solo datasets grandes)
+    if 'ann' in artifacts:
+        start = time.perf_counter()
+        built = build_ann_index(paths['parquet'], paths['ann'])
+        if built is not None:
+            print(f"Índices aproximados de similitud: {built} en {time.perf_counter() - start:.1f}s")
+
+    # Vecinos precalculados de los conjuntos de métricas con nombre
+    if 'neighbors' in artifacts:
+        start = time.perf_counter()
+        rows = build_neighbors_table(paths['parquet'], paths['db'], k=k or NEIGHBORS_K, workers=workers)
+        print(f"Tabla player_neighbors: {rows} filas en {time.perf_counter() - start:.1f}s")
+
+    # Índice de búsqueda por jugador, equipo y nacionalidad (se rehace también tras una
+    # ingesta incremental, que modifica players_data)
+    if 'search' in artifacts:
+        start = time.perf_counter()
+        rows = build_search_table(paths['db'])
+        print(f"Índice de búsqueda: {rows} filas en {time.perf_counter() - start:.1f}s")
+
+    # Percentiles de cada métrica por posición y liga
+    if 'percentiles' in artifacts:
+        start = time.perf_counter()
+        rows = build_percentile_table(paths['parquet'], paths['percentiles'])
+        print(f"Tabla de percentiles: {rows} filas en {time.perf_counter() - start:.1f}s")
+
+    # Copia particionada por liga y temporada para las lecturas filtradas
+    if 'partitioned' in artifacts:
+        start = time.perf_counter()
+        rows = build_partitioned_dataset(paths['parquet'], paths['partitioned'])
+        print(f"Dataset particionado: {rows} filas en {time.perf_counter() - start:.1f}s")
+
+    # Instantánea Arrow IPC sin comprimir que la aplicación proyecta en memoria
+    if 'snapshot' in artifacts:
+        start = time.perf_counter()
+        rows = build_arrow_snapshot(paths['parquet'], paths['snapshot'])
+        print(f"Instantánea Arrow: {rows} filas en {time.perf_counter() - start:.1f}s")
+
+
+def update_version_artifacts(paths, previous_paths, changed_keys):
+    """
+    Actualiza los archivos derivados de una versión tras una ingesta incremental
+
+    Solo se actualizan por partes los que dependen de cada jugador por separado y son caros
+    de reconstruir: los vecinos precalculados (ver update_neighbors_table) y las filas de
+    la tabla de búsqueda de las claves cambiadas. Percentiles, dataset particionado,
+    instantánea Arrow e índices aproximados se reconstruyen enteros: son lineales en el
+    número de jugadores (una lectura del Parquet) y, además, un solo cambio puede mover los
+    percentiles de todo su grupo y el orden de todas las filas
+    """
+    from common.neighbors import update_neighbors_table
+    from common.search import update_search_table
+
+    start = time.perf_counter()
+    rows = update_neighbors_table(previous_paths['parquet'], paths['parquet'], paths['db'])
+    print(f"Tabla player_neighbors: {rows} filas escritas en {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    rows = update_search_table(paths['db'], changed_keys)
+    print(f"Índice de búsqueda: {rows} filas actualizadas en {time.perf_counter() - start:.1f}s")
+
+    build_version_artifacts(paths, ['ann', 'percentiles', 'partitioned', 'snapshot'])
+
+
+def ingest_new_version(excel_path=EXCEL_PATH, full=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Genera una nueva versión del dataset en su propia carpeta y la publica de forma atómica
+
+    La versión parte de los archivos de la versión publicada, de modo que la ingesta
+    incremental solo aplica los cambios. Si algo falla (o no hay cambios), la versión se
+    descarta y la aplicación sigue sirviendo la anterior. Devuelve el nombre de la versión
+    publicada
+    """
+    previous = current_version()
+    version, paths = prepare_version()
+    try:
+        result = {'full_rebuild': True}
+        if full:
+            full_ingest(excel_path, paths['parquet'], paths['db'], paths['manifest'], chunk_size)
+        else:
+            result = incremental_ingest(excel_path, paths['parquet'], paths['db'], paths['manifest'], chunk_size)
+            unchanged = not result['full_rebuild'] and not (
+                result['inserted'] or result['updated'] or result['deleted'])
+            # Sin cambios no se publica nada, así la aplicación no recarga datos idénticos
+            if unchanged and previous is not None:
+                discard_version(version)
+                print(f"Sin cambios: se mantiene la versión {previous}")
+                return previous
+
+        # Índices precalculados de la nueva versión: tras una ingesta incremental se
+        # actualizan los de la versión anterior
+        if result['full_rebuild'] or previous is None:
+            build_version_artifacts(paths)
+        else:
+            update_version_artifacts(paths, dataset_paths(previous), result['changed_keys'])
+    except Exception:
+        discard_version(version)
+        raise
+
+    publish_version(version)
+    print(f"Versión del dataset publicada: {version}")
+    return version
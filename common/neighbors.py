@@ -0,0 +1,314 @@
+import os
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from common.schema import PLAYER_KEY_COLUMNS
+from common.players import player_ids
+from common.presets import METRIC_PRESETS
+from common.similarity import SimilarityIndex
+
+NEIGHBORS_TABLE = 'player_neighbors'
+
+# Vecinos guardados por jugador y conjunto de métricas. Se guardan más de los que muestra
+# la página (máximo 10) para poder aplicar después los filtros sin recalcular
+NEIGHBORS_K = 50
+
+# Memoria máxima de cada bloque de similitudes (filas del bloque x jugadores x 4 bytes)
+NEIGHBORS_BLOCK_BYTES = 64 * 1024 * 1024
+
+# Fracción de jugadores afectados a partir de la cual una actualización incremental
+# recalcula todo el conjunto de métricas (p. ej. si cambia el máximo de una métrica, el
+# escalado min-max mueve a todos los jugadores)
+NEIGHBORS_MAX_UPDATE_FRACTION = 0.2
+
+# Parámetros por consulta de SQLite en los IN (...) (el límite mínimo de SQLite es 999)
+_SQL_BATCH = 500
+
+
+def top_k_neighbors(matrix, k=NEIGHBORS_K, block_bytes=NEIGHBORS_BLOCK_BYTES, workers=None, queries=None):
+    """
+    Calcula para cada fila de una matriz normalizada sus k filas más parecidas (coseno)
+
+    Se procesa por bloques de filas para acotar la memoria (cada bloque ocupa como mucho
+    block_bytes) y los bloques se reparten entre varios hilos (NumPy libera el GIL en el
+    producto de matrices y en la selección parcial)
+
+    - queries: Posiciones de las filas de las que se buscan vecinos (por defecto todas)
+
+    Devuelve (posiciones, similitudes), ambos de forma (consultas, k), ordenados de mayor
+    a menor similitud; la propia fila nunca se incluye
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    n_rows = len(matrix)
+    queries = np.arange(n_rows) if queries is None else np.asarray(queries, dtype=np.int64)
+    n_queries = len(queries)
+    k = min(k, n_rows - 1)
+    positions = np.zeros((n_queries, max(k, 0)), dtype=np.int32)
+    scores = np.zeros((n_queries, max(k, 0)), dtype=np.float32)
+    if k <= 0 or n_queries == 0:
+        return positions, scores
+
+    block_rows = max(1, block_bytes // (4 * n_rows))
+    workers = workers or os.cpu_count() or 1
+
+    def process(start):
+        end = min(start + block_rows, n_queries)
+        block = matrix[queries[start:end]] @ matrix.T
+        block[np.arange(end - start), queries[start:end]] = -np.inf     # excluir al propio jugador
+
+        best = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(block, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        positions[start:end] = np.take_along_axis(best, order, axis=1)
+        scores[start:end] = np.take_along_axis(best_scores, order, axis=1)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(process, range(0, n_queries, block_rows)))
+
+    return positions, scores
+
+
+def _read_players(parquet_path, presets):
+    """
+    Lee las métricas de los conjuntos de un Parquet y calcula el ID de cada fila
+
+    Devuelve (tabla, métricas disponibles, filas con vecinos, sus IDs) o None si faltan
+    columnas clave. Si varias filas comparten clave (y por tanto ID) solo la primera, que es
+    la que la aplicación asocia a ese ID, tiene vecinos y puede ser vecina
+    """
+    available = set(pq.read_schema(parquet_path).names)
+    key_columns = [col for col in PLAYER_KEY_COLUMNS if col in available]
+    if len(key_columns) != len(PLAYER_KEY_COLUMNS):
+        return None
+
+    metric_names = sorted({metric for preset in presets for metric in preset.metrics if metric in available})
+    table = pq.read_table(parquet_path, columns=key_columns + metric_names).to_pandas()
+    ids = player_ids(table)
+    _, first_rows = np.unique(ids, return_index=True)
+    first_rows = np.sort(first_rows)
+    return table, available, first_rows, ids[first_rows]
+
+
+def _preset_matrix(table, available, first_rows, preset):
+    """
+    Matriz normalizada (coseno, min-max) de las filas con vecinos para un conjunto de
+    métricas, o None si faltan métricas en los datos
+
+    La normalización usa todas las filas, como la búsqueda en vivo de la aplicación
+    """
+    metrics = list(preset.metrics)
+    if not available.issuperset(metrics):
+        return None
+    return SimilarityIndex(table[metrics], metrics).matrix[first_rows]
+
+
+def _neighbor_rows(preset_name, source_ids, target_ids, scores):
+    """
+    Filas de la tabla (preset, jugador_id, rango, vecino_id, similitud), generadas por columnas
+    """
+    n_rows, n_neighbors = target_ids.shape
+    return zip(
+        [preset_name] * (n_rows * n_neighbors),
+        np.repeat(source_ids, n_neighbors).tolist(),
+        np.tile(np.arange(1, n_neighbors + 1), n_rows).tolist(),
+        target_ids.ravel().tolist(),
+        scores.ravel().astype(np.float64).tolist(),
+    )
+
+
+def _create_table(conn):
+    conn.execute(f'DROP TABLE IF EXISTS {NEIGHBORS_TABLE}')
+    conn.execute(f'''
+        CREATE TABLE {NEIGHBORS_TABLE} (
+            preset TEXT NOT NULL,
+            jugador_id INTEGER NOT NULL,
+            rango INTEGER NOT NULL,
+            vecino_id INTEGER NOT NULL,
+            similitud REAL NOT NULL,
+            PRIMARY KEY (preset, jugador_id, rango)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _insert(conn, rows):
+    # INSERT sin REPLACE: una clave repetida es un error y no debe sobrescribir vecinos
+    conn.executemany(f'INSERT INTO {NEIGHBORS_TABLE} VALUES (?, ?, ?, ?, ?)', rows)
+
+
+def build_neighbors_table(parquet_path, db_path, presets=METRIC_PRESETS, k=NEIGHBORS_K, workers=None):
+    """
+    Calcula los vecinos de todos los jugadores para los conjuntos de métricas con nombre
+    y los guarda en la tabla player_neighbors de la base de datos de la versión
+
+    Los jugadores se identifican por su ID (ver common.players). Si varias filas comparten
+    clave (y por tanto ID) solo se guardan los vecinos de la primera; las demás se buscan
+    en vivo
+
+    Devuelve el número de filas escritas
+    """
+    players = _read_players(parquet_path, presets)
+    if players is None:
+        print(f"No se calculan vecinos: faltan columnas clave ({PLAYER_KEY_COLUMNS})")
+        return 0
+    table, available, first_rows, unique_ids = players
+    if len(unique_ids) < len(table):
+        print(f"ADVERTENCIA: {len(table) - len(unique_ids)} filas con clave de jugador duplicada "
+              f"no tendrán vecinos precalculados")
+
+    conn = sqlite3.connect(db_path)
+    written = 0
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('BEGIN IMMEDIATE')
+        _create_table(conn)
+
+        for preset in presets:
+            start = time.perf_counter()
+            matrix = _preset_matrix(table, available, first_rows, preset)
+            if matrix is None:
+                print(f"Conjunto '{preset.name}' omitido: faltan métricas en los datos")
+                continue
+            positions, scores = top_k_neighbors(matrix, k, workers=workers)
+            _insert(conn, _neighbor_rows(preset.name, unique_ids, unique_ids[positions], scores))
+            written += positions.size
+            print(f"Vecinos '{preset.name}': {len(matrix)} jugadores en {time.perf_counter() - start:.2f}s")
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return written
+
+
+def update_neighbors_table(previous_parquet_path, parquet_path, db_path, presets=METRIC_PRESETS,
+                           k=NEIGHBORS_K, workers=None):
+    """
+    Actualiza la tabla player_neighbors de una versión tras una ingesta incremental, a
+    partir del Parquet de la versión anterior (cuyos vecinos tiene la tabla)
+
+    Para cada conjunto de métricas se comparan los vectores normalizados de los dos Parquet:
+    - Los jugadores nuevos o cuyo vector cambió, y los que tenían entre sus vecinos a un
+      jugador eliminado o cambiado, se recalculan contra todos
+    - Para el resto, su lista guardada sigue siendo válida y solo se comprueba si alguno
+      de los jugadores cambiados entra en ella (un producto contra los cambiados)
+    Si la tabla no existe o los afectados superan NEIGHBORS_MAX_UPDATE_FRACTION, el conjunto
+    se recalcula entero. Devuelve el número de filas escritas
+    """
+    players = _read_players(parquet_path, presets)
+    if players is None:
+        return build_neighbors_table(parquet_path, db_path, presets, k, workers)
+    conn = sqlite3.connect(db_path)
+    try:
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({NEIGHBORS_TABLE})")}
+    finally:
+        conn.close()
+    previous_players = _read_players(previous_parquet_path, presets) if os.path.exists(previous_parquet_path) else None
+    if 'jugador_id' not in columns or previous_players is None:
+        return build_neighbors_table(parquet_path, db_path, presets, k, workers)
+
+    table, available, first_rows, unique_ids = players
+    previous_table, previous_available, previous_first_rows, previous_ids = previous_players
+    previous_position = pd.Index(previous_ids).get_indexer(unique_ids)
+
+    conn = sqlite3.connect(db_path)
+    written = 0
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('BEGIN IMMEDIATE')
+        for preset in presets:
+            start = time.perf_counter()
+            matrix = _preset_matrix(table, available, first_rows, preset)
+            previous_matrix = _preset_matrix(previous_table, previous_available, previous_first_rows, preset)
+            stored_k = conn.execute(f'SELECT MAX(rango) FROM {NEIGHBORS_TABLE} WHERE preset = ?',
+                                    (preset.name,)).fetchone()[0]
+            if matrix is None:
+                conn.execute(f'DELETE FROM {NEIGHBORS_TABLE} WHERE preset = ?', (preset.name,))
+                print(f"Conjunto '{preset.name}' omitido: faltan métricas en los datos")
+                continue
+            n_neighbors = min(k, len(matrix) - 1)
+
+            # Jugadores con el mismo vector en las dos versiones
+            same = previous_position >= 0
+            if previous_matrix is not None:
+                same[same] = (previous_matrix[previous_position[same]] == matrix[same]).all(axis=1)
+            changed = np.flatnonzero(~same)
+            stale_ids = np.setdiff1d(previous_ids, unique_ids[same])
+
+            affected = len(changed) + len(stale_ids)
+            if (stored_k != n_neighbors or previous_matrix is None
+                    or affected > NEIGHBORS_MAX_UPDATE_FRACTION * len(matrix)):
+                conn.execute(f'DELETE FROM {NEIGHBORS_TABLE} WHERE preset = ?', (preset.name,))
+                positions, scores = top_k_neighbors(matrix, k, workers=workers)
+                _insert(conn, _neighbor_rows(preset.name, unique_ids, unique_ids[positions], scores))
+                written += positions.size
+                print(f"Vecinos '{preset.name}': {len(matrix)} jugadores recalculados en "
+                      f"{time.perf_counter() - start:.2f}s")
+                continue
+            if affected == 0:
+                continue
+
+            # Jugadores sin cambios con algún vecino eliminado o cambiado: se recalculan
+            lost = set()
+            for i in range(0, len(stale_ids), _SQL_BATCH):
+                batch = stale_ids[i:i + _SQL_BATCH].tolist()
+                lost.update(row[0] for row in conn.execute(
+                    f'SELECT DISTINCT jugador_id FROM {NEIGHBORS_TABLE} WHERE preset = ? '
+                    f'AND vecino_id IN ({", ".join("?" * len(batch))})', [preset.name] + batch))
+            # (también los que no tienen lista guardada)
+            last = dict(conn.execute(f'SELECT jugador_id, similitud FROM {NEIGHBORS_TABLE} '
+                                     f'WHERE preset = ? AND rango = ?', (preset.name, n_neighbors)))
+            has_list = np.array([player_id in last for player_id in unique_ids.tolist()], dtype=bool)
+            recompute = np.flatnonzero(~same | ~has_list | np.isin(unique_ids, list(lost)))
+
+            # Resto: entran los cambiados que superan al último vecino guardado
+            others = np.setdiff1d(np.flatnonzero(same), recompute)
+            thresholds = np.array([last[player_id] for player_id in unique_ids[others].tolist()], dtype=np.float32)
+            entering = {}
+            block_rows = max(1, NEIGHBORS_BLOCK_BYTES // (4 * max(len(changed), 1)))
+            for i in range(0, len(others), block_rows):
+                block = matrix[others[i:i + block_rows]] @ matrix[changed].T
+                for row, column in zip(*np.nonzero(block > thresholds[i:i + block_rows, None])):
+                    entering.setdefault(others[i + row], []).append((changed[column], block[row, column]))
+
+            merged_sources, merged_targets, merged_scores = [], [], []
+            for source, candidates in entering.items():
+                stored = conn.execute(f'SELECT vecino_id, similitud FROM {NEIGHBORS_TABLE} '
+                                      f'WHERE preset = ? AND jugador_id = ? ORDER BY rango',
+                                      (preset.name, int(unique_ids[source]))).fetchall()
+                pool = stored + [(int(unique_ids[column]), float(score)) for column, score in candidates]
+                pool.sort(key=lambda item: -item[1])
+                merged_sources.append(unique_ids[source])
+                merged_targets.append([target for target, _ in pool[:n_neighbors]])
+                merged_scores.append([score for _, score in pool[:n_neighbors]])
+
+            # Sustituir las listas de los jugadores recalculados, combinados y eliminados
+            replaced = np.concatenate([stale_ids, unique_ids[recompute], np.array(merged_sources, dtype=np.int64)])
+            for i in range(0, len(replaced), _SQL_BATCH):
+                batch = replaced[i:i + _SQL_BATCH].tolist()
+                conn.execute(f'DELETE FROM {NEIGHBORS_TABLE} WHERE preset = ? '
+                             f'AND jugador_id IN ({", ".join("?" * len(batch))})', [preset.name] + batch)
+
+            positions, scores = top_k_neighbors(matrix, k, workers=workers, queries=recompute)
+            _insert(conn, _neighbor_rows(preset.name, unique_ids[recompute], unique_ids[positions], scores))
+            if merged_sources:
+                _insert(conn, _neighbor_rows(preset.name, np.array(merged_sources, dtype=np.int64),
+                                             np.array(merged_targets, dtype=np.int64),
+                                             np.array(merged_scores, dtype=np.float32)))
+            written += positions.size + len(merged_sources) * n_neighbors
+            print(f"Vecinos '{preset.name}': {len(recompute)} jugadores recalculados y "
+                  f"{len(merged_sources)} listas actualizadas en {time.perf_counter() - start:.2f}s")
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return written
@@ -0,0 +1,138 @@
+import os
+import shutil
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from common.schema import find_column, get_column_spec
+
+# Columnas (del registro) por las que se particiona el dataset, en orden de carpeta:
+# <dir>/Liga=<liga>/Temporada=<temporada>/part-0.parquet (las que no existan se omiten)
+PARTITION_COLUMNS = ['Liga', 'Temporada']
+
+# Columna con la fila de cada jugador en el Parquet completo (para alinear los resultados)
+ROW_COLUMN = '__fila__'
+
+# Filas por row group dentro de cada partición; los row groups guardan estadísticas
+# (mínimo/máximo por columna) con las que se descartan sin leerlos
+PARTITION_ROW_GROUP_ROWS = 1024
+
+
+def partition_columns(columns):
+    """
+    Devuelve las columnas de partición presentes en `columns`, en el orden de PARTITION_COLUMNS
+    """
+    found = [find_column(columns, name) for name in PARTITION_COLUMNS]
+    return [col for col in found if col is not None]
+
+
+def build_partitioned_dataset(parquet_path, dataset_dir, row_group_rows=PARTITION_ROW_GROUP_ROWS):
+    """
+    Escribe el Parquet completo como dataset particionado al estilo Hive (liga y temporada)
+
+    Dentro de cada partición las filas se ordenan por equipo, así que las estadísticas de
+    los row groups también permiten descartar equipos. El dataset se escribe en una carpeta
+    temporal y se sustituye al final. Devuelve el número de filas escritas (0 si no hay
+    columnas de partición)
+    """
+    table = pq.read_table(parquet_path)
+    keys = partition_columns(table.column_names)
+    if not keys:
+        print(f"No se particiona el dataset: faltan columnas de partición ({PARTITION_COLUMNS})")
+        return 0
+
+    table = table.append_column(ROW_COLUMN, pa.array(np.arange(table.num_rows, dtype=np.int64)))
+    # Las columnas categóricas se escriben como texto: los valores de partición van en la
+    # ruta y Arrow solo descarta row groups por estadísticas de columnas sin diccionario
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table[field.name].cast(pa.string()))
+    team = find_column(table.column_names, 'Equipo')
+    sort_columns = keys + ([team] if team else []) + [ROW_COLUMN]
+    table = table.sort_by([(col, 'ascending') for col in sort_columns])
+
+    tmp_dir = f"{dataset_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    ds.write_dataset(
+        table, tmp_dir, format='parquet',
+        partitioning=ds.partitioning(pa.schema([(key, pa.string()) for key in keys]), flavor='hive'),
+        basename_template='part-{i}.parquet',
+        max_rows_per_group=row_group_rows,
+    )
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    os.replace(tmp_dir, dataset_dir)
+    return table.num_rows
+
+
+def _partition_keys(dataset_dir):
+    """
+    Lee de los nombres de carpeta ('Liga=...') las columnas de partición de un dataset
+    """
+    keys = []
+    directory = dataset_dir
+    while True:
+        entries = sorted(entry for entry in os.listdir(directory)
+                         if '=' in entry and os.path.isdir(os.path.join(directory, entry)))
+        if not entries:
+            return keys
+        keys.append(entries[0].split('=', 1)[0])
+        directory = os.path.join(directory, entries[0])
+
+
+def open_partitioned_dataset(dataset_dir):
+    """
+    Abre un dataset particionado (las columnas de partición se leen siempre como texto)
+    """
+    keys = _partition_keys(dataset_dir)
+    partitioning = ds.partitioning(pa.schema([(key, pa.string()) for key in keys]), flavor='hive')
+    return ds.dataset(dataset_dir, format='parquet', partitioning=partitioning)
+
+
+def filter_expression(filters):
+    """
+    Convierte {columna: valor o lista de valores} en una expresión de filtro de Arrow
+    """
+    expression = None
+    for col, value in (filters or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            condition = ds.field(col).isin(list(value))
+        else:
+            condition = ds.field(col) == value
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read_partitioned(dataset_dir, filters=None, columns=None):
+    """
+    Lee las filas de un dataset particionado que cumplen los filtros
+
+    - filters: {columna: valor o lista de valores} (nombres originales). Los filtros sobre
+      columnas de partición descartan carpetas enteras y los demás, row groups a partir de
+      sus estadísticas, antes de leer los datos
+    - columns: Columnas que se leen (por defecto, todas)
+    Devuelve un DataFrame indexado por la fila de cada jugador en el Parquet completo, en
+    ese mismo orden
+    """
+    dataset = open_partitioned_dataset(dataset_dir)
+    if columns is None:
+        columns = [col for col in dataset.schema.names if col != ROW_COLUMN]
+    table = dataset.to_table(columns=list(columns) + [ROW_COLUMN], filter=filter_expression(filters))
+
+    df = table.to_pandas().set_index(ROW_COLUMN).sort_index()
+    df.index.name = None
+    # Las columnas categóricas del registro recuperan su tipo
+    for col in df.columns:
+        if get_column_spec(col).dtype == 'category':
+            df[col] = df[col].astype('category')
+    return df
+
+
+def scan_stats(dataset_dir, filters=None):
+    """
+    Devuelve {'files', 'row_groups'} que leería read_partitioned con esos filtros
+    """
+    dataset = open_partitioned_dataset(dataset_dir)
+    expression = filter_expression(filters)
+    fragments = list(dataset.get_fragments(filter=expression))
+    row_groups = sum(len(fragment.split_by_row_group(expression, schema=dataset.schema)) for fragment in fragments)
+    return {'files': len(fragments), 'row_groups': row_groups}
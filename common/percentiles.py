@@ -0,0 +1,123 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from common.schema import find_column, get_column_spec, metric_columns
+
+# Columnas (del registro) que definen los grupos de comparación: posición x liga
+PERCENTILE_GROUPS = ['Posición', 'Liga']
+
+
+def compute_percentiles(df, metrics, group_columns):
+    """
+    Calcula el percentil (0-100) de cada jugador en cada métrica dentro de su grupo
+
+    El rango es vectorizado sobre todos los grupos a la vez (groupby().rank); los empates
+    reciben el rango medio y las filas sin grupo forman un grupo propio. Los valores que
+    faltan no cuentan en el rango (no son ceros) y su percentil queda nulo (NaN). Devuelve
+    un DataFrame float32 con las métricas como columnas, en el mismo orden de filas que df
+    """
+    groups = [df[col].astype(object) for col in group_columns]
+    values = df[metrics].apply(pd.to_numeric, errors='coerce')
+    if groups:
+        ranks = values.groupby(groups, dropna=False, sort=False).rank(method='average', na_option='keep', pct=True)
+    else:
+        ranks = values.rank(method='average', na_option='keep', pct=True)
+    return (ranks * 100).astype(np.float32)
+
+
+def build_percentile_table(parquet_path, percentiles_path):
+    """
+    Calcula en la ingesta la tabla de percentiles por posición y liga de todas las métricas
+    del Parquet y la guarda junto a él (mismo orden de filas, escritura atómica)
+
+    Devuelve el número de filas escritas (0 si faltan las columnas de grupo)
+    """
+    available = pq.read_schema(parquet_path).names
+    group_columns = [find_column(available, name) for name in PERCENTILE_GROUPS]
+    if None in group_columns:
+        print(f"No se calculan percentiles: faltan columnas de grupo ({PERCENTILE_GROUPS})")
+        return 0
+
+    metrics = metric_columns(available)
+    df = pq.read_table(parquet_path, columns=group_columns + metrics).to_pandas()
+    percentiles = compute_percentiles(df, metrics, group_columns)
+
+    tmp_path = f"{percentiles_path}.tmp"
+    pq.write_table(pa.Table.from_pandas(percentiles, preserve_index=False), tmp_path)
+    os.replace(tmp_path, percentiles_path)
+    return len(percentiles)
+
+
+class PercentileTable:
+    """
+    Percentiles por posición y liga de las filas de un dataset, alineados con sus posiciones
+
+    Los percentiles de cada métrica se leen (o calculan) la primera vez que se piden y se
+    memorizan; después, consultar el percentil de un jugador es indexar un array
+    """
+
+    def __init__(self, metrics, loader, n_rows):
+        """
+        - metrics: Métricas disponibles (nombres de la aplicación)
+        - loader: Función que recibe una lista de métricas y devuelve sus percentiles
+          (filas del dataset x métricas)
+        - n_rows: Número de filas del dataset
+        """
+        self.metrics = list(metrics)
+        self._available = set(self.metrics)
+        self._loader = loader
+        self._values = {}
+        self._rows = n_rows
+
+    @classmethod
+    def for_dataset(cls, percentiles_path, rows, metrics, fallback=None):
+        """
+        Construye la tabla a partir de los percentiles guardados en la ingesta (nombres
+        originales, orden del Parquet) y las filas del Parquet que forman el dataset
+        (p. ej. df.index); cada métrica se lee con una proyección de columnas
+
+        - metrics: Métricas del dataset (nombres de la aplicación)
+        - fallback: Función opcional que calcula los percentiles de las métricas que no
+          están en el archivo (p. ej. de datos anteriores a las métricas derivadas)
+        """
+        stored = {get_column_spec(col).app_name: col for col in pq.read_schema(percentiles_path).names}
+        rows = np.asarray(rows)
+
+        def loader(names):
+            values = {}
+            from_file = [name for name in names if name in stored]
+            if from_file:
+                table = pq.read_table(percentiles_path, columns=[stored[name] for name in from_file])
+                values.update(zip(from_file, table.to_pandas().to_numpy(dtype=np.float32)[rows].T))
+            computed = [name for name in names if name not in stored]
+            if computed:
+                values.update(zip(computed, np.asarray(fallback(computed), dtype=np.float32).T))
+            return np.column_stack([values[name] for name in names])
+
+        available = [metric for metric in metrics if metric in stored or fallback is not None]
+        return cls(available, loader, len(rows))
+
+    def __len__(self):
+        return self._rows
+
+    def has(self, metrics):
+        return all(metric in self._available for metric in metrics)
+
+    def _load(self, metrics):
+        missing = [metric for metric in dict.fromkeys(metrics) if metric not in self._values]
+        if missing:
+            values = np.asarray(self._loader(missing), dtype=np.float32)
+            for i, metric in enumerate(missing):
+                column = values[:, i].copy()
+                column.setflags(write=False)
+                self._values[metric] = column
+
+    def lookup(self, positions, metrics):
+        """
+        Devuelve los percentiles de las filas `positions` (una posición o una lista) en `metrics`
+        """
+        self._load(metrics)
+        positions = np.asarray(positions)
+        return np.stack([self._values[metric][positions] for metric in metrics], axis=-1)
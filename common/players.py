@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+from common.schema import PLAYER_ID_COLUMN, PLAYER_KEY_COLUMNS, find_column
+
+
+def player_ids(df):
+    """
+    Calcula el ID estable (int64 no negativo) de cada fila a partir de la clave del jugador
+    (PLAYER_KEY_COLUMNS, con cualquiera de sus nombres)
+
+    El ID es un hash de los valores de la clave, así que un jugador conserva su ID entre
+    versiones del dataset e ingestas incrementales. Los textos se hashean por su valor
+    (igual como categoría que como texto). Devuelve None si faltan columnas clave
+    """
+    key_columns = [find_column(df.columns, col) for col in PLAYER_KEY_COLUMNS]
+    if None in key_columns:
+        return None
+    keys = pd.DataFrame({col: df[col].astype(object).to_numpy() for col in key_columns})
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    return (hashes >> np.uint64(1)).astype(np.int64)
+
+
+def add_player_ids(df):
+    """
+    Añade (o recalcula) la columna PLAYER_ID_COLUMN como primera columna de df
+    """
+    ids = player_ids(df)
+    if ids is None:
+        return df
+    df = df.drop(columns=[PLAYER_ID_COLUMN], errors='ignore')
+    df.insert(0, PLAYER_ID_COLUMN, ids)
+    return df
+
+
+def player_labels(df, positions=None):
+    """
+    Devuelve el texto con el que se muestra cada jugador (las filas indicadas o todas)
+
+    Es el nombre del jugador; si el nombre se repite en df se añade el equipo para
+    distinguirlos ('Rodri (Betis)')
+    """
+    names = df['player_name'].astype(object).to_numpy()
+    repeated = df['player_name'].duplicated(keep=False).to_numpy()
+    teams = df['equipo'].astype(object).to_numpy() if 'equipo' in df.columns else None
+    if positions is None:
+        positions = np.arange(len(df))
+    return [f"{names[row]} ({teams[row]})" if repeated[row] and teams is not None else names[row]
+            for row in positions]
+
+
+class PlayerDirectory:
+    """
+    Tablas de consulta de los jugadores de un dataset por posición de fila
+
+    Las posiciones (0..n-1) son la referencia de un jugador dentro de una versión del
+    dataset: las funciones de similitud, radar y PDF trabajan con ellas y el estado de las
+    sesiones solo guarda enteros. El ID (estable entre versiones) se traduce a posición
+    con un diccionario y los nombres se guardan una sola vez (código por fila + tabla de
+    nombres distintos; equipos y ligas ya son categorías en el dataset)
+    """
+
+    def __init__(self, df):
+        """
+        - df: DataFrame preparado (player_name, equipo y, si existe, player_id)
+        """
+        self.size = len(df)
+        if 'player_id' in df.columns:
+            self.ids = df['player_id'].to_numpy(dtype=np.int64, copy=True)
+        else:
+            self.ids = np.arange(self.size, dtype=np.int64)
+        self.ids.setflags(write=False)
+        self._positions = {}
+        for position, player_id in enumerate(self.ids.tolist()):
+            self._positions.setdefault(player_id, position)
+
+        # Nombres internados: código por fila y tabla de nombres distintos
+        self.name_codes, names = pd.factorize(df['player_name'].astype(object).to_numpy())
+        self.names = pd.Index(names)
+        self._rows_by_name = pd.Series(np.arange(self.size)).groupby(self.name_codes).indices
+        self._labels = player_labels(df)
+
+        # Orden alfabético de cada fila, para ordenar listas de posiciones por nombre
+        self._alphabetical = np.empty(self.size, dtype=np.int64)
+        self._alphabetical[np.argsort(np.array(self._labels, dtype=object), kind='stable')] = np.arange(self.size)
+
+    def position(self, player_id):
+        """
+        Devuelve la posición del jugador con ese ID, o None si no está en el dataset
+        """
+        return self._positions.get(int(player_id))
+
+    def positions(self, player_ids):
+        """
+        Devuelve las posiciones de varios IDs (array int64, -1 si no están en el dataset)
+        """
+        return np.array([self._positions.get(player_id, -1) for player_id in np.asarray(player_ids, dtype=np.int64).tolist()],
+                        dtype=np.int64)
+
+    def positions_by_name(self, name):
+        """
+        Devuelve las posiciones de las filas con ese nombre de jugador
+        """
+        return self._rows_by_name.get(self.names.get_indexer([name])[0], np.empty(0, dtype=np.int64))
+
+    def label(self, position):
+        return self._labels[position]
+
+    def labels(self, positions):
+        return [self._labels[position] for position in positions]
+
+    def sort(self, positions):
+        """
+        Ordena posiciones por el texto de cada jugador (ver player_labels)
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        return positions[np.argsort(self._alphabetical[positions], kind='stable')]
+
+
+def same_player(df, position):
+    """
+    Máscara de las filas de df que corresponden al mismo jugador que la fila `position`
+    (mismo nombre y año de nacimiento: p. ej. un jugador que ha jugado en dos equipos).
+    Sin año de nacimiento se comparan solo los nombres
+    """
+    names = df['player_name'].to_numpy()
+    mask = names == names[position]
+    birth_column = find_column(df.columns, 'Año nacimiento')
+    if birth_column is not None:
+        births = df[birth_column].to_numpy()
+        mask &= births == births[position]
+    return mask
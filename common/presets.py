@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+from common.schema import get_column_spec
+
+
+@dataclass(frozen=True)
+class MetricPreset:
+    """
+    Conjunto de métricas con nombre para las búsquedas de similitud
+
+    Los vecinos de cada jugador para estos conjuntos se precalculan en la ingesta
+    (tabla player_neighbors), así que las búsquedas con ellos son inmediatas
+    """
+    name: str       # Identificador guardado en la tabla player_neighbors
+    label: str      # Nombre que se muestra en la aplicación
+    metrics: tuple  # Métricas con su nombre original (columnas del Parquet)
+
+    def app_metrics(self, available=None):
+        """
+        Métricas con el nombre que usa la aplicación, opcionalmente limitadas a las disponibles
+        """
+        names = [get_column_spec(metric).app_name for metric in self.metrics]
+        if available is not None:
+            names = [name for name in names if name in available]
+        return names
+
+
+# Conjunto por defecto de la página de jugadores similares
+DEFAULT_PRESET = 'defecto'
+
+METRIC_PRESETS = [
+    MetricPreset(DEFAULT_PRESET, 'Por defecto',
+                 ('Goles', 'Asistencias', 'G+A', 'Goles sin penaltis', 'Penaltis convertidos')),
+    MetricPreset('ataque', 'Ataque',
+                 ('Goles', 'Xg', 'Tiros totales', 'Tiros a puerta', 'Goles/90', 'Tiros/90')),
+    MetricPreset('creacion', 'Creación',
+                 ('Asistencias', 'xAG', 'Pases clave', 'Acciones creación de gol',
+                  'Pases último tercio', 'Pases progresivos')),
+    MetricPreset('defensa', 'Defensa',
+                 ('Tackles', 'Tackles ganados', 'Intercepciones', 'Bloqueos defensivos',
+                  'Pases bloqueados', 'Tiros bloqueados')),
+    MetricPreset('pase', 'Pase',
+                 ('Pases completados', '%acierto en pases', 'Distancia pases progresivos',
+                  '%pases largos completados', 'Pases progresivos')),
+]
+
+_PRESETS_BY_NAME = {preset.name: preset for preset in METRIC_PRESETS}
+
+
+def get_preset(name):
+    """
+    Devuelve el conjunto de métricas con ese identificador, o None
+    """
+    return _PRESETS_BY_NAME.get(name)
+
+
+def preset_for_metrics(metrics):
+    """
+    Devuelve el conjunto con exactamente esas métricas (en cualquier orden y con nombre
+    original o de la aplicación), o None si es una selección personalizada
+    """
+    selected = {get_column_spec(metric) for metric in metrics}
+    for preset in METRIC_PRESETS:
+        if {get_column_spec(metric) for metric in preset.metrics} == selected:
+            return preset
+    return None
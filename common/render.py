@@ -0,0 +1,192 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from common.database import LatencyStats
+
+# Procesos de renderizado que se mantienen abiertos (imágenes que se generan a la vez)
+DEFAULT_RENDER_WORKERS = 2
+
+# Imágenes pendientes (en cola o renderizándose) a partir de las cuales se rechazan las nuevas
+DEFAULT_MAX_PENDING = 8
+
+# Segundos que una exportación espera como máximo a su imagen
+RENDER_TIMEOUT = 60
+
+# Gráfico mínimo con el que se calienta cada proceso (carga plotly.js en el navegador)
+_WARMUP_FIGURE = {
+    'data': [{'type': 'scatterpolar', 'r': [1, 0.5, 1], 'theta': ['a', 'b', 'a'], 'fill': 'toself'}],
+    'layout': {'width': 100, 'height': 100},
+}
+
+
+# Error del primer render de este proceso de renderizado (None si kaleido funciona)
+_warmup_error = None
+
+
+def _start_renderer():
+    """
+    Inicializa un proceso de renderizado: hace un primer render y, si kaleido funciona,
+    deja su navegador abierto para los siguientes (kaleido >= 1)
+
+    El primer render se hace sin el navegador persistente: si Chrome no está instalado,
+    el navegador persistente se quedaría esperando para siempre. Si falla, el error se
+    guarda para el servicio (ver _ping) y los renders del proceso devuelven el error de kaleido
+    """
+    global _warmup_error
+    try:
+        import kaleido
+        _render(_WARMUP_FIGURE, 'png', 1)
+        if hasattr(kaleido, 'start_sync_server'):
+            kaleido.start_sync_server(silence_warnings=True)
+            _render(_WARMUP_FIGURE, 'png', 1)
+    except Exception as e:
+        _warmup_error = f"{type(e).__name__}: {' '.join(str(e).split())}"
+
+
+def _render(figure, format, scale):
+    """
+    Convierte la especificación de un gráfico (diccionario de Plotly) en una imagen; se
+    ejecuta en los procesos de renderizado
+
+    Devuelve (bytes de la imagen, segundos de renderizado)
+    """
+    import plotly.io as pio
+    start = time.perf_counter()
+    image = pio.to_image(figure, format=format, scale=scale)
+    return image, time.perf_counter() - start
+
+
+def _ping():
+    """
+    Devuelve el error del primer render del proceso, o None si kaleido funciona
+    """
+    return _warmup_error
+
+
+class RenderService:
+    """
+    Procesos que convierten gráficos de Plotly en imágenes para las exportaciones a PDF
+
+    kaleido tarda varios segundos en preparar su navegador: los procesos se arrancan (y
+    hacen un primer render) con el primer envío y se reutilizan entre exportaciones y
+    sesiones, fuera del hilo de Streamlit; crear el servicio no arranca ningún proceso.
+    Si el primer render falla (p. ej. sin Chrome), el error queda en warmup_error. Los gráficos se envían a la cola de los procesos
+    y cada envío devuelve un Future con los bytes de la imagen. Como mucho se renderizan
+    `workers` imágenes a la vez; el resto espera en la cola y, con `max_pending` imágenes
+    pendientes, los nuevos envíos se rechazan
+    """
+
+    def __init__(self, workers=DEFAULT_RENDER_WORKERS, max_pending=DEFAULT_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.latency = LatencyStats()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.warmup_error = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._restart_lock = threading.Lock()
+        self._executor = None
+
+    def _start(self):
+        # 'spawn': los procesos no heredan los hilos ni las conexiones del servidor de Streamlit
+        self.warmup_error = None
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_start_renderer)
+        # Arrancar ya todos los procesos (cada uno se calienta al inicializarse) y recoger
+        # el error del primer render, si lo hay
+        for _ in range(self.workers):
+            self._executor.submit(_ping).add_done_callback(self._record_warmup)
+
+    def _record_warmup(self, future):
+        try:
+            error = future.result()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        if error:
+            with self._lock:
+                self.warmup_error = error
+
+    def submit(self, fig, format='png', scale=2):
+        """
+        Envía un gráfico (Figure o diccionario de Plotly) a renderizar y devuelve un Future
+        con los bytes de la imagen
+
+        Lanza RuntimeError si ya hay `max_pending` imágenes pendientes
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise RuntimeError(f"Hay {self._pending} imágenes pendientes de generar; "
+                                   f"vuelve a intentarlo en unos segundos")
+            self._pending += 1
+
+        figure = fig.to_dict() if hasattr(fig, 'to_dict') else fig
+        submitted = time.perf_counter()
+        result = Future()
+
+        def done(future):
+            with self._lock:
+                self._pending -= 1
+            try:
+                image, seconds = future.result()
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                result.set_exception(e)
+                return
+            with self._lock:
+                self.completed += 1
+            self.latency.record('render', seconds, False)
+            self.latency.record('espera + render', time.perf_counter() - submitted, False)
+            result.set_result(image)
+
+        try:
+            # Los procesos se arrancan con el primer envío
+            with self._restart_lock:
+                if self._executor is None:
+                    self._start()
+            executor = self._executor
+            try:
+                future = executor.submit(_render, figure, format, scale)
+            except BrokenProcessPool:
+                # Un proceso terminó de forma inesperada: se vuelven a arrancar (una sola vez
+                # aunque varias sesiones lo detecten a la vez)
+                with self._restart_lock:
+                    if self._executor is executor:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        self._start()
+                future = self._executor.submit(_render, figure, format, scale)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(done)
+        return result
+
+    def render(self, fig, format='png', scale=2, timeout=RENDER_TIMEOUT):
+        """
+        Renderiza un gráfico y espera a la imagen (como mucho `timeout` segundos)
+        """
+        return self.submit(fig, format, scale).result(timeout)
+
+    def stats(self):
+        """
+        Devuelve {'started', 'workers', 'pending', 'queued', 'completed', 'failed', 'rejected',
+        'warmup_error', 'latency': LatencyStats.summary()}; queued son las imágenes que esperan
+        a un proceso libre y started indica si los procesos ya se arrancaron
+        """
+        with self._lock:
+            stats = {'started': self._executor is not None, 'workers': self.workers,
+                     'pending': self._pending, 'queued': max(0, self._pending - self.workers),
+                     'completed': self.completed, 'failed': self.failed, 'rejected': self.rejected,
+                     'warmup_error': self.warmup_error}
+        stats['latency'] = self.latency.summary()
+        return stats
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,258 @@
+from dataclasses import dataclass
+import pandas as pd
+import pyarrow as pa
+
+# Versión del esquema; se guarda en los metadatos del Parquet para saber si ya se aplicó
+SCHEMA_VERSION = '1'
+SCHEMA_METADATA_KEY = b'scouting_players.schema'
+
+# Tipos de columna
+IDENTIFIER = 'identificador'   # Identifica al jugador (nombre, ID)
+CATEGORICAL = 'categorica'     # Texto con pocos valores distintos (liga, equipo...)
+ATTRIBUTE = 'atributo'         # Numérico descriptivo que no es una métrica de rendimiento
+METRIC = 'metrica'             # Métrica numérica comparable entre jugadores
+
+
+@dataclass(frozen=True)
+class ColumnSpec:
+    """
+    Definición de una columna de la tabla players_data
+    """
+    name: str
+    dtype: str              # 'string', 'category', 'int64' o 'float64'
+    kind: str               # IDENTIFIER, CATEGORICAL, ATTRIBUTE o METRIC
+    nullable: bool = False  # Si admite valores nulos (si no, se rellenan con '' o 0)
+    alias: str = None       # Nombre usado por la aplicación tras prepare_player_data
+
+    @property
+    def is_text(self):
+        return self.dtype in ('string', 'category')
+
+    @property
+    def app_name(self):
+        return self.alias or self.name.lower()
+
+
+def _metrics(dtype, *names):
+    return [ColumnSpec(name, dtype, METRIC) for name in names]
+
+
+# Registro de columnas de players_data en el orden de la exportación
+PLAYERS_SCHEMA = [
+    ColumnSpec('Jugador', 'string', IDENTIFIER, alias='player_name'),
+    ColumnSpec('Nacionalidad', 'category', CATEGORICAL, nullable=True),
+    ColumnSpec('Posición', 'category', CATEGORICAL, nullable=True, alias='posicion'),
+    ColumnSpec('Equipo', 'category', CATEGORICAL),
+    ColumnSpec('Liga', 'category', CATEGORICAL),
+    ColumnSpec('Año nacimiento', 'int64', ATTRIBUTE),
+    ColumnSpec('Partidos jugados', 'int64', ATTRIBUTE),
+    ColumnSpec('Partidos titular', 'int64', ATTRIBUTE),
+    ColumnSpec('Minutos jugados', 'int64', ATTRIBUTE),
+    *_metrics('int64', 'Goles', 'Asistencias', 'G+A', 'Goles sin penaltis',
+              'Penaltis convertidos', 'Penaltis tirados', 'Amarillas', 'Rojas'),
+    *_metrics('float64', 'Xg', 'xAG'),
+    *_metrics('int64', 'Carreras progresivas', 'Pases progresivos'),
+    *_metrics('float64', 'Goles/90', 'Asistencias/90', 'G+A/90'),
+    *_metrics('int64', 'Tiros a gol', 'Tiros totales', 'Tiros a puerta'),
+    *_metrics('float64', '%tiros a puerta', 'Tiros/90', 'Tiros a puerta/90'),
+    *_metrics('int64', 'Pases completados', 'Pases intentados'),
+    *_metrics('float64', '%acierto en pases'),
+    *_metrics('int64', 'Distancia total pases', 'Distancia pases progresivos'),
+    *_metrics('float64', '%pases cortos completados', '%pases medios completados',
+              '%pases largos completados'),
+    *_metrics('int64', 'Pases clave', 'Pases último tercio', 'Pases zona del área',
+              'Pases progresivos.1', 'Acciones creación de gol'),
+    *_metrics('float64', 'Acciones creación gol/90'),
+    *_metrics('int64', 'Tackles', 'Tackles ganados', 'Bloqueos defensivos', 'Tiros bloqueados',
+              'Pases bloqueados', 'Intercepciones', 'Toques de balón', 'Toques área propia',
+              'Toques zona defensiva', 'Toques zona media', 'Toques zona de ataque',
+              'Pases recibidos', 'Pases progresivos recibidos'),
+]
+
+# Columnas que añade la ingesta (no vienen en la exportación)
+GENERATED_SCHEMA = [
+    ColumnSpec('ID jugador', 'int64', IDENTIFIER, alias='player_id'),
+]
+
+# Columnas que pueden incluir las exportaciones aunque la actual no las tenga
+OPTIONAL_SCHEMA = [
+    ColumnSpec('Temporada', 'category', CATEGORICAL, nullable=True),
+]
+
+# Métricas derivadas que se calculan en la ingesta a partir de las exportadas (ver common.derived)
+
+# Columna de minutos con la que se calculan las métricas por 90 minutos
+MINUTES_COLUMN = 'Minutos jugados'
+
+# Conteos que la exportación ya trae por 90 minutos (no se vuelven a calcular)
+EXPORTED_PER90 = {
+    'Goles': 'Goles/90',
+    'Asistencias': 'Asistencias/90',
+    'G+A': 'G+A/90',
+    'Tiros totales': 'Tiros/90',
+    'Tiros a puerta': 'Tiros a puerta/90',
+    'Acciones creación de gol': 'Acciones creación gol/90',
+}
+
+# Conteos de los que se calcula la métrica por 90 minutos ('<conteo>/90'); se omiten las
+# columnas repetidas de la exportación ('Pases progresivos.1')
+PER90_SOURCES = [spec.name for spec in PLAYERS_SCHEMA
+                 if spec.kind == METRIC and spec.dtype == 'int64'
+                 and spec.name not in EXPORTED_PER90 and not spec.name.rsplit('.', 1)[-1].isdigit()]
+
+# Cocientes (nombre, numerador, denominador, factor): valor = factor * numerador / denominador
+RATIO_METRICS = [
+    ('Goles/tiro', 'Goles', 'Tiros totales', 1),
+    ('Goles/xG', 'Goles', 'Xg', 1),
+    ('Distancia media pase', 'Distancia total pases', 'Pases completados', 1),
+    ('Distancia progresiva/pase', 'Distancia pases progresivos', 'Pases completados', 1),
+]
+
+# Proporciones (en %) de un total del propio jugador, con el mismo formato que los cocientes
+SHARE_METRICS = [
+    ('%titularidades', 'Partidos titular', 'Partidos jugados', 100),
+    ('%minutos disputados', 'Minutos jugados', 'Partidos jugados', 100 / 90),
+    ('%tackles ganados', 'Tackles ganados', 'Tackles', 100),
+    ('%pases progresivos', 'Pases progresivos', 'Pases completados', 100),
+    ('%toques zona defensiva', 'Toques zona defensiva', 'Toques de balón', 100),
+    ('%toques zona media', 'Toques zona media', 'Toques de balón', 100),
+    ('%toques zona de ataque', 'Toques zona de ataque', 'Toques de balón', 100),
+]
+
+DERIVED_SCHEMA = _metrics('float64', *[f"{name}/90" for name in PER90_SOURCES],
+                          *[name for name, *_ in RATIO_METRICS + SHARE_METRICS])
+
+# Columnas que identifican a un jugador en una exportación (un jugador traspasado
+# durante la temporada aparece una vez por equipo)
+PLAYER_KEY_COLUMNS = ['Jugador', 'Equipo', 'Año nacimiento']
+
+# Identificador entero estable de cada jugador (se calcula a partir de PLAYER_KEY_COLUMNS)
+PLAYER_ID_COLUMN = 'ID jugador'
+
+# Palabras clave para clasificar columnas que no están en el registro
+TEXT_COLUMN_KEYWORDS = ['jugador', 'equipo', 'liga', 'país', 'pais', 'player',
+                        'team', 'league', 'country', 'name', 'nombre',
+                        'posicion', 'posición', 'position', 'nacionalidad',
+                        'nationality']
+
+# Valores que representan un texto vacío en las exportaciones
+EMPTY_TEXT_VALUES = ['', '0', '0.0', 'nan', 'NaN', 'None']
+
+# Números exportados como texto con separador de miles (p. ej. '1,952')
+THOUSANDS_PATTERN = r'^-?\d{1,3}(,\d{3})+(\.\d+)?$'
+
+# Búsqueda por nombre original, en minúsculas o por alias de la aplicación
+_SPECS_BY_NAME = {}
+for _spec in PLAYERS_SCHEMA + GENERATED_SCHEMA + OPTIONAL_SCHEMA + DERIVED_SCHEMA:
+    for _key in (_spec.name, _spec.name.lower(), _spec.app_name):
+        _SPECS_BY_NAME.setdefault(_key, _spec)
+
+
+def get_column_spec(name):
+    """
+    Devuelve la definición de una columna (por nombre original o de la aplicación)
+
+    Las columnas que no están en el registro se clasifican como texto si su nombre
+    contiene alguna palabra clave de texto y como métrica numérica en caso contrario
+    """
+    spec = _SPECS_BY_NAME.get(name) or _SPECS_BY_NAME.get(str(name).strip().lower())
+    if spec is not None:
+        return spec
+    if any(keyword in str(name).lower() for keyword in TEXT_COLUMN_KEYWORDS):
+        return ColumnSpec(str(name), 'string', IDENTIFIER, nullable=True)
+    return ColumnSpec(str(name), 'float64', METRIC)
+
+
+def text_columns(columns):
+    """
+    Devuelve las columnas de texto (identificadores y categóricas) de una lista
+    """
+    return [col for col in columns if get_column_spec(col).is_text]
+
+
+def metric_columns(columns):
+    """
+    Devuelve las columnas que son métricas de rendimiento, en el orden recibido
+    """
+    return [col for col in columns if get_column_spec(col).kind == METRIC]
+
+
+def find_column(columns, name):
+    """
+    Devuelve la columna de `columns` que corresponde a la columna `name` del registro
+    (sea cual sea su nombre en el DataFrame), o None si no existe
+    """
+    target = get_column_spec(name)
+    for col in columns:
+        if get_column_spec(col) == target:
+            return col
+    return None
+
+
+def to_number(series):
+    """
+    Convierte una serie a float64, interpretando textos con separador de miles ('1,952')
+    """
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        text = series.astype(str).str.strip()
+        thousands = text.str.match(THOUSANDS_PATTERN)
+        series = series.where(~thousands, text.str.replace(',', '', regex=False))
+    return pd.to_numeric(series, errors='coerce').astype('float64')
+
+
+def _clean_text(series, nullable):
+    """
+    Normaliza una columna de texto: los valores vacíos o numéricos ('0', 'nan'...) pasan a
+    nulo si la columna lo admite o a cadena vacía si no
+    """
+    values = series.map(lambda v: None if v is None or v != v else str(v).strip())
+    empty = values.isna() | values.isin(EMPTY_TEXT_VALUES)
+    return values.mask(empty, None if nullable else '')
+
+
+def apply_schema(df):
+    """
+    Aplica los tipos del registro a un DataFrame con las columnas de players_data
+
+    Se ejecuta una sola vez en la ingesta; los datos leídos después ya están tipados
+    """
+    df = df.copy()
+    for col in df.columns:
+        spec = get_column_spec(col)
+        if spec.is_text:
+            values = _clean_text(df[col], spec.nullable)
+            df[col] = values.astype('category') if spec.dtype == 'category' else values.astype('string')
+        else:
+            values = to_number(df[col])
+            if not spec.nullable:
+                values = values.fillna(0)
+            df[col] = values.astype(spec.dtype) if not spec.nullable else values
+    return df
+
+
+def arrow_type(spec):
+    """
+    Tipo de Arrow/Parquet para una columna del registro
+    """
+    if spec.dtype == 'category':
+        # Índice int32 fijo para que todos los bloques compartan el mismo esquema
+        return pa.dictionary(pa.int32(), pa.string())
+    if spec.dtype == 'string':
+        return pa.string()
+    return pa.int64() if spec.dtype == 'int64' else pa.float64()
+
+
+def arrow_schema(columns):
+    """
+    Esquema de Arrow para las columnas indicadas, marcado con la versión del registro
+    """
+    fields = [pa.field(col, arrow_type(get_column_spec(col)), nullable=True) for col in columns]
+    return pa.schema(fields, metadata={SCHEMA_METADATA_KEY: SCHEMA_VERSION.encode()})
+
+
+def has_schema(schema):
+    """
+    Indica si un esquema de Arrow (p. ej. de un Parquet) se escribió con este registro
+    """
+    metadata = schema.metadata or {}
+    return metadata.get(SCHEMA_METADATA_KEY) == SCHEMA_VERSION.encode()
@@ -0,0 +1,223 @@
+import re
+import sqlite3
+import unicodedata
+import numpy as np
+from common.schema import find_column, PLAYER_KEY_COLUMNS
+
+# Tabla FTS5 de búsqueda (texto normalizado de jugador, equipo y nacionalidad; el rowid es
+# el de la fila en players_data)
+SEARCH_TABLE = 'players_search'
+SEARCH_COLUMNS = ['Jugador', 'Equipo', 'Nacionalidad']
+
+# Opciones que se envían como máximo al selector de jugador en cada ejecución
+MAX_PLAYER_OPTIONS = 200
+
+# Letras que la descomposición Unicode no separa en letra base + acento
+_EXTRA_LETTERS = str.maketrans({'ø': 'o', 'ł': 'l', 'đ': 'd', 'ð': 'd', 'þ': 'th', 'ß': 'ss',
+                                'æ': 'ae', 'œ': 'oe', 'ı': 'i'})
+
+# Signos y separadores (todo lo que no es letra o número)
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize_search_text(text):
+    """
+    Normaliza un texto para las búsquedas: minúsculas, sin acentos ni signos ('Ødegaard'
+    -> 'odegaard', 'N'Golo' -> 'n golo')
+    """
+    if text is None or text != text:
+        return ''
+    text = str(text).casefold()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text.translate(_EXTRA_LETTERS))
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(_SEPARATORS.sub(' ', text).split())
+
+
+def match_expression(query):
+    """
+    Convierte una búsqueda en una expresión MATCH de FTS5: cada palabra es un prefijo y
+    tienen que aparecer todas (None si la búsqueda no tiene palabras)
+    """
+    words = normalize_search_text(query).split()
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def build_search_table(db_path, table_name='players_data'):
+    """
+    Crea (o reemplaza) la tabla FTS5 de búsqueda de la base de datos de una versión
+
+    El texto se guarda normalizado (ver normalize_search_text), así que las búsquedas no
+    distinguen mayúsculas ni acentos; el índice de prefijos permite buscar mientras se
+    escribe. Devuelve el número de filas indexadas (0 si SQLite no tiene FTS5)
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        available = [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+        columns = [find_column(available, name) for name in SEARCH_COLUMNS]
+        selected = ', '.join(f'"{col}"' if col else 'NULL' for col in columns)
+        rows = conn.execute(f'SELECT rowid, {selected} FROM "{table_name}"').fetchall()
+
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+            conn.execute(f"""
+                CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+                    jugador, equipo, nacionalidad,
+                    tokenize = 'unicode61', prefix = '1 2 3'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            conn.execute('ROLLBACK')
+            print(f"No se crea el índice de búsqueda (FTS5 no disponible: {e})")
+            return 0
+        conn.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, jugador, equipo, nacionalidad) VALUES (?, ?, ?, ?)',
+            ((row[0],) + tuple(normalize_search_text(value) for value in row[1:]) for row in rows)
+        )
+        conn.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+        conn.execute('COMMIT')
+        return len(rows)
+    finally:
+        conn.close()
+
+
+def update_search_table(db_path, keys, table_name='players_data'):
+    """
+    Actualiza la tabla de búsqueda tras una ingesta incremental: quita las filas que ya no
+    están en players_data y vuelve a indexar las de las claves de jugador indicadas
+    (insertadas o modificadas; un upsert conserva el rowid de la fila)
+
+    - keys: Lista de tuplas con los valores de PLAYER_KEY_COLUMNS
+    Si la tabla no existe se crea entera (ver build_search_table). Devuelve el número de
+    filas indexadas de nuevo
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if SEARCH_TABLE in tables:
+            return _update_search_rows(conn, keys, table_name)
+    finally:
+        conn.close()
+    return build_search_table(db_path, table_name)
+
+
+def _update_search_rows(conn, keys, table_name):
+    available = [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+    columns = [find_column(available, name) for name in SEARCH_COLUMNS]
+    selected = ', '.join(f'"{col}"' if col else 'NULL' for col in columns)
+    key_condition = ' AND '.join(f'"{col}" = ?' for col in PLAYER_KEY_COLUMNS)
+
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid NOT IN (SELECT rowid FROM "{table_name}")')
+    rows = [row for key in keys
+            for row in conn.execute(f'SELECT rowid, {selected} FROM "{table_name}" WHERE {key_condition}', key)]
+    conn.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = ?', ((row[0],) for row in rows))
+    conn.executemany(
+        f'INSERT INTO {SEARCH_TABLE} (rowid, jugador, equipo, nacionalidad) VALUES (?, ?, ?, ?)',
+        ((row[0],) + tuple(normalize_search_text(value) for value in row[1:]) for row in rows)
+    )
+    conn.execute('COMMIT')
+    return len(rows)
+
+
+class NameIndex:
+    """
+    Índice en memoria de los nombres de los jugadores de un dataset para buscar mientras se escribe
+
+    Guarda las palabras de cada nombre normalizado ordenadas (los prefijos se buscan con
+    dos búsquedas binarias) y los trigramas de cada nombre (las búsquedas de 3 o más letras
+    también encuentran nombres que contienen el texto en medio de una palabra). Las
+    búsquedas no distinguen mayúsculas ni acentos y devuelven posiciones del dataset
+
+    Internamente los jugadores se numeran en orden alfabético: los resultados se combinan
+    con máscaras booleanas y salen ya ordenados, sin ordenar las coincidencias en cada búsqueda
+    """
+
+    def __init__(self, names):
+        self.names = [str(name) for name in names]
+        self.size = len(self.names)
+        # Posición en el dataset del jugador de cada número (alfabético) y al revés
+        self._rows = np.argsort(np.array(self.names, dtype=object), kind='stable')
+        self._numbers = np.empty(self.size, dtype=np.int64)
+        self._numbers[self._rows] = np.arange(self.size)
+        self.keys = [normalize_search_text(self.names[row]) for row in self._rows]
+
+        # Palabras y nombres completos ordenados junto al número de su jugador
+        words = [(word, i) for i, key in enumerate(self.keys) for word in set(key.split())]
+        self._words, self._word_numbers = self._sorted([word for word, _ in words], [i for _, i in words])
+        self._keys, self._key_numbers = self._sorted(self.keys, range(self.size))
+
+        # Números de los jugadores de cada trigrama (ordenados)
+        postings = {}
+        for i, key in enumerate(self.keys):
+            for gram in {key[j:j + 3] for j in range(len(key) - 2)}:
+                postings.setdefault(gram, []).append(i)
+        self._trigrams = {gram: np.array(numbers, dtype=np.int64) for gram, numbers in postings.items()}
+
+    @staticmethod
+    def _sorted(values, numbers):
+        values = np.array(values, dtype=str)
+        order = np.argsort(values, kind='stable')
+        return values[order], np.asarray(list(numbers), dtype=np.int64)[order]
+
+    def _prefix(self, values, numbers, prefix):
+        """
+        Máscara de los jugadores con algún valor que empieza por `prefix`
+        """
+        start = np.searchsorted(values, prefix, side='left')
+        end = np.searchsorted(values, prefix + '\uffff', side='left')
+        mask = np.zeros(self.size, dtype=bool)
+        mask[numbers[start:end]] = True
+        return mask
+
+    def _substring(self, word):
+        """
+        Números de los jugadores cuyo nombre contiene `word` (al menos 3 letras) en cualquier punto
+        """
+        grams = {word[j:j + 3] for j in range(len(word) - 2)}
+        postings = sorted((self._trigrams.get(gram, np.empty(0, dtype=np.int64)) for gram in grams), key=len)
+        numbers = postings[0]
+        for posting in postings[1:]:
+            if not len(numbers):
+                break
+            numbers = np.intersect1d(numbers, posting, assume_unique=True)
+        # Los trigramas pueden aparecer separados: se comprueba el texto completo
+        return np.array([i for i in numbers if word in self.keys[i]], dtype=np.int64)
+
+    def search(self, query, limit=MAX_PLAYER_OPTIONS, rows=None):
+        """
+        Devuelve las posiciones de los jugadores cuyo nombre contiene todas las palabras
+        de la búsqueda, las mejores primero
+
+        Primero los nombres que empiezan por la búsqueda, después aquellos en los que cada
+        palabra es el comienzo de una palabra del nombre y por último el resto; dentro de
+        cada grupo, en orden alfabético
+        - rows: Posiciones entre las que se busca (p. ej. las de los filtros seleccionados)
+        """
+        normalized = normalize_search_text(query)
+        words = normalized.split()
+        if not words:
+            return np.empty(0, dtype=np.int64)
+
+        matched = np.ones(self.size, dtype=bool)
+        prefixes = np.ones(self.size, dtype=bool)
+        for word in words:
+            starts = self._prefix(self._words, self._word_numbers, word)
+            prefixes &= starts
+            if len(word) >= 3:
+                starts[self._substring(word)] = True
+            matched &= starts
+        if rows is not None:
+            allowed = np.zeros(self.size, dtype=bool)
+            allowed[self._numbers[np.asarray(rows, dtype=np.int64)]] = True
+            matched &= allowed
+
+        full = self._prefix(self._keys, self._key_numbers, normalized)
+        found = []
+        for mask in (matched & full, matched & prefixes & ~full, matched & ~prefixes & ~full):
+            found.append(np.flatnonzero(mask)[:limit - sum(len(numbers) for numbers in found)])
+        return self._rows[np.concatenate(found)]
@@ -0,0 +1,407 @@
+import numpy as np
+import pandas as pd
+from common.ann import ANN_EXACT_LIMIT, ANN_PROBES
+
+# Memoria máxima de cada bloque de similitudes en las consultas por lotes
+BATCH_BLOCK_BYTES = 32 * 1024 * 1024
+
+
+# Escalados y medidas de distancia disponibles
+SCALINGS = ('minmax', 'zscore')
+DISTANCES = ('cosine', 'euclidean', 'mahalanobis')
+
+# Autovalores de la covarianza por debajo de esta fracción del mayor se consideran nulos
+# (métricas que son combinación de otras, como G+A = Goles + Asistencias)
+COVARIANCE_RTOL = 1e-10
+
+
+def _loader_for(features, metrics):
+    """
+    Función que devuelve columnas de un bloque de valores ya cargado (ver FeatureStats)
+    """
+    values = np.asarray(features, dtype=np.float64)
+    columns = {metric: i for i, metric in enumerate(metrics)}
+    return lambda names: values[:, [columns[name] for name in names]]
+
+
+def _whitening_matrix(correlation):
+    """
+    Raíz de la pseudoinversa de una matriz de correlación (descarta las direcciones sin varianza)
+    """
+    eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+    keep = eigenvalues > COVARIANCE_RTOL * max(eigenvalues.max(initial=0.0), 1.0)
+    return eigenvectors[:, keep] / np.sqrt(eigenvalues[keep])
+
+
+class FeatureStats:
+    """
+    Estadísticos por métrica de un dataset (mínimo, máximo, media y desviación típica),
+    compartidos por todos los índices de la misma versión
+
+    Los de cada métrica se calculan la primera vez que se piden y se memorizan, así que
+    solo se leen las métricas que se usan. La matriz de blanqueo de Mahalanobis depende
+    del conjunto de métricas, así que también se calcula al pedirla y se memoriza
+    """
+
+    def __init__(self, features, metrics, loader=None):
+        """
+        Parámetros:
+        - features: DataFrame o array (n_jugadores x n_métricas) con los valores originales
+          (None si se indica loader)
+        - metrics: Lista de métricas en el mismo orden que las columnas de features
+        - loader: Función opcional que recibe una lista de métricas y devuelve sus valores
+          (n_jugadores x métricas), en lugar de features
+        """
+        self.metrics = list(metrics)
+        self._columns = {metric: i for i, metric in enumerate(self.metrics)}
+        self._loader = loader or _loader_for(features, self.metrics)
+
+        self.min = np.zeros(len(self.metrics))
+        self.max = np.ones(len(self.metrics))
+        self.mean = np.zeros(len(self.metrics))
+        self.std = np.ones(len(self.metrics))
+        self._ready = np.zeros(len(self.metrics), dtype=bool)
+        self._whitening = {}
+
+    def has(self, metrics):
+        return all(metric in self._columns for metric in metrics)
+
+    def _values(self, metrics):
+        return np.nan_to_num(np.asarray(self._loader(list(metrics)), dtype=np.float64), nan=0.0)
+
+    def _load(self, metrics):
+        missing = [metric for metric in dict.fromkeys(metrics) if not self._ready[self._columns[metric]]]
+        if not missing:
+            return
+        values = self._values(missing)
+        columns = [self._columns[metric] for metric in missing]
+        if len(values):
+            self.min[columns] = values.min(axis=0)
+            self.max[columns] = values.max(axis=0)
+            self.mean[columns] = values.mean(axis=0)
+            self.std[columns] = values.std(axis=0)
+        self._ready[columns] = True
+
+    def select(self, metrics):
+        """
+        Devuelve (min, max, media, desviación típica) de las métricas indicadas
+        """
+        self._load(metrics)
+        columns = [self._columns[metric] for metric in metrics]
+        return self.min[columns], self.max[columns], self.mean[columns], self.std[columns]
+
+    def whitening(self, metrics):
+        """
+        Devuelve la matriz W tal que la distancia euclídea entre filas estandarizadas
+        (z-score) multiplicadas por W es la distancia de Mahalanobis
+
+        Es la raíz de la pseudoinversa de la matriz de correlación de esas métricas
+        (las direcciones sin varianza se descartan)
+        """
+        key = tuple(metrics)
+        if key not in self._whitening:
+            values = self._values(metrics)
+            std = self.select(metrics)[3].copy()
+            std[std == 0] = 1.0
+            # Misma ddof (0) que la desviación típica del z-score: la diagonal es exactamente 1
+            covariance = np.cov(values, rowvar=False, ddof=0).reshape(len(metrics), len(metrics)) \
+                if len(values) > 1 else np.eye(len(metrics))
+            self._whitening[key] = _whitening_matrix(covariance / np.outer(std, std))
+        return self._whitening[key]
+
+
+class GroupStats:
+    """
+    Normalización relativa a un grupo (posición o liga): estadísticos por métrica de cada
+    grupo y métricas ya escaladas dentro de su grupo
+
+    Los grupos se calculan al construir el objeto; los estadísticos de cada métrica (con
+    una sola agrupación groupby) y sus columnas escaladas se calculan la primera vez que
+    se usa y se memorizan, así que los índices y los radares relativos solo seleccionan
+    columnas. Las filas sin grupo se escalan con los estadísticos de todo el dataset
+    """
+
+    def __init__(self, features, metrics, groups, loader=None):
+        """
+        Parámetros:
+        - features: DataFrame o array (n_jugadores x n_métricas) con los valores originales
+          (None si se indica loader)
+        - metrics: Lista de métricas en el mismo orden que las columnas de features
+        - groups: Grupo de cada fila (p. ej. la columna de posición)
+        - loader: Función opcional que recibe una lista de métricas y devuelve sus valores
+          (n_jugadores x métricas), en lugar de features
+        """
+        self.metrics = list(metrics)
+        self._columns = {metric: i for i, metric in enumerate(self.metrics)}
+        self._loader = loader or _loader_for(features, self.metrics)
+        self.codes, self.groups = pd.factorize(np.asarray(groups, dtype=object))
+
+        # Una fila por grupo (en el orden de los códigos) y al final la del dataset completo,
+        # que es la que toman las filas sin grupo (código -1)
+        shape = (len(self.groups) + 1, len(self.metrics))
+        self.min = np.zeros(shape)
+        self.max = np.ones(shape)
+        self.mean = np.zeros(shape)
+        self.std = np.ones(shape)
+        self._scaled = {scaling: {} for scaling in SCALINGS}
+        self._whitening = {}
+
+    def has(self, metrics):
+        return all(metric in self._columns for metric in metrics)
+
+    def _load(self, metrics):
+        missing = [metric for metric in dict.fromkeys(metrics) if metric not in self._scaled['minmax']]
+        if not missing:
+            return
+        values = np.nan_to_num(np.asarray(self._loader(missing), dtype=np.float64), nan=0.0)
+        columns = [self._columns[metric] for metric in missing]
+        valid = self.codes >= 0
+        grouped = pd.DataFrame(values[valid]).groupby(self.codes[valid])
+
+        def by_group(aggregated, overall):
+            return np.vstack([aggregated.reindex(range(len(self.groups))).to_numpy(), overall])
+
+        self.min[:, columns] = by_group(grouped.min(), values.min(axis=0) if len(values) else 0.0)
+        self.max[:, columns] = by_group(grouped.max(), values.max(axis=0) if len(values) else 1.0)
+        self.mean[:, columns] = by_group(grouped.mean(), values.mean(axis=0) if len(values) else 0.0)
+        self.std[:, columns] = by_group(grouped.std(ddof=0), values.std(axis=0) if len(values) else 1.0)
+
+        # Columnas escaladas dentro del grupo de cada fila, para los dos escalados
+        for scaling in SCALINGS:
+            if scaling == 'zscore':
+                offset, spread = self.mean[:, columns], self.std[:, columns]
+            else:
+                offset, spread = self.min[:, columns], self.max[:, columns] - self.min[:, columns]
+            spread = np.where(spread == 0, 1.0, spread)
+            block = ((values - offset[self.codes]) / spread[self.codes]).astype(np.float32)
+            for i, metric in enumerate(missing):
+                column = block[:, i].copy()
+                column.setflags(write=False)
+                self._scaled[scaling][metric] = column
+
+    def scaled(self, scaling='minmax', metrics=None):
+        """
+        Devuelve el bloque (n_jugadores x métricas) escalado dentro del grupo de cada fila
+
+        - scaling: 'minmax' (valores entre 0 y 1 dentro del grupo) o 'zscore'
+        - metrics: Métricas que se devuelven (por defecto, todas)
+        """
+        metrics = self.metrics if metrics is None else list(metrics)
+        self._load(metrics)
+        return np.column_stack([self._scaled[scaling][metric] for metric in metrics]) \
+            if metrics else np.empty((len(self.codes), 0), dtype=np.float32)
+
+    def lookup(self, positions, metrics, scaling='minmax'):
+        """
+        Devuelve los valores escalados dentro del grupo de las filas `positions` en `metrics`
+        """
+        self._load(metrics)
+        positions = np.asarray(positions)
+        return np.stack([self._scaled[scaling][metric][positions] for metric in metrics], axis=-1)
+
+    def whitening(self, metrics):
+        """
+        Igual que FeatureStats.whitening, con la correlación dentro de los grupos
+        """
+        key = tuple(metrics)
+        if key not in self._whitening:
+            block = self.scaled('zscore', metrics).astype(np.float64)
+            # ddof=0, como la desviación típica de cada grupo con la que se ha estandarizado
+            correlation = np.cov(block, rowvar=False, ddof=0).reshape(len(metrics), len(metrics)) \
+                if len(block) > 1 else np.eye(len(metrics))
+            self._whitening[key] = _whitening_matrix(correlation)
+        return self._whitening[key]
+
+
+class SimilarityIndex:
+    """
+    Índice precalculado para búsquedas de similitud entre jugadores
+
+    Se construye una sola vez por versión del dataset, conjunto de métricas y opciones:
+    guarda la matriz de características ya escalada, ponderada y transformada en float32,
+    de modo que cada consulta es un único producto matriz-vector seguido de una
+    selección parcial del top-k
+
+    - Coseno (por defecto): filas normalizadas; la puntuación es el producto escalar
+    - Euclídea y Mahalanobis: cada fila y se guarda como [y, -|y|²/2] y cada consulta x
+      como [x, 1], así el producto escalar x·y - |y|²/2 ordena igual que -|x - y|².
+      La similitud que se devuelve es 1 / (1 + distancia)
+
+    Con un backend aproximado (p. ej. common.ann.LSHIndex, solo para coseno) solo se
+    puntúan los candidatos que devuelve el backend, y el resultado se reordena de forma exacta
+    """
+
+    def __init__(self, features, metrics, backend=None, weights=None, scaling='minmax',
+                 distance='cosine', stats=None, relative=None):
+        """
+        Parámetros:
+        - features: DataFrame o array (n_jugadores x n_métricas) con los valores originales
+        - metrics: Lista de métricas en el mismo orden que las columnas de features
+        - backend: Índice aproximado opcional con un método candidates(vector, probes)
+        - weights: Peso de cada métrica (opcional, por defecto todas pesan 1)
+        - scaling: 'minmax' o 'zscore' (Mahalanobis siempre estandariza con z-score)
+        - distance: 'cosine', 'euclidean' o 'mahalanobis'
+        - stats: FeatureStats precalculado del dataset (opcional). Si no se proporciona
+          o no incluye todas las métricas se calculan a partir de features
+        - relative: GroupStats del dataset (opcional) para escalar cada jugador respecto a
+          su grupo (posición o liga) en lugar de respecto a todos los jugadores
+        """
+        if scaling not in SCALINGS:
+            raise ValueError(f"Escalado desconocido: {scaling}")
+        if distance not in DISTANCES:
+            raise ValueError(f"Medida de distancia desconocida: {distance}")
+
+        self.metrics = list(metrics)
+        self.backend = backend
+        self.scaling = scaling
+        self.distance = distance
+
+        if relative is not None and relative.has(self.metrics):
+            # Bloque ya escalado dentro del grupo de cada jugador: solo se seleccionan columnas
+            block_scaling = 'zscore' if distance == 'mahalanobis' else scaling
+            scaled = relative.scaled(block_scaling, self.metrics).astype(np.float64)
+            stats = relative
+        else:
+            values = np.asarray(features, dtype=np.float64)
+            values = np.nan_to_num(values, nan=0.0)
+            if stats is None or not stats.has(self.metrics):
+                stats = FeatureStats(values, self.metrics)
+            scaled = self._scale(values, stats, 'zscore' if distance == 'mahalanobis' else scaling)
+
+        if weights is not None:
+            scaled = scaled * np.sqrt(np.clip(np.asarray(weights, dtype=np.float64), 0.0, None))
+
+        if distance == 'cosine':
+            # Normalizar filas para que el producto escalar sea la similitud de coseno
+            norms = np.linalg.norm(scaled, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.matrix = (scaled / norms).astype(np.float32)
+            self.queries = self.matrix
+            self.sq_norms = None
+        else:
+            if distance == 'mahalanobis':
+                scaled = scaled @ stats.whitening(self.metrics)
+            # Centrar no cambia las distancias y reduce el error de redondeo en float32
+            if len(scaled):
+                scaled = scaled - scaled.mean(axis=0)
+            sq_norms = np.einsum('ij,ij->i', scaled, scaled)
+            self.matrix = np.hstack([scaled, -0.5 * sq_norms[:, None]]).astype(np.float32)
+            self.queries = np.hstack([scaled, np.ones((len(scaled), 1))]).astype(np.float32)
+            self.queries.setflags(write=False)
+            self.sq_norms = sq_norms.astype(np.float32)
+        self.matrix.setflags(write=False)
+
+    def _scale(self, values, stats, scaling):
+        col_min, col_max, col_mean, col_std = stats.select(self.metrics)
+        if scaling == 'zscore':
+            # Estandarización (equivalente a StandardScaler)
+            col_std = np.where(col_std == 0, 1.0, col_std)
+            return (values - col_mean) / col_std
+        # Escalado min-max por columna (equivalente a MinMaxScaler)
+        col_range = col_max - col_min
+        col_range[col_range == 0] = 1.0
+        return (values - col_min) / col_range
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def scores(self, position):
+        """
+        Devuelve la puntuación (mayor = más parecido) del jugador en la fila `position`
+        con todos los demás
+        """
+        return self.matrix @ self.queries[position]
+
+    def similarity(self, position, scores):
+        """
+        Convierte puntuaciones del jugador `position` en similitudes (coseno, o 1 / (1 + distancia))
+        """
+        if self.sq_norms is None:
+            return scores
+        distances = np.sqrt(np.maximum(self.sq_norms[position] - 2.0 * scores, 0.0))
+        return (1.0 / (1.0 + distances)).astype(np.float32)
+
+    def top_k(self, position, k, mask=None, probes=ANN_PROBES):
+        """
+        Devuelve (posiciones, similitudes) de los k jugadores más parecidos al de la fila `position`
+
+        - mask: Array booleano opcional con las filas candidatas; solo esas filas se puntúan
+        - probes: Buckets vecinos por tabla que consulta el backend aproximado (si lo hay)
+        El propio jugador nunca se incluye en el resultado
+        """
+        candidates = np.ones(len(self), dtype=bool) if mask is None else np.array(mask, dtype=bool)
+        candidates[position] = False
+        candidate_positions = np.flatnonzero(candidates)
+
+        # Con muchos candidatos, reducirlos con el backend aproximado (si devuelve
+        # suficientes se reordenan de forma exacta; si no, se puntúan todos)
+        if self.backend is not None and len(candidate_positions) > ANN_EXACT_LIMIT:
+            approximate = self.backend.candidates(self.queries[position], probes)
+            approximate = approximate[candidates[approximate]]
+            if len(approximate) >= k:
+                candidate_positions = approximate
+
+        if k <= 0 or len(candidate_positions) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Solo se puntúan las filas candidatas (los filtros se aplican antes del producto)
+        if len(candidate_positions) == len(self) - 1:
+            candidate_scores = self.scores(position)[candidate_positions]
+        else:
+            candidate_scores = self.matrix[candidate_positions] @ self.queries[position]
+
+        # Selección parcial: solo se ordenan los k mejores
+        if k < len(candidate_scores):
+            best = np.argpartition(-candidate_scores, k - 1)[:k]
+        else:
+            best = np.arange(len(candidate_scores))
+        best = best[np.argsort(-candidate_scores[best], kind='stable')]
+
+        return candidate_positions[best], self.similarity(position, candidate_scores[best])
+
+    def top_k_batch(self, positions, k, mask=None, exclude=None, block_bytes=BATCH_BLOCK_BYTES):
+        """
+        Devuelve (posiciones, similitudes) de los k jugadores más parecidos a cada una de las
+        filas `positions`, con un producto de matrices por bloques sobre candidatos compartidos
+
+        - mask: Array booleano opcional con las filas candidatas (común a todas las consultas)
+        - exclude: Lista opcional (una por consulta) de filas que no pueden ser resultado
+        Ambos arrays son de forma (consultas, k), ordenados de mayor a menor similitud; si
+        una consulta tiene menos de k candidatos, el resto se rellena con posición -1 y
+        similitud -inf. Cada jugador nunca aparece en su propio resultado
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        candidates = np.ones(len(self), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        candidate_positions = np.flatnonzero(candidates)
+        k = max(0, min(k, len(candidate_positions)))
+
+        result_positions = np.full((len(positions), k), -1, dtype=np.int64)
+        result_scores = np.full((len(positions), k), -np.inf, dtype=np.float32)
+        if k == 0 or len(positions) == 0:
+            return result_positions, result_scores
+
+        candidate_matrix = self.matrix[candidate_positions]
+        block_rows = max(1, block_bytes // (4 * len(candidate_positions)))
+
+        for start in range(0, len(positions), block_rows):
+            block_positions = positions[start:start + block_rows]
+            block = self.queries[block_positions] @ candidate_matrix.T
+
+            # Excluir a cada jugador de su resultado (y las filas indicadas en exclude)
+            for row, position in enumerate(block_positions):
+                excluded = np.array([position]) if exclude is None else np.append(exclude[start + row], position)
+                columns = np.minimum(np.searchsorted(candidate_positions, excluded), len(candidate_positions) - 1)
+                block[row, columns[candidate_positions[columns] == excluded]] = -np.inf
+
+            best = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(block, best, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            best = np.take_along_axis(best, order, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+            valid = np.isfinite(best_scores)
+            result_positions[start:start + len(block_positions)] = np.where(valid, candidate_positions[best], -1)
+            result_scores[start:start + len(block_positions)] = np.where(
+                valid, self.similarity(block_positions[:, None], best_scores), -np.inf)
+
+        return result_positions, result_scores
@@ -0,0 +1,37 @@
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def build_arrow_snapshot(parquet_path, snapshot_path):
+    """
+    Escribe el Parquet de una versión como instantánea Arrow IPC (Feather v2) sin comprimir
+
+    Sin compresión, los buffers del archivo son directamente los de las columnas, así que
+    se pueden proyectar en memoria (mmap) sin decodificarlos. Escritura atómica; devuelve
+    el número de filas escritas
+    """
+    # Un único bloque por columna: convertirla a pandas no necesita concatenar trozos
+    table = pq.read_table(parquet_path).combine_chunks()
+    tmp_path = f"{snapshot_path}.tmp"
+    try:
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, snapshot_path)
+    return table.num_rows
+
+
+def open_arrow_snapshot(snapshot_path):
+    """
+    Abre una instantánea Arrow IPC proyectada en memoria (sin copiar ni decodificar)
+
+    Las columnas de la tabla apuntan a las páginas del archivo: varios procesos que abren
+    la misma instantánea comparten una única copia en la caché de páginas del sistema
+    """
+    source = pa.memory_map(snapshot_path, 'r')
+    return pa.ipc.open_file(source).read_all()
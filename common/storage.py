@@ -0,0 +1,161 @@
+import os
+import shutil
+import sqlite3
+from datetime import datetime
+
+# Carpeta de datos y estructura de versiones:
+#   data/CURRENT                  -> nombre de la versión publicada
+#   data/versions/<versión>/...   -> archivos de cada versión (Parquet, SQLite, manifiesto,
+#                                    Parquet particionado por liga/temporada...)
+DATA_DIR = 'data'
+VERSIONS_DIR = os.path.join(DATA_DIR, 'versions')
+CURRENT_POINTER = os.path.join(DATA_DIR, 'CURRENT')
+
+PARQUET_NAME = 'fbref_data.parquet'
+DB_NAME = 'fbref_data.db'
+MANIFEST_NAME = 'fbref_manifest.parquet'
+ANN_DIR_NAME = 'fbref_ann'
+PERCENTILES_NAME = 'fbref_percentiles.parquet'
+PARTITIONED_DIR_NAME = 'fbref_partitioned'
+SNAPSHOT_NAME = 'fbref_data.arrow'
+EXCEL_PATH = os.path.join(DATA_DIR, 'jugadores_formateados.xlsx')
+
+# Versiones que se conservan en disco (la publicada y las anteriores más recientes)
+KEEP_VERSIONS = 3
+
+# Prefijo de la versión cuando los datos están directamente en data/ (sin versionado)
+LEGACY_VERSION_PREFIX = 'legacy-'
+
+# Última lectura del puntero, para no releerlo si no ha cambiado
+_pointer_cache = {'stat': None, 'version': None}
+
+
+def dataset_paths(version=None):
+    """
+    Devuelve las rutas de los archivos de una versión del dataset
+
+    Sin versión (o con una versión 'legacy-') se usan los archivos directamente en data/
+    """
+    if version is None or version.startswith(LEGACY_VERSION_PREFIX):
+        base_dir = DATA_DIR
+    else:
+        base_dir = os.path.join(VERSIONS_DIR, version)
+    return {
+        'dir': base_dir,
+        'parquet': os.path.join(base_dir, PARQUET_NAME),
+        'db': os.path.join(base_dir, DB_NAME),
+        'manifest': os.path.join(base_dir, MANIFEST_NAME),
+        'ann': os.path.join(base_dir, ANN_DIR_NAME),
+        'percentiles': os.path.join(base_dir, PERCENTILES_NAME),
+        'partitioned': os.path.join(base_dir, PARTITIONED_DIR_NAME),
+        'snapshot': os.path.join(base_dir, SNAPSHOT_NAME),
+    }
+
+
+def current_version():
+    """
+    Devuelve la versión publicada del dataset, o None si no hay ninguna disponible
+
+    Solo se consulta el puntero (un stat y, si cambió, una lectura de pocos bytes), por lo
+    que se puede llamar en cada ejecución de la aplicación. Si no hay versiones publicadas
+    pero existen datos en data/, la versión se deriva de la fecha de modificación del Parquet
+    """
+    try:
+        stat = os.stat(CURRENT_POINTER)
+    except FileNotFoundError:
+        legacy_parquet = dataset_paths()['parquet']
+        if os.path.exists(legacy_parquet):
+            return f"{LEGACY_VERSION_PREFIX}{os.stat(legacy_parquet).st_mtime_ns}"
+        return None
+
+    stat_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _pointer_cache['stat'] != stat_key:
+        with open(CURRENT_POINTER, encoding='utf-8') as f:
+            _pointer_cache['version'] = f.read().strip() or None
+        _pointer_cache['stat'] = stat_key
+    return _pointer_cache['version']
+
+
+def _copy_or_link(source, target):
+    """
+    Enlaza (hard link) o copia un archivo que nunca se modifica en el sitio
+    """
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _copy_or_link_tree(source_dir, target_dir):
+    """
+    Enlaza (o copia) archivo por archivo el contenido de una carpeta; los directorios no
+    admiten hard links
+    """
+    for root, _, files in os.walk(source_dir):
+        target_root = os.path.join(target_dir, os.path.relpath(root, source_dir))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            _copy_or_link(os.path.join(root, name), os.path.join(target_root, name))
+
+
+def prepare_version():
+    """
+    Crea la carpeta de una nueva versión partiendo de los archivos de la versión publicada
+
+    El Parquet, el manifiesto y los archivos derivados (percentiles, instantánea Arrow,
+    dataset particionado e índices aproximados) se enlazan, ya que solo se sustituyen de
+    forma atómica y nunca se modifican; la base de datos se copia con la API de backup de
+    SQLite para que la ingesta incremental pueda modificarla sin afectar a la versión publicada
+
+    Devuelve (versión, rutas)
+    """
+    version = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    paths = dataset_paths(version)
+    os.makedirs(paths['dir'])
+
+    previous = current_version()
+    if previous is not None:
+        previous_paths = dataset_paths(previous)
+        for key in ('parquet', 'manifest', 'percentiles', 'snapshot'):
+            if os.path.exists(previous_paths[key]):
+                _copy_or_link(previous_paths[key], paths[key])
+        for key in ('partitioned', 'ann'):
+            if os.path.isdir(previous_paths[key]):
+                _copy_or_link_tree(previous_paths[key], paths[key])
+        if os.path.exists(previous_paths['db']):
+            source = sqlite3.connect(previous_paths['db'])
+            target = sqlite3.connect(paths['db'])
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+
+    return version, paths
+
+
+def discard_version(version):
+    """
+    Elimina una versión que no llegó a publicarse
+    """
+    shutil.rmtree(dataset_paths(version)['dir'], ignore_errors=True)
+
+
+def publish_version(version):
+    """
+    Publica una versión cambiando el puntero CURRENT de forma atómica
+
+    Las sesiones abiertas siguen leyendo la versión anterior hasta que detectan el cambio;
+    después se eliminan las versiones más antiguas que KEEP_VERSIONS
+    """
+    tmp_pointer = f"{CURRENT_POINTER}.tmp"
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, CURRENT_POINTER)
+
+    versions = sorted(os.listdir(VERSIONS_DIR))
+    for old_version in versions[:-KEEP_VERSIONS]:
+        if old_version != version:
+            discard_version(old_version)
@@ -0,0 +1,56 @@
+import os
+import sys
+import argparse
+
+# Añadir ruta actual al path para poder importar módulos locales
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from common.neighbors import NEIGHBORS_K
+from common.ingest import build_version_artifacts, missing_artifacts
+from common.storage import current_version, prepare_version, publish_version, discard_version
+
+def calcular_vecinos(k=NEIGHBORS_K, workers=None):
+    """
+    Precalcula los vecinos de todos los jugadores para los conjuntos de métricas con nombre
+    (tabla player_neighbors) y publica el resultado como una nueva versión del dataset
+
+    La ingesta ya genera la tabla; este script sirve para recalcularla (p. ej. tras cambiar
+    los conjuntos de métricas) sin volver a leer el Excel. El resto de archivos derivados
+    se enlazan desde la versión publicada y se generan los que le falten, para que la
+    versión nueva esté completa
+    """
+    print("=== CÁLCULO DE VECINOS PRECALCULADOS ===")
+
+    if current_version() is None:
+        print("ERROR: No hay ninguna versión del dataset. Ejecuta primero 'python regenerate_data.py'")
+        return False
+
+    # La versión publicada no se modifica: se trabaja sobre una copia y se publica al final
+    version, paths = prepare_version()
+    try:
+        build_version_artifacts(paths, ['neighbors'], k=k, workers=workers)
+        missing = missing_artifacts(paths)
+        if missing:
+            print(f"La versión publicada no tiene {', '.join(missing)}: se generan")
+            build_version_artifacts(paths, missing)
+    except Exception as e:
+        discard_version(version)
+        print(f"Error al calcular los vecinos: {e}")
+        return False
+
+    publish_version(version)
+    print(f"Versión del dataset publicada: {version}")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precalcula la tabla player_neighbors")
+    parser.add_argument('--k', type=int, default=NEIGHBORS_K,
+                        help="Vecinos que se guardan por jugador y conjunto de métricas")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Hilos de cálculo (por defecto, uno por núcleo)")
+    args = parser.parse_args()
+
+    if not calcular_vecinos(args.k, args.workers):
+        sys.exit(1)
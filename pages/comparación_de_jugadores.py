@@ -5,227 +5,89 @@ import io
 import base64
 import tempfile
 import os
-from common.functions import create_radar_chart_unified, export_to_pdf, get_pdf_download_link
+from common.schema import find_column
+from common.functions import percentile_frame, export_to_pdf, get_pdf_download_link
+from common.cache import get_filter_index, get_player_options, get_player_directory, get_radar_chart, get_render_service, relative_group_columns, get_percentiles
+from common.render import RENDER_TIMEOUT
 
-def show_player_comparison(df, metrics):
+def select_player(dataset, filter_index, number, posicion_column):
+    """
+    Muestra los filtros de liga, equipo y posición y el selector de un jugador
+    
+    Las opciones de cada filtro se obtienen del índice precalculado de la cascada; el
+    selector de jugador solo recibe las coincidencias de la búsqueda (o los primeros
+    jugadores si no se busca nada). Devuelve la posición (fila) del jugador seleccionado
+    o None
+    """
+    selection = {}
+    
+    st.markdown("LIGA:")
+    ligas = ['Seleccione Liga'] + filter_index.options('liga', selection)
+    selected_liga = st.selectbox("", options=ligas, key=f"liga_{number}", label_visibility="collapsed")
+    
+    # Filtrar por liga seleccionada
+    if selected_liga != 'Seleccione Liga':
+        selection['liga'] = selected_liga
+    
+    st.markdown("EQUIPO:")
+    equipos = ['Seleccione Equipo'] + filter_index.options('equipo', selection)
+    selected_equipo = st.selectbox("", options=equipos, key=f"equipo_{number}", label_visibility="collapsed")
+    
+    # Filtrar por equipo seleccionado
+    if selected_equipo != 'Seleccione Equipo':
+        selection['equipo'] = selected_equipo
+    
+    st.markdown("POSICIÓN:")
+    if posicion_column:
+        # Las posiciones vacías ya llegan como nulas desde la ingesta
+        posiciones = ['Seleccione Posición'] + filter_index.options(posicion_column, selection)
+        selected_posicion = st.selectbox("", options=posiciones, key=f"posicion_{number}", label_visibility="collapsed")
+        
+        # Filtrar por posición seleccionada
+        if selected_posicion != 'Seleccione Posición':
+            selection[posicion_column] = selected_posicion
+    else:
+        st.selectbox("", options=['Posición no disponible'], key=f"posicion_{number}_na", label_visibility="collapsed")
+    
+    st.markdown("JUGADOR:")
+    query = st.text_input("", key=f"buscar_{number}", placeholder="Buscar jugador, equipo o nacionalidad",
+                          label_visibility="collapsed")
+    # Las opciones son posiciones de fila (el estado de la sesión solo guarda un entero)
+    directory = get_player_directory(dataset)
+    players_list = [None] + get_player_options(dataset, selection, query)
+    return st.selectbox("", options=players_list, key=f"player_{number}", label_visibility="collapsed",
+                        format_func=lambda row: 'Seleccione Jugador' if row is None else directory.label(row))
+
+def show_player_comparison(dataset, metrics):
     """
     Muestra la página de comparación de jugadores
+    
+    - dataset: DatasetHandle con los datos preparados (ver common.cache.prepare_player_data)
     """
+    # Solo identificadores; las métricas se leen al seleccionarlas
+    df = dataset.frame()
+    
     # Título de la página
     st.title("COMPARACIÓN DE JUGADORES")
     
     # Crear 4 columnas para los jugadores
-    col1, col2, col3, col4 = st.columns(4)
+    player_columns = st.columns(4)
     
-    # Lista para almacenar los jugadores seleccionados
+    # Lista para almacenar los jugadores seleccionados (posiciones de fila)
     selected_players = []
     
-    # Verificar si la columna 'Posición' existe
-    posicion_column = None
-    for col in df.columns:
-        if col == 'Posición' or col == 'posición' or col == 'Posicion' or col == 'posicion':
-            posicion_column = col
-            # Asegurarse de que la columna de posición se trate como texto
-            df[posicion_column] = df[posicion_column].astype(str)
-            # Reemplazar los valores '0' o '0.0' con valores vacíos
-            df[posicion_column] = df[posicion_column].replace(['0', '0.0', 'nan', 'None', 'NaN'], '')
-            break
-    
-    # JUGADOR 1
-    with col1:
-        st.markdown("LIGA:")
-        ligas1 = ['Seleccione Liga']
-        if 'liga' in df.columns:
-            ligas1 += sorted(df['liga'].dropna().unique().tolist())
-        selected_liga1 = st.selectbox("", options=ligas1, key="liga_1", label_visibility="collapsed")
-        
-        # Filtrar por liga seleccionada
-        filtered_df1 = df.copy()
-        if selected_liga1 != 'Seleccione Liga' and 'liga' in df.columns:
-            filtered_df1 = filtered_df1[filtered_df1['liga'] == selected_liga1]
-        
-        st.markdown("EQUIPO:")
-        equipos1 = ['Seleccione Equipo']
-        if 'equipo' in filtered_df1.columns:
-            equipos1 += sorted(filtered_df1['equipo'].dropna().unique().tolist())
-        selected_equipo1 = st.selectbox("", options=equipos1, key="equipo_1", label_visibility="collapsed")
-        
-        # Filtrar por equipo seleccionado
-        if selected_equipo1 != 'Seleccione Equipo' and 'equipo' in filtered_df1.columns:
-            filtered_df1 = filtered_df1[filtered_df1['equipo'] == selected_equipo1]
-        
-        st.markdown("POSICIÓN:")
-        if posicion_column:
-            # Filtrar posiciones vacías y valores únicos
-            posiciones1 = ['Seleccione Posición']
-            pos_values = filtered_df1[posicion_column].dropna().unique().tolist()
-            pos_values = [p for p in pos_values if p and p.strip() and p != '0' and p != '0.0' and p.lower() != 'nan']
-            if pos_values:
-                posiciones1 += sorted(pos_values)
-            selected_posicion1 = st.selectbox("", options=posiciones1, key="posicion_1", label_visibility="collapsed")
-            
-            # Filtrar por posición seleccionada
-            if selected_posicion1 != 'Seleccione Posición':
-                filtered_df1 = filtered_df1[filtered_df1[posicion_column] == selected_posicion1]
-        else:
-            st.selectbox("", options=['Posición no disponible'], key="posicion_1_na", label_visibility="collapsed")
-        
-        st.markdown("JUGADOR:")
-        players_list1 = ['Seleccione Jugador']
-        if 'player_name' in filtered_df1.columns:
-            players_list1 += filtered_df1['player_name'].sort_values().unique().tolist()
-        player1 = st.selectbox("", options=players_list1, key="player_1", label_visibility="collapsed")
-        
-        # Añadir el jugador seleccionado
-        if player1 != 'Seleccione Jugador':
-            selected_players.append(player1)
+    # Verificar si la columna 'Posición' existe (los tipos ya vienen aplicados desde la ingesta)
+    posicion_column = find_column(df.columns, 'Posición')
     
-    # JUGADOR 2
-    with col2:
-        st.markdown("LIGA:")
-        ligas2 = ['Seleccione Liga']
-        if 'liga' in df.columns:
-            ligas2 += sorted(df['liga'].dropna().unique().tolist())
-        selected_liga2 = st.selectbox("", options=ligas2, key="liga_2", label_visibility="collapsed")
-        
-        # Filtrar por liga seleccionada
-        filtered_df2 = df.copy()
-        if selected_liga2 != 'Seleccione Liga' and 'liga' in df.columns:
-            filtered_df2 = filtered_df2[filtered_df2['liga'] == selected_liga2]
-        
-        st.markdown("EQUIPO:")
-        equipos2 = ['Seleccione Equipo']
-        if 'equipo' in filtered_df2.columns:
-            equipos2 += sorted(filtered_df2['equipo'].dropna().unique().tolist())
-        selected_equipo2 = st.selectbox("", options=equipos2, key="equipo_2", label_visibility="collapsed")
-        
-        # Filtrar por equipo seleccionado
-        if selected_equipo2 != 'Seleccione Equipo' and 'equipo' in filtered_df2.columns:
-            filtered_df2 = filtered_df2[filtered_df2['equipo'] == selected_equipo2]
-        
-        st.markdown("POSICIÓN:")
-        if posicion_column:
-            # Filtrar posiciones vacías y valores únicos
-            posiciones2 = ['Seleccione Posición']
-            pos_values = filtered_df2[posicion_column].dropna().unique().tolist()
-            pos_values = [p for p in pos_values if p and p.strip() and p != '0' and p != '0.0' and p.lower() != 'nan']
-            if pos_values:
-                posiciones2 += sorted(pos_values)
-            selected_posicion2 = st.selectbox("", options=posiciones2, key="posicion_2", label_visibility="collapsed")
+    # Selectores de los 4 jugadores (comparten el índice de filtros del dataset)
+    filter_index = get_filter_index(dataset)
+    for number, column in enumerate(player_columns, start=1):
+        with column:
+            player = select_player(dataset, filter_index, number, posicion_column)
             
-            # Filtrar por posición seleccionada
-            if selected_posicion2 != 'Seleccione Posición':
-                filtered_df2 = filtered_df2[filtered_df2[posicion_column] == selected_posicion2]
-        else:
-            st.selectbox("", options=['Posición no disponible'], key="posicion_2_na", label_visibility="collapsed")
-        
-        st.markdown("JUGADOR:")
-        players_list2 = ['Seleccione Jugador']
-        if 'player_name' in filtered_df2.columns:
-            players_list2 += filtered_df2['player_name'].sort_values().unique().tolist()
-        player2 = st.selectbox("", options=players_list2, key="player_2", label_visibility="collapsed")
-        
-        # Añadir el jugador seleccionado
-        if player2 != 'Seleccione Jugador':
-            selected_players.append(player2)
-    
-    # JUGADOR 3
-    with col3:
-        st.markdown("LIGA:")
-        ligas3 = ['Seleccione Liga']
-        if 'liga' in df.columns:
-            ligas3 += sorted(df['liga'].dropna().unique().tolist())
-        selected_liga3 = st.selectbox("", options=ligas3, key="liga_3", label_visibility="collapsed")
-        
-        # Filtrar por liga seleccionada
-        filtered_df3 = df.copy()
-        if selected_liga3 != 'Seleccione Liga' and 'liga' in df.columns:
-            filtered_df3 = filtered_df3[filtered_df3['liga'] == selected_liga3]
-        
-        st.markdown("EQUIPO:")
-        equipos3 = ['Seleccione Equipo']
-        if 'equipo' in filtered_df3.columns:
-            equipos3 += sorted(filtered_df3['equipo'].dropna().unique().tolist())
-        selected_equipo3 = st.selectbox("", options=equipos3, key="equipo_3", label_visibility="collapsed")
-        
-        # Filtrar por equipo seleccionado
-        if selected_equipo3 != 'Seleccione Equipo' and 'equipo' in filtered_df3.columns:
-            filtered_df3 = filtered_df3[filtered_df3['equipo'] == selected_equipo3]
-        
-        st.markdown("POSICIÓN:")
-        if posicion_column:
-            # Filtrar posiciones vacías y valores únicos
-            posiciones3 = ['Seleccione Posición']
-            pos_values = filtered_df3[posicion_column].dropna().unique().tolist()
-            pos_values = [p for p in pos_values if p and p.strip() and p != '0' and p != '0.0' and p.lower() != 'nan']
-            if pos_values:
-                posiciones3 += sorted(pos_values)
-            selected_posicion3 = st.selectbox("", options=posiciones3, key="posicion_3", label_visibility="collapsed")
-            
-            # Filtrar por posición seleccionada
-            if selected_posicion3 != 'Seleccione Posición':
-                filtered_df3 = filtered_df3[filtered_df3[posicion_column] == selected_posicion3]
-        else:
-            st.selectbox("", options=['Posición no disponible'], key="posicion_3_na", label_visibility="collapsed")
-        
-        st.markdown("JUGADOR:")
-        players_list3 = ['Seleccione Jugador']
-        if 'player_name' in filtered_df3.columns:
-            players_list3 += filtered_df3['player_name'].sort_values().unique().tolist()
-        player3 = st.selectbox("", options=players_list3, key="player_3", label_visibility="collapsed")
-        
-        # Añadir el jugador seleccionado
-        if player3 != 'Seleccione Jugador':
-            selected_players.append(player3)
-    
-    # JUGADOR 4
-    with col4:
-        st.markdown("LIGA:")
-        ligas4 = ['Seleccione Liga']
-        if 'liga' in df.columns:
-            ligas4 += sorted(df['liga'].dropna().unique().tolist())
-        selected_liga4 = st.selectbox("", options=ligas4, key="liga_4", label_visibility="collapsed")
-        
-        # Filtrar por liga seleccionada
-        filtered_df4 = df.copy()
-        if selected_liga4 != 'Seleccione Liga' and 'liga' in df.columns:
-            filtered_df4 = filtered_df4[filtered_df4['liga'] == selected_liga4]
-        
-        st.markdown("EQUIPO:")
-        equipos4 = ['Seleccione Equipo']
-        if 'equipo' in filtered_df4.columns:
-            equipos4 += sorted(filtered_df4['equipo'].dropna().unique().tolist())
-        selected_equipo4 = st.selectbox("", options=equipos4, key="equipo_4", label_visibility="collapsed")
-        
-        # Filtrar por equipo seleccionado
-        if selected_equipo4 != 'Seleccione Equipo' and 'equipo' in filtered_df4.columns:
-            filtered_df4 = filtered_df4[filtered_df4['equipo'] == selected_equipo4]
-        
-        st.markdown("POSICIÓN:")
-        if posicion_column:
-            # Filtrar posiciones vacías y valores únicos
-            posiciones4 = ['Seleccione Posición']
-            pos_values = filtered_df4[posicion_column].dropna().unique().tolist()
-            pos_values = [p for p in pos_values if p and p.strip() and p != '0' and p != '0.0' and p.lower() != 'nan']
-            if pos_values:
-                posiciones4 += sorted(pos_values)
-            selected_posicion4 = st.selectbox("", options=posiciones4, key="posicion_4", label_visibility="collapsed")
-            
-            # Filtrar por posición seleccionada
-            if selected_posicion4 != 'Seleccione Posición':
-                filtered_df4 = filtered_df4[filtered_df4[posicion_column] == selected_posicion4]
-        else:
-            st.selectbox("", options=['Posición no disponible'], key="posicion_4_na", label_visibility="collapsed")
-        
-        st.markdown("JUGADOR:")
-        players_list4 = ['Seleccione Jugador']
-        if 'player_name' in filtered_df4.columns:
-            players_list4 += filtered_df4['player_name'].sort_values().unique().tolist()
-        player4 = st.selectbox("", options=players_list4, key="player_4", label_visibility="collapsed")
-        
-        # Añadir el jugador seleccionado
-        if player4 != 'Seleccione Jugador':
-            selected_players.append(player4)
+            # Añadir el jugador seleccionado
+            if player is not None:
+                selected_players.append(player)
     
     # Segunda sección: Instrucciones y métricas
     left_col, right_col = st.columns(2)
@@ -242,16 +104,8 @@ def show_player_comparison(df, metrics):
     with right_col:
         st.header("MÉTRICAS")
         
-        # Filtrar solo métricas numéricas y excluir las no deseadas
-        exclude_metrics = ['posición', 'año nacimiento', 'minutos jugados', 'posicion', 
-                          'año', 'nacimiento', 'minutos', 'jugados', 'player_name', 
-                          'pais', 'liga', 'equipo', 'nacionalidad']
-        
-        # Filtrar métricas válidas
-        numeric_metrics = []
-        for m in metrics:
-            if not any(exclude in m.lower() for exclude in exclude_metrics):
-                numeric_metrics.append(m)
+        # La lista de métricas ya viene filtrada por el registro de columnas
+        numeric_metrics = list(metrics)
         
         # Selección de métricas
         selected_metrics = st.multiselect(
@@ -259,6 +113,22 @@ def show_player_comparison(df, metrics):
             options=numeric_metrics,
             default=numeric_metrics[:5] if len(numeric_metrics) > 5 else numeric_metrics
         )
+        df = dataset.frame(selected_metrics)
+        
+        # Escala del radar: respecto a los jugadores seleccionados, a su posición/liga o
+        # percentiles precalculados por posición y liga
+        percentile_label = 'Percentil por posición y liga'
+        relative_labels = {'Respecto a los jugadores seleccionados': None}
+        relative_labels.update({f"Relativa a la {name.lower()}": column
+                                for name, column in relative_group_columns(dataset).items()})
+        relative_labels[percentile_label] = None
+        radar_scale = st.selectbox(
+            "Normalización del radar:",
+            options=list(relative_labels),
+            key="comparison_relative"
+        )
+        selected_relative = relative_labels[radar_scale]
+        percentiles = get_percentiles(dataset)
     
     # Sección para el gráfico radar
     if selected_players and selected_metrics:
@@ -272,8 +142,10 @@ def show_player_comparison(df, metrics):
             'rgb(100,100,100)'   # gris
         ]
         
-        # Crear y mostrar el gráfico radar personalizado
-        fig = create_radar_chart_unified(df, selected_players, selected_metrics)
+        # Crear y mostrar el gráfico radar personalizado (guardado por jugadores, métricas y escala)
+        directory = get_player_directory(dataset)
+        fig = get_radar_chart(dataset, tuple(directory.ids[selected_players].tolist()), tuple(selected_metrics),
+                              selected_relative, radar_scale == percentile_label)
         st.plotly_chart(fig, use_container_width=True)
         
         # Estilo CSS para los botones
@@ -321,9 +193,6 @@ def show_player_comparison(df, metrics):
                 try:
                     # Mostrar mensaje de carga
                     with st.spinner("Generando PDF..."):
-                        # Generar imagen de alta calidad del gráfico
-                        img_buffer = io.BytesIO()
-                
                         # Configurar la figura con mayor calidad y tamaño para PDF
                         fig.update_layout(
                             width=1000,  # Mayor ancho para mejor calidad
@@ -333,21 +202,24 @@ def show_player_comparison(df, metrics):
                             title_x=0.5  # Centrar título
                         )
                 
-                        # Usar formato 'png' con alta resolución
-                        fig.write_image(img_buffer, format='png', scale=2)  # scale=2 duplica la resolución
-                        img_buffer.seek(0)
+                        # Generar la imagen en los procesos de renderizado (formato 'png', scale=2
+                        # duplica la resolución) mientras se preparan los datos del PDF
+                        image = get_render_service().submit(fig, format='png', scale=2)
                 
                         # Crear datos para el PDF
                         player_data = {}
                         for i, player in enumerate(selected_players):
-                            player_data[f"Jugador {i+1}"] = player
+                            label = directory.label(player)
+                            player_data[f"Jugador {i+1}"] = label
                     
                             # Añadir métricas del jugador
-                            player_df = df[df['player_name'] == player]
                             for metric in selected_metrics:
-                                if not player_df.empty and metric in player_df.columns:
-                                    value = player_df[metric].values[0]
-                                    player_data[f"{player} - {metric}"] = f"{value:.2f}"
+                                if metric in df.columns:
+                                    value = df[metric].to_numpy()[player]
+                                    player_data[f"{label} - {metric}"] = f"{value:.2f}"
+                
+                        # Esperar a la imagen del gráfico
+                        img_buffer = io.BytesIO(image.result(RENDER_TIMEOUT))
                 
                         # Generar PDF mejorado incluyendo dataframe para tabla
                         # Pasamos nombre corto para el título - los jugadores se generarán automáticamente
@@ -379,11 +251,9 @@ def show_player_comparison(df, metrics):
         # Mostrar tabla con datos detallados
         st.header("DATOS DETALLADOS")
         
-        comparison_df = df[df['player_name'].isin(selected_players)].copy()
-        display_cols = ['player_name'] + selected_metrics
-        
-        # Formatear tabla
-        formatted_df = comparison_df[display_cols].set_index('player_name')
+        # Formatear tabla (una fila por jugador seleccionado, con su texto como índice)
+        formatted_df = df[selected_metrics].iloc[selected_players]
+        formatted_df.index = pd.Index(get_player_directory(dataset).labels(selected_players), name='player_name')
         
         # Mostrar tabla con colores para máximos y mínimos (verde oscuro y rojo oscuro)
         st.dataframe(
@@ -391,6 +261,13 @@ def show_player_comparison(df, metrics):
             use_container_width=True
         )
         
+        # Percentiles precalculados de cada jugador en su posición y liga
+        st.subheader("Percentiles por posición y liga")
+        st.dataframe(
+            percentile_frame(df, percentiles, selected_players, selected_metrics).style.format("{:.0f}", na_rep="–"),
+            use_container_width=True
+        )
+        
         # Sección para conexión a múltiples fuentes de datos
         st.markdown("---")
         with st.expander("Fuentes de datos utilizadas", expanded=False):
@@ -405,11 +282,12 @@ def show_player_comparison(df, metrics):
             with col2:
                 st.subheader("Datos desde SQLite")
                 st.info("Consultas complementarias desde base de datos SQLite")
-                # Realizamos una consulta a SQLite para mostrar datos adicionales
-                from common.cache import query_database
+                # Filas completas de los jugadores seleccionados, leídas de SQLite (consulta
+                # parametrizada y cacheada) sin pasar por los datos en memoria
+                from common.cache import query_players
                 try:
-                    query = "SELECT * FROM players_data LIMIT 3"
-                    sqlite_data = query_database(query)
+                    selected_names = df['player_name'].to_numpy()[selected_players].tolist()
+                    sqlite_data = query_players({'Jugador': selected_names}, version=dataset.version)
                     if sqlite_data is not None and not sqlite_data.empty:
                         st.dataframe(sqlite_data)
                     else:
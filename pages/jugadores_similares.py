@@ -8,25 +8,122 @@ import io
 import base64
 import tempfile
 import os
-from common.functions import find_similar_players, create_radar_chart_unified, export_to_pdf, get_pdf_download_link
+from common.schema import find_column
+from common.functions import find_similar_players, similar_from_neighbors, find_replacements, replacements_pdf_data, percentile_frame, export_to_pdf, get_pdf_download_link
+from common.cache import get_similarity_index, get_filter_index, get_player_options, get_player_directory, get_player_neighbors, get_neighbors_size, get_radar_chart, get_render_service, relative_group_columns, get_percentiles
+from common.presets import METRIC_PRESETS, preset_for_metrics
+from common.filters import BIRTH_YEAR_FILTER
+from common.render import RENDER_TIMEOUT
+from common.ann import ANN_MIN_ROWS, ANN_PROBES
 
-def show_similar_players(df, metrics):
+def search_similar_players(dataset, player, metrics, top_n, filters, options=None, probes=ANN_PROBES):
+    """
+    Busca los jugadores más parecidos a uno dado
+    
+    - player: Posición (fila) del jugador base
+    - options: Diccionario con weights, scaling, distance y relative_to (ver get_similarity_index)
+    - probes: Buckets vecinos que consulta el índice aproximado (solo con datasets grandes)
+    Si las métricas forman un conjunto con nombre y se usa la similitud por defecto
+    (coseno, min-max global, sin pesos) se usan los vecinos precalculados en la base de datos;
+    en otro caso (o si no bastan) se calcula en vivo
+    """
+    df = dataset.frame(metrics)
+    options = options or {}
+    default_similarity = (options.get('weights') is None and options.get('relative_to') is None
+                          and options.get('scaling', 'minmax') == 'minmax'
+                          and options.get('distance', 'cosine') == 'cosine')
+    preset = preset_for_metrics(metrics) if default_similarity else None
+    if preset is not None:
+        directory = get_player_directory(dataset)
+        neighbors = get_player_neighbors(dataset, preset.name, directory.ids[player])
+        similar_players_df = similar_from_neighbors(df, neighbors, player, top_n, filters, directory,
+                                                    get_neighbors_size(dataset.version, preset.name))
+        if similar_players_df is not None:
+            return similar_players_df
+    
+    return find_similar_players(
+        df,
+        player,
+        metrics,
+        top_n=top_n,
+        filters=filters,
+        index=get_similarity_index(dataset, tuple(metrics), **options),
+        probes=probes
+    )
+
+def show_squad_replacements(dataset, team, metrics, top_n, filters, options=None):
+    """
+    Muestra los reemplazos más parecidos para cada jugador de un equipo (misma posición)
+    y permite exportarlos a PDF
+    
+    Todos los jugadores de la plantilla se buscan a la vez (ver find_replacements)
+    """
+    df = dataset.frame(metrics)
+    replacements = find_replacements(
+        df,
+        metrics,
+        team=team,
+        top_n=top_n,
+        filters=filters,
+        index=get_similarity_index(dataset, tuple(metrics), **(options or {}))
+    )
+    
+    if replacements.empty:
+        st.warning("No se encontraron reemplazos que cumplan con los filtros.")
+        return
+    
+    # Formatear y mostrar tabla de reemplazos
+    replacements_display = replacements.copy()
+    replacements_display['similarity_score'] = replacements_display['similarity_score'].apply(lambda x: f"{x:.2f}")
+    replacements_display = replacements_display.drop(columns=['row', 'replacement_row'])
+    display_names = {
+        'player_name': 'Jugador', 'rank': 'Rango', 'replacement': 'Reemplazo',
+        'similarity_score': 'Puntuación de Similitud', 'equipo': 'Equipo', 'liga': 'Liga'
+    }
+    st.dataframe(
+        replacements_display.rename(columns=display_names),
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    if st.button("EXPORTAR REEMPLAZOS A PDF", key="similar_replacements_export"):
+        try:
+            with st.spinner("Generando PDF..."):
+                squad_players = list(dict.fromkeys(replacements['row'].tolist()))
+                pdf_bytes = export_to_pdf(
+                    replacements_pdf_data(replacements),
+                    None,
+                    f"Reemplazos de {team}",
+                    df,
+                    squad_players,
+                    metrics
+                )
+                st.success("PDF generado con éxito!")
+                st.markdown(
+                    get_pdf_download_link(
+                        pdf_bytes,
+                        "reemplazos_plantilla.pdf",
+                        "📥 Descargar PDF"
+                    ),
+                    unsafe_allow_html=True
+                )
+        except Exception as e:
+            st.error(f"Error al exportar a PDF: {e}")
+
+def show_similar_players(dataset, metrics):
     """
     Muestra la página para encontrar jugadores similares
+    
+    - dataset: DatasetHandle con los datos preparados (ver common.cache.prepare_player_data)
     """
+    # Solo identificadores; las métricas se leen al seleccionarlas
+    df = dataset.frame()
+    
     # Título de la página
     st.title("Búsqueda de Jugadores Similares")
     
-    # Asegurarnos que las columnas de texto se traten correctamente
-    posicion_column = None
-    for col in df.columns:
-        if col == 'Posición' or col == 'posición' or col == 'Posicion' or col == 'posicion':
-            posicion_column = col
-            # Asegurarse de que la columna de posición se trate como texto
-            df[posicion_column] = df[posicion_column].astype(str)
-            # Reemplazar los valores '0' o '0.0' con valores vacíos
-            df[posicion_column] = df[posicion_column].replace(['0', '0.0', 'nan', 'None', 'NaN'], '')
-            break
+    # Columna de posición (los tipos de texto/categoría ya vienen aplicados desde la ingesta)
+    posicion_column = find_column(df.columns, 'Posición')
     
     # Estilo CSS para reducir el espaciado entre los filtros
     st.markdown("""
@@ -65,10 +162,6 @@ def show_similar_players(df, metrics):
     </style>
     """, unsafe_allow_html=True)
     
-    if 'nacionalidad' in df.columns:
-        df['nacionalidad'] = df['nacionalidad'].astype(str)
-        df['nacionalidad'] = df['nacionalidad'].replace(['0', '0.0', 'nan', 'None', 'NaN'], '')
-    
     # Crear columnas para la interfaz
     col1, col2 = st.columns([1, 3])
     
@@ -76,60 +169,59 @@ def show_similar_players(df, metrics):
         st.subheader("Seleccionar Jugador Base")
         
         with st.expander("Filtros de Jugador Base", expanded=True):
+            # Las opciones de cada filtro se obtienen del índice precalculado de la cascada
+            filter_index = get_filter_index(dataset)
+            selection = {}
+            
             # Filtro por liga
             st.markdown("Liga:")
-            ligas = ['Todas']
-            if 'liga' in df.columns:
-                ligas += sorted(df['liga'].dropna().unique().tolist())
+            ligas = ['Todas'] + filter_index.options('liga', selection)
             
             selected_liga = st.selectbox("", options=ligas, key="similar_liga", label_visibility="collapsed")
             
             # Aplicar filtro de liga
-            filtered_df = df.copy()
-            if selected_liga != 'Todas' and 'liga' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['liga'] == selected_liga]
+            if selected_liga != 'Todas':
+                selection['liga'] = selected_liga
             
             # Filtro por equipo
             st.markdown("Equipo:")
-            equipos = ['Todos']
-            if 'equipo' in filtered_df.columns:
-                equipos += sorted(filtered_df['equipo'].dropna().unique().tolist())
+            equipos = ['Todos'] + filter_index.options('equipo', selection)
             
             selected_equipo = st.selectbox("", options=equipos, key="similar_equipo", label_visibility="collapsed")
             
             # Aplicar filtro de equipo
-            if selected_equipo != 'Todos' and 'equipo' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['equipo'] == selected_equipo]
+            if selected_equipo != 'Todos':
+                selection['equipo'] = selected_equipo
             
             # Filtro por posición con mismo formato que los otros
             st.markdown("Posición:")
             posiciones = ['Seleccione Posición']
             if posicion_column:
-                pos_values = filtered_df[posicion_column].dropna().unique().tolist()
-                pos_values = [p for p in pos_values if p and p.strip() and p != '0' and p != '0.0' and p.lower() != 'nan']
-                if pos_values:
-                    posiciones += sorted(pos_values)
+                # Las posiciones vacías ya llegan como nulas desde la ingesta
+                posiciones += filter_index.options(posicion_column, selection)
                 selected_posicion = st.selectbox("", options=posiciones, key="similar_posicion", label_visibility="collapsed")
                 
                 # Filtrar por posición seleccionada
                 if selected_posicion != 'Seleccione Posición':
-                    filtered_df = filtered_df[filtered_df[posicion_column] == selected_posicion]
+                    selection[posicion_column] = selected_posicion
             else:
                 st.selectbox("", options=['Posición no disponible'], key="similar_posicion_na", label_visibility="collapsed")
             
-            # Lista de jugadores disponibles después de filtrar
+            # Jugadores disponibles después de filtrar (solo las coincidencias de la búsqueda)
             st.markdown("Seleccionar jugador base:")
-            players_list = []
-            if 'player_name' in filtered_df.columns:
-                players_list = filtered_df['player_name'].sort_values().unique().tolist()
+            query = st.text_input("", key="similar_buscar", placeholder="Buscar jugador, equipo o nacionalidad",
+                                  label_visibility="collapsed")
+            players_list = get_player_options(dataset, selection, query)
+            directory = get_player_directory(dataset)
             
-            # Selección del jugador base
+            # Selección del jugador base (posición de fila; se muestra su nombre)
             if players_list:
                 selected_player = st.selectbox(
                     "",
                     options=players_list,
                     key="similar_player",
-                    label_visibility="collapsed"
+                    label_visibility="collapsed",
+                    format_func=directory.label
                 )
             else:
                 st.warning("No hay jugadores disponibles con los filtros seleccionados.")
@@ -140,15 +232,89 @@ def show_similar_players(df, metrics):
         # Filtrar solo métricas numéricas y excluir columnas de identificación
         numeric_metrics = [m for m in metrics if m not in ['player_name', 'pais', 'liga', 'equipo']]
         
-        # Selección de métricas para la comparación
-        default_metrics = numeric_metrics[:5] if len(numeric_metrics) > 5 else numeric_metrics
+        # Conjuntos de métricas con nombre (sus vecinos están precalculados en la base de datos)
+        preset_labels = {preset.label: preset for preset in METRIC_PRESETS
+                         if len(preset.app_metrics(numeric_metrics)) == len(preset.metrics)}
+        selected_preset = st.selectbox(
+            "Conjunto de métricas:",
+            options=list(preset_labels) + ['Personalizado'],
+            key="similar_preset"
+        )
+        
+        # Selección de métricas para la comparación (la clave depende del conjunto para que
+        # al cambiarlo se carguen sus métricas)
+        if selected_preset in preset_labels:
+            default_metrics = preset_labels[selected_preset].app_metrics(numeric_metrics)
+        else:
+            default_metrics = numeric_metrics[:5] if len(numeric_metrics) > 5 else numeric_metrics
         selected_metrics = st.multiselect(
             "Seleccionar métricas para la comparación:",
             options=numeric_metrics,
             default=default_metrics,
-            key="similar_metrics"
+            key=f"similar_metrics_{selected_preset}"
+        )
+        df = dataset.frame(selected_metrics)
+        
+        # Medida de similitud y escalado de las métricas
+        distance_labels = {'Coseno': 'cosine', 'Euclídea': 'euclidean', 'Mahalanobis': 'mahalanobis'}
+        selected_distance = distance_labels[st.selectbox(
+            "Medida de similitud:",
+            options=list(distance_labels),
+            key="similar_distance"
+        )]
+        scaling_labels = {'Min-max': 'minmax', 'Z-score': 'zscore'}
+        selected_scaling = scaling_labels[st.selectbox(
+            "Escalado de las métricas:",
+            options=list(scaling_labels),
+            key="similar_scaling",
+            disabled=selected_distance == 'mahalanobis',
+            help="Mahalanobis siempre estandariza las métricas (z-score)"
+        )]
+        
+        # Normalización respecto a todos los jugadores o a los de la misma posición/liga
+        relative_labels = {'Global': None}
+        relative_labels.update({f"Relativa a la {name.lower()}": column
+                                for name, column in relative_group_columns(dataset).items()})
+        selected_relative = relative_labels[st.selectbox(
+            "Normalización de las métricas:",
+            options=list(relative_labels),
+            key="similar_relative"
+        )]
+        
+        # Radar con percentiles precalculados por posición y liga (escala estable)
+        percentiles = get_percentiles(dataset)
+        radar_percentiles = st.checkbox(
+            "Radar en percentiles (posición y liga)",
+            value=False,
+            key="similar_radar_percentiles"
         )
         
+        # Peso de cada métrica en la similitud
+        with st.expander("Pesos de las métricas", expanded=False):
+            metric_weights = tuple(
+                st.slider(metric, min_value=0.0, max_value=3.0, value=1.0, step=0.1, key=f"similar_weight_{metric}")
+                for metric in selected_metrics
+            )
+        
+        # Con muchos jugadores, equilibrio entre recall y latencia de la búsqueda aproximada
+        ann_probes = ANN_PROBES
+        if len(df) >= ANN_MIN_ROWS and selected_distance == 'cosine':
+            ann_probes = st.slider(
+                "Precisión de la búsqueda aproximada:",
+                min_value=0,
+                max_value=20,
+                value=ANN_PROBES,
+                key="similar_ann_probes",
+                help="Buckets vecinos que se consultan en el índice aproximado (más = más precisa y más lenta)"
+            )
+        
+        similarity_options = {
+            'weights': metric_weights if any(weight != 1.0 for weight in metric_weights) else None,
+            'scaling': selected_scaling,
+            'distance': selected_distance,
+            'relative_to': selected_relative
+        }
+        
         # Número de jugadores similares a mostrar
         num_similar = st.slider(
             "Número de jugadores similares:",
@@ -159,13 +325,9 @@ def show_similar_players(df, metrics):
         
         # Filtro por año de nacimiento
         st.subheader("Filtro por Año de Nacimiento")
-        birth_year_column = None
 
-        # Buscar la columna de año de nacimiento
-        for col in df.columns:
-            if 'año nacimiento' in col.lower() or 'nacimiento' in col.lower() or 'birth' in col.lower():
-                birth_year_column = col
-                break
+        # Columna de año de nacimiento según el registro de columnas
+        birth_year_column = find_column(df.columns, 'Año nacimiento')
 
         if birth_year_column:
             # Rango de años predefinido para scouting
@@ -238,28 +400,31 @@ def show_similar_players(df, metrics):
                         
                         # Si hay posición seleccionada, filtrar por la misma posición
                         if posicion_column and selected_posicion != 'Seleccione Posición':
-                            player_position = df[df['player_name'] == selected_player][posicion_column].values[0]
+                            player_position = df[posicion_column].to_numpy()[selected_player]
                             similar_filters[posicion_column] = player_position
                         
                         # Añadir filtro por año de nacimiento si existe
                         if 'birth_year_filter' in st.session_state and birth_year_column:
                             birth_min, birth_max = st.session_state.birth_year_filter
-                            similar_filters['birth_year_range'] = (birth_min, birth_max)
+                            similar_filters[BIRTH_YEAR_FILTER] = (birth_min, birth_max)
                         
-                        # Encontrar jugadores similares
-                        similar_players_df = find_similar_players(
-                            df, 
+                        # Encontrar jugadores similares (vecinos precalculados o cálculo en vivo)
+                        similar_players_df = search_similar_players(
+                            dataset, 
                             selected_player, 
                             selected_metrics, 
-                            top_n=num_similar,
-                            filters=similar_filters
+                            num_similar,
+                            similar_filters,
+                            similarity_options,
+                            ann_probes
                         )
                         
                         # Lista completa de jugadores para el radar
-                        players_to_compare = [selected_player] + similar_players_df['player_name'].tolist()[:3]
+                        players_to_compare = [selected_player] + similar_players_df['row'].tolist()[:3]
                         
                         # Configurar la figura con mayor calidad para PDF
-                        fig = create_radar_chart_unified(df, players_to_compare, selected_metrics)
+                        fig = get_radar_chart(dataset, tuple(directory.ids[players_to_compare].tolist()),
+                                              tuple(selected_metrics), selected_relative, radar_percentiles)
                         fig.update_layout(
                             width=1000,
                             height=800,
@@ -268,23 +433,23 @@ def show_similar_players(df, metrics):
                             title_x=0.5
                         )
                         
-                        # Guardar figura en memoria
-                        img_buffer = io.BytesIO()
-                        fig.write_image(img_buffer, format='png', scale=2)
-                        img_buffer.seek(0)
+                        # Generar la imagen en los procesos de renderizado mientras se preparan
+                        # los datos del PDF
+                        image = get_render_service().submit(fig, format='png', scale=2)
                         
                         # Crear datos para el PDF
                         player_data = {
-                            "Jugador Base": selected_player,
+                            "Jugador Base": directory.label(selected_player),
                             "Métricas utilizadas": ", ".join(selected_metrics)
                         }
                         
                         # Añadir jugadores similares y su puntuación
                         for i, row in similar_players_df.iterrows():
                             if i < num_similar:
-                                player_data[f"#{i+1} - {row['player_name']}"] = f"Similitud: {row['similarity_score']:.2f}"
+                                player_data[f"#{i+1} - {directory.label(row['row'])}"] = f"Similitud: {row['similarity_score']:.2f}"
                         
-                        # Generar PDF
+                        # Esperar a la imagen del gráfico y generar el PDF
+                        img_buffer = io.BytesIO(image.result(RENDER_TIMEOUT))
                         pdf_bytes = export_to_pdf(
                             player_data, 
                             img_buffer,
@@ -309,31 +474,33 @@ def show_similar_players(df, metrics):
                     st.info("Para resolver este error, ejecuta: pip install -U kaleido")
     
     with col2:
-        if selected_player and selected_metrics and len(selected_metrics) > 0:
+        if selected_player is not None and selected_metrics and len(selected_metrics) > 0:
             # Definir filtros para asegurar misma posición
             similar_filters = {}
             
             # Si hay posición seleccionada, filtrar por la misma posición
             if posicion_column and selected_posicion != 'Seleccione Posición':
-                player_position = df[df['player_name'] == selected_player][posicion_column].values[0]
+                player_position = df[posicion_column].to_numpy()[selected_player]
                 similar_filters[posicion_column] = player_position
             
             # Añadir filtro por año de nacimiento si existe
             if 'birth_year_filter' in st.session_state and birth_year_column:
                 birth_min, birth_max = st.session_state.birth_year_filter
-                similar_filters['birth_year_range'] = (birth_min, birth_max)
+                similar_filters[BIRTH_YEAR_FILTER] = (birth_min, birth_max)
             
-            # Encontrar jugadores similares
-            similar_players_df = find_similar_players(
-                df, 
+            # Encontrar jugadores similares (vecinos precalculados o cálculo en vivo)
+            similar_players_df = search_similar_players(
+                dataset, 
                 selected_player, 
                 selected_metrics, 
-                top_n=num_similar,
-                filters=similar_filters
+                num_similar,
+                similar_filters,
+                similarity_options,
+                ann_probes
             )
             
             # Mostrar tabla de jugadores similares
-            st.subheader(f"Jugadores más similares a {selected_player}")
+            st.subheader(f"Jugadores más similares a {directory.label(selected_player)}")
             
             if similar_players_df.empty:
                 st.warning("No se encontraron jugadores similares que cumplan con los filtros.")
@@ -341,17 +508,12 @@ def show_similar_players(df, metrics):
                 # Formatear y mostrar tabla de similitud
                 similarity_display = similar_players_df.copy()
                 
-                # Añadir información de equipo y liga si están disponibles
+                # Añadir información de equipo y liga si están disponibles (por posición de fila)
                 if 'equipo' in df.columns:
-                    jugador_info = {}
-                    for player in similarity_display['player_name']:
-                        player_data = df[df['player_name'] == player]
-                        equipo = player_data['equipo'].values[0] if 'equipo' in player_data.columns else 'N/A'
-                        liga = player_data['liga'].values[0] if 'liga' in player_data.columns else 'N/A'
-                        jugador_info[player] = {'equipo': equipo, 'liga': liga}
-                    
-                    similarity_display['equipo'] = similarity_display['player_name'].map(lambda x: jugador_info[x]['equipo'])
-                    similarity_display['liga'] = similarity_display['player_name'].map(lambda x: jugador_info[x]['liga'])
+                    similar_rows = similarity_display['row'].to_numpy()
+                    similarity_display['equipo'] = df['equipo'].to_numpy()[similar_rows]
+                    similarity_display['liga'] = (df['liga'].to_numpy()[similar_rows] if 'liga' in df.columns
+                                                  else 'N/A')
                 
                 # Formatear puntuación de similitud
                 similarity_display['similarity_score'] = similarity_display['similarity_score'].apply(lambda x: f"{x:.2f}")
@@ -362,7 +524,7 @@ def show_similar_players(df, metrics):
                     display_cols.extend(['equipo', 'liga'])
                 
                 # Aplicar filtro de columnas explícitamente
-                similarity_display = similarity_display[display_cols].copy()
+                similarity_display = similarity_display[display_cols]
                 
                 # Renombrar columnas
                 display_names = ['Jugador', 'Puntuación de Similitud']
@@ -379,22 +541,20 @@ def show_similar_players(df, metrics):
                 )
                 
                 # Lista de jugadores para el radar (jugador base + top 3 similares)
-                players_to_compare = [selected_player] + similar_players_df['player_name'].tolist()[:3]
+                players_to_compare = [selected_player] + similar_players_df['row'].tolist()[:3]
                 
                 # Crear y mostrar el gráfico radar con estilo unificado
                 st.subheader("Comparación visual")
-                fig = create_radar_chart_unified(df, players_to_compare, selected_metrics)
+                fig = get_radar_chart(dataset, tuple(directory.ids[players_to_compare].tolist()),
+                                      tuple(selected_metrics), selected_relative, radar_percentiles)
                 st.plotly_chart(fig, use_container_width=True)
                 
                 # Mostrar tabla con datos detallados
                 st.subheader("Datos detallados")
                 
-                # Filtrar dataframe para jugadores seleccionados
-                comparison_df = df[df['player_name'].isin(players_to_compare)].copy()
-                display_cols = ['player_name'] + selected_metrics
-                
-                # Formatear tabla
-                formatted_df = comparison_df[display_cols].set_index('player_name')
+                # Formatear tabla (una fila por jugador, con su texto como índice)
+                formatted_df = df[selected_metrics].iloc[players_to_compare]
+                formatted_df.index = pd.Index(directory.labels(players_to_compare), name='player_name')
                 
                 # Mostrar tabla con colores para máximos y mínimos (verde oscuro y rojo oscuro)
                 st.dataframe(
@@ -402,6 +562,13 @@ def show_similar_players(df, metrics):
                     use_container_width=True
                 )
                 
+                # Percentiles precalculados de cada jugador en su posición y liga
+                st.markdown("Percentiles por posición y liga")
+                st.dataframe(
+                    percentile_frame(df, percentiles, players_to_compare, selected_metrics).style.format("{:.0f}", na_rep="–"),
+                    use_container_width=True
+                )
+                
                 # Mostrar gráfico de barras para comparar métricas específicas
                 st.subheader("Comparación de métricas clave")
                 
@@ -412,12 +579,11 @@ def show_similar_players(df, metrics):
                     # Preparar datos para el gráfico
                     bar_data = []
                     for player in players_to_compare:
-                        player_row = df[df['player_name'] == player].iloc[0]
                         for metric in metrics_for_bars:
                             bar_data.append({
-                                'Jugador': player,
+                                'Jugador': directory.label(player),
                                 'Métrica': metric,
-                                'Valor': player_row[metric]
+                                'Valor': df[metric].to_numpy()[player]
                             })
                     
                     bar_df = pd.DataFrame(bar_data)
@@ -445,6 +611,15 @@ def show_similar_players(df, metrics):
                     )
                     
                     st.plotly_chart(fig, use_container_width=True)
+            
+            # Reemplazos para toda la plantilla del equipo seleccionado
+            if selected_equipo != 'Todos':
+                with st.expander(f"Reemplazos de la plantilla de {selected_equipo}", expanded=False):
+                    replacement_filters = {}
+                    if BIRTH_YEAR_FILTER in similar_filters:
+                        replacement_filters[BIRTH_YEAR_FILTER] = similar_filters[BIRTH_YEAR_FILTER]
+                    show_squad_replacements(dataset, selected_equipo, selected_metrics, num_similar, replacement_filters,
+                                            similarity_options)
         else:
             st.info("Selecciona un jugador base y métricas para encontrar jugadores similares.")
             
@@ -475,11 +650,12 @@ def show_similar_players(df, metrics):
                 with col2:
                     st.subheader("Datos desde SQLite")
                     st.info("Información complementaria desde base de datos SQLite")
-                    # Realizamos una consulta a SQLite para mostrar datos adicionales
-                    from common.cache import query_database
+                    # Jugadores que cumplen los filtros seleccionados, leídos de SQLite
+                    # (consulta parametrizada y cacheada)
+                    from common.cache import query_players
                     try:
-                        query = "SELECT player_name, equipo, liga FROM players_data LIMIT 3"
-                        sqlite_data = query_database(query)
+                        sqlite_data = query_players(selection, columns=['Jugador', 'Equipo', 'Liga', 'Posición'],
+                                                    limit=3, version=dataset.version)
                         if sqlite_data is not None and not sqlite_data.empty:
                             st.dataframe(sqlite_data)
                         else: